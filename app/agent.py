@@ -3,27 +3,35 @@ from langgraph.prebuilt import create_react_agent
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import StructuredTool
 import os
+import threading
+import logging
+import httpx
+from contextlib import AsyncExitStack
 from dotenv import load_dotenv
+from langchain_core.messages import trim_messages, HumanMessage, SystemMessage
 
 # Import input models
 from app.models import (
     SearchInput, 
+    MultiSectionSearchInput,
     TrainScheduleSearchInput, 
     FlightScheduleSearchInput, 
     HotelSearchInput, 
     VillaSearchInput,
+    TourSearchInput,
     FAQSearchInput
 )
 
 # Import tools from different modules
+# Each Playwright tool has an async coroutine (used by agent.ainvoke) and a sync adapter (used by agent.invoke)
 from app.playwright import (
-    search_alibaba_flight_schedules, 
-    search_alibaba_train_schedules,
-    search_alibaba_hotel_info, 
-    search_alibaba_villa_info,
-    search_alibaba_faqs_interactive,
-    search_alibaba_tour_info,
-    search_alibaba_bus_schedules
+    search_alibaba_flight_schedules, search_flight_schedules_simple,
+    search_alibaba_train_schedules, search_train_schedules_simple,
+    search_alibaba_hotel_info, search_hotel_info_simple,
+    search_alibaba_villa_info, search_villa_info_simple,
+    search_alibaba_faqs_interactive, search_faq_simple,
+    search_alibaba_tour_info, search_tour_info_simple,
+    search_alibaba_bus_schedules, search_bus_schedules_simple
 )
 # Import remaining Tavily tools
 from app.tavily import (
@@ -39,9 +47,18 @@ from app.tavily import (
     search_alibaba_hotels_func,            # Added: For hotel info (Tavily)
     search_alibaba_accommodations_func,    # Added: For accommodation info (Tavily)
     search_alibaba_visa_func, 
-    search_alibaba_insurance_func
+    search_alibaba_insurance_func,
+    search_alibaba_sections, search_alibaba_sections_async,
+    # Async versions (cancellable under the tool deadline)
+    search_alibaba_general_async, search_alibaba_faqs_async, search_alibaba_magazine_async,
+    search_alibaba_profile_async, search_alibaba_flights_iran_async, search_alibaba_flights_international_async,
+    search_alibaba_trains_async, search_alibaba_buses_async, search_alibaba_tours_async,
+    search_alibaba_hotels_async, search_alibaba_accommodations_async, search_alibaba_visa_async,
+    search_alibaba_insurance_async
 )
 
+from app.tool_execution import guard_tool
+
 # Load environment variables
 load_dotenv(".env")
 
@@ -49,31 +66,49 @@ load_dotenv(".env")
 openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
 openrouter_base_url = os.getenv("OPENROUTER_API_BASE")
 
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- Shared HTTP clients for OpenRouter ---
+# همه‌ی ایجنت‌ها از یه connection pool مشترک استفاده می‌کنن
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100"))
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "120"))
+
+_http_limits = httpx.Limits(max_connections=OPENROUTER_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS)
+http_client = httpx.Client(limits=_http_limits, timeout=OPENROUTER_TIMEOUT)
+http_async_client = httpx.AsyncClient(limits=_http_limits, timeout=OPENROUTER_TIMEOUT)
+
 # --- Define the list of tools available to the agent ---
-tools = [
+_base_tools = [
     # --- Tavily Search Tools (General & Specific Sections) ---
     StructuredTool.from_function(
         name="search_alibaba_general",
         description="جستجوی عمومی در کل سایت علی‌بابا برای اطلاعات کلی.",
         func=search_alibaba_general_func,
+        coroutine=search_alibaba_general_async,
         args_schema=SearchInput
     ),
    StructuredTool.from_function(
         name="search_alibaba_faqs",
         description="جستجو برای پیدا کردن پاسخ سوالات متداول در علی‌بابا. وقتی سوالی درباره قوانین، راهنما، استرداد یا هر چیز دیگه‌ای که ممکنه تو FAQ باشه می‌پرسن، از این ابزار استفاده کن.",
         func=search_alibaba_faqs,
-        args_schema=FAQSearchInput
+        coroutine=search_alibaba_faqs_async,
+        args_schema=SearchInput # search_alibaba_faqs takes 'query', not 'question'
     ),
     StructuredTool.from_function(
         name="search_alibaba_magazine",
         description="جستجو در مجله علی‌بابا برای مقالات و راهنماها.",
         func=search_alibaba_magazine_func,
+        coroutine=search_alibaba_magazine_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_profile",
         description="جستجو در بخش پروفایل کاربری علی‌بابا.",
         func=search_alibaba_profile_func,
+        coroutine=search_alibaba_profile_async,
         args_schema=SearchInput
     ),
     # --- Tavily Tools for Specific Services (as fallback or for general info) ---
@@ -81,118 +116,130 @@ tools = [
         name="search_alibaba_flights_domestic",
         description="جستجوی اطلاعات کلی درباره پروازهای داخلی علی‌بابا (با Tavily).",
         func=search_alibaba_flights_iran_func,
+        coroutine=search_alibaba_flights_iran_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_flights_international",
         description="جستجوی اطلاعات کلی درباره پروازهای خارجی علی‌بابا (با Tavily).",
         func=search_alibaba_flights_international_func,
+        coroutine=search_alibaba_flights_international_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_trains",
         description="جستجوی اطلاعات کلی درباره بلیط قطار علی‌بابا (با Tavily).",
         func=search_alibaba_trains_func,
+        coroutine=search_alibaba_trains_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_buses",
         description="جستجوی اطلاعات کلی درباره بلیط اتوبوس علی‌بابا (با Tavily).",
         func=search_alibaba_buses_func,
+        coroutine=search_alibaba_buses_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_tours",
         description="جستجوی اطلاعات کلی درباره تورهای علی‌بابا (با Tavily).",
         func=search_alibaba_tours_func,
+        coroutine=search_alibaba_tours_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_hotels_general",
         description="جستجوی اطلاعات کلی درباره هتل‌های علی‌بابا (با Tavily).",
         func=search_alibaba_hotels_func,
+        coroutine=search_alibaba_hotels_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_accommodations_general",
         description="جستجوی اطلاعات کلی درباره ویلا و اقامتگاه‌های علی‌بابا (با Tavily).",
         func=search_alibaba_accommodations_func,
+        coroutine=search_alibaba_accommodations_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_visa",
         description="جستجوی اطلاعات کلی درباره ویزای علی‌بابا.",
         func=search_alibaba_visa_func,
+        coroutine=search_alibaba_visa_async,
         args_schema=SearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_insurance",
         description="جستجوی اطلاعات کلی درباره بیمه مسافرتی علی‌بابا.",
         func=search_alibaba_insurance_func,
+        coroutine=search_alibaba_insurance_async,
         args_schema=SearchInput
     ),
+    StructuredTool.from_function(
+        name="search_alibaba_sections",
+        description="جستجوی همزمان یک موضوع در چند بخش علی‌بابا (مثلاً پرواز + ویزا + بیمه برای یک سفر). به جای چند بار صدا زدن ابزارهای تکی از این استفاده کن.",
+        func=search_alibaba_sections,
+        coroutine=search_alibaba_sections_async,
+        args_schema=MultiSectionSearchInput
+    ),
 
     # --- Playwright Interactive Scraping Tools ---
     StructuredTool.from_function(
         name="search_alibaba_flight_schedules",
-        description="جستجوی دقیق و تعاملی بلیط هواپیمای داخلی بین دو شهر در تاریخ مشخص در علی‌بابا.",
-        func=search_alibaba_flight_schedules,
+        description="جستجوی دقیق و تعاملی بلیط هواپیمای داخلی بین دو شهر در تاریخ مشخص در علی‌بابا. برای مقایسه به جای جستجوی دوباره از sort_by، max_price، depart_after/depart_before، min_seats و top_k استفاده کن.",
+        func=search_flight_schedules_simple,
+        coroutine=search_alibaba_flight_schedules,
         args_schema=FlightScheduleSearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_train_schedules",
-        description="جستجوی دقیق و تعاملی زمانبندی و قیمت قطارها بین دو شهر در تاریخ مشخص در علی‌بابا.",
-        func=search_alibaba_train_schedules,
+        description="جستجوی دقیق و تعاملی زمانبندی و قیمت قطارها بین دو شهر در تاریخ مشخص در علی‌بابا. برای مقایسه به جای جستجوی دوباره از sort_by، max_price، depart_after/depart_before، min_seats و top_k استفاده کن.",
+        func=search_train_schedules_simple,
+        coroutine=search_alibaba_train_schedules,
         args_schema=TrainScheduleSearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_bus_schedules",
-        description="جستجوی دقیق و تعاملی زمانبندی و قیمت اتوبوس‌ها بین دو شهر در تاریخ مشخص در علی‌بابا.",
-        func=search_alibaba_bus_schedules,
+        description="جستجوی دقیق و تعاملی زمانبندی و قیمت اتوبوس‌ها بین دو شهر در تاریخ مشخص در علی‌بابا. برای مقایسه به جای جستجوی دوباره از sort_by، max_price، depart_after/depart_before، min_seats و top_k استفاده کن.",
+        func=search_bus_schedules_simple,
+        coroutine=search_alibaba_bus_schedules,
         args_schema=TrainScheduleSearchInput # Reusing input schema for simplicity, could create a specific one
     ),
     StructuredTool.from_function(
         name="search_alibaba_tour_info",
         description="جستجوی تعاملی اطلاعات تورها در علی‌بابا با مبدا، مقصد و بازه زمانی.",
-        func=search_alibaba_tour_info,
-        args_schema=HotelSearchInput # Reusing input schema, adjust if a specific tour schema is created
+        func=search_tour_info_simple,
+        coroutine=search_alibaba_tour_info,
+        args_schema=TourSearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_hotel_info",
         description="جستجوی تعاملی اطلاعات هتل در یک شهر و بازه زمانی مشخص در علی‌بابا.",
-        func=search_alibaba_hotel_info,
+        func=search_hotel_info_simple,
+        coroutine=search_alibaba_hotel_info,
         args_schema=HotelSearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_villa_info",
         description="جستجوی تعاملی اطلاعات ویلا/اقامتگاه در یک شهر و بازه زمانی مشخص در علی‌بابا.",
-        func=search_alibaba_villa_info,
+        func=search_villa_info_simple,
+        coroutine=search_alibaba_villa_info,
         args_schema=VillaSearchInput
     ),
     StructuredTool.from_function(
         name="search_alibaba_faqs_interactive",
         description="جستجوی تعاملی و دقیق در بخش پرسش‌های متداول علی‌بابا.",
-        func=search_alibaba_faqs_interactive,
+        func=search_faq_simple,
+        coroutine=search_alibaba_faqs_interactive,
         args_schema=FAQSearchInput
     )
 ]
 
-def get_agent(model_name: str):
-    """ساخت و بازگشت یک ایجنت پیکربندی شده.
-    Create and return a configured agent.
-    """
-    llm = ChatOpenAI(
-        model_name=model_name,
-        openai_api_key=openrouter_api_key,
-        openai_api_base=openrouter_base_url,
-        temperature=0.7,
-        max_tokens=4096,
-        top_p=0.9,
-        frequency_penalty=0.1,
-        presence_penalty=0.1
-    )
-    # Configure the system message for the agent
-    llm = llm.with_config(system_message="""
+# Every tool runs as a coroutine with its own deadline and circuit breaker (app/tool_execution.py);
+# ToolNode executes the tool calls of one step concurrently.
+tools = [guard_tool(tool) for tool in _base_tools]
+
+SYSTEM_PROMPT = """
 You are a smart and friendly assistant named SupportBot.
 You help users find information specifically about services and policies on alibaba.ir.
 You have access to various tools to provide the most accurate and up-to-date information. Your priority is to use playwright tools.
@@ -212,6 +259,7 @@ Available tools:
 - search_alibaba_accommodations_general: جستجوی اطلاعات کلی ویلا و اقامتگاه‌ها (Tavily).
 - search_alibaba_visa: جستجوی اطلاعات کلی ویزا.
 - search_alibaba_insurance: جستجوی اطلاعات کلی بیمه مسافرتی.
+- search_alibaba_sections: جستجوی همزمان در چند بخش (مثلاً flights_international + visa + insurance).
 - search_alibaba_flight_schedules: جستجوی دقیق بلیط هواپیمای داخلی (Playwright).
 - search_alibaba_train_schedules: جستجوی دقیق زمانبندی و قیمت قطارها (Playwright).
 - search_alibaba_bus_schedules: جستجوی دقیق زمانبندی و قیمت اتوبوس‌ها (Playwright).
@@ -219,5 +267,161 @@ Available tools:
 - search_alibaba_hotel_info: جستجوی تعاملی اطلاعات هتل (Playwright).
 - search_alibaba_villa_info: جستجوی تعاملی اطلاعات ویلا/اقامتگاه (Playwright).
 - search_alibaba_faqs_interactive: جستجوی تعاملی و دقیق در بخش پرسش‌های متداول (Playwright).
-""")
-    return create_react_agent(llm, tools=tools)
+"""
+
+# --- Agent registry ---
+# گراف هر مدل فقط یه بار ساخته می‌شه و بین همه‌ی session ها مشترکه؛
+# session ها فقط session_id (شناسه‌ی گفتگو) و اسم مدل رو نگه می‌دارن.
+_agents = {}
+_agents_lock = threading.RLock()
+
+
+_llms = {}
+
+# --- Conversation checkpointer ---
+# none: هر نوبت تاریخچه از MongoDB خونده و کامل فرستاده می‌شه (رفتار قبلی)
+# memory / sqlite / mongo: state گراف (شامل tool call ها و نتیجه‌هاشون) با thread_id=session_id ذخیره می‌شه
+# و هر نوبت فقط پیام جدید کاربر فرستاده می‌شه. sqlite برای تست و اجرای محلیه.
+AGENT_CHECKPOINTER = os.getenv("AGENT_CHECKPOINTER", "none").lower()
+AGENT_CHECKPOINT_SQLITE_PATH = os.getenv("AGENT_CHECKPOINT_SQLITE_PATH", "checkpoints.sqlite")
+AGENT_CHECKPOINT_DB_NAME = os.getenv("AGENT_CHECKPOINT_DB_NAME", os.getenv("MONGO_DB_NAME", "support_agent"))
+# تعداد پیام‌های آخر state (با tool message ها) که به LLM داده می‌شه
+CHECKPOINT_WINDOW_MESSAGES = int(os.getenv("CHECKPOINT_WINDOW_MESSAGES", "40"))
+
+_checkpointer = None
+_checkpointer_stack = None
+
+
+async def aopen_checkpointer():
+    """
+    باز کردن checkpointer تنظیم شده (موقع شروع برنامه).
+    Open the configured checkpointer on startup; graphs compiled afterwards use it.
+    """
+    global _checkpointer, _checkpointer_stack
+    if AGENT_CHECKPOINTER == "none" or _checkpointer is not None:
+        return
+    stack = AsyncExitStack()
+    if AGENT_CHECKPOINTER == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+        saver = MemorySaver()
+    elif AGENT_CHECKPOINTER == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        saver = await stack.enter_async_context(AsyncSqliteSaver.from_conn_string(AGENT_CHECKPOINT_SQLITE_PATH))
+    elif AGENT_CHECKPOINTER == "mongo":
+        from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+        saver = await stack.enter_async_context(
+            AsyncMongoDBSaver.from_conn_string(os.getenv("MONGO_URI"), db_name=AGENT_CHECKPOINT_DB_NAME)
+        )
+    else:
+        raise ValueError(f"Unknown AGENT_CHECKPOINTER '{AGENT_CHECKPOINTER}', expected none, memory, sqlite or mongo.")
+    with _agents_lock:
+        _checkpointer, _checkpointer_stack = saver, stack
+        # گراف‌هایی که قبلاً بدون checkpointer ساخته شدن دوباره ساخته می‌شن
+        _agents.clear()
+    logger.info(f"💾 Agent checkpointer '{AGENT_CHECKPOINTER}' is ready.")
+
+
+async def aclose_checkpointer():
+    """بستن اتصال checkpointer موقع خاموش شدن برنامه."""
+    global _checkpointer, _checkpointer_stack
+    if _checkpointer_stack is not None:
+        await _checkpointer_stack.aclose()
+    _checkpointer, _checkpointer_stack = None, None
+
+
+def uses_checkpointer() -> bool:
+    """آیا state گفتگو تو checkpointer نگه داشته می‌شه؟"""
+    return _checkpointer is not None
+
+
+def thread_config(session_id: str) -> dict:
+    """config اجرای گراف برای یه session (thread_id = session_id)."""
+    return {"configurable": {"thread_id": session_id}}
+
+
+def _window_hook(state: dict) -> dict:
+    # فقط آخرین پیام‌های state به LLM می‌رسه؛ شروع از پیام کاربر تا tool message یتیم نمونه
+    messages = state["messages"]
+    window = trim_messages(messages, strategy="last", token_counter=len,
+                           max_tokens=CHECKPOINT_WINDOW_MESSAGES, start_on="human", include_system=True)
+    if not any(isinstance(message, HumanMessage) for message in window):
+        # نوبت آخر (با tool message هاش) از پنجره بلندتره: همون نوبت کامل فرستاده می‌شه، نه پنجره‌ی خالی
+        humans = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        start = humans[-1] if humans else 0
+        window = [message for message in messages[:1] if isinstance(message, SystemMessage)] + messages[start:]
+    return {"llm_input_messages": window}
+
+
+def get_llm(model_name: str):
+    """ChatOpenAI مشترک یک مدل (روی connection pool مشترک OpenRouter).
+    Return the shared ChatOpenAI client for a model, on the pooled OpenRouter connections.
+    """
+    llm = _llms.get(model_name)
+    if llm is None:
+        with _agents_lock:
+            llm = _llms.get(model_name)
+            if llm is None:
+                llm = _llms[model_name] = ChatOpenAI(
+                    model_name=model_name,
+                    openai_api_key=openrouter_api_key,
+                    openai_api_base=openrouter_base_url,
+                    temperature=0.7,
+                    max_tokens=4096,
+                    top_p=0.9,
+                    frequency_penalty=0.1,
+                    presence_penalty=0.1,
+                    http_client=http_client,
+                    http_async_client=http_async_client
+                )
+    return llm
+
+
+def _system_prompt(tool_names=None) -> str:
+    """پرامپت سیستم با فهرست فقط ابزارهای این زیرمجموعه."""
+    if tool_names is None:
+        return SYSTEM_PROMPT
+    lines = [
+        line for line in SYSTEM_PROMPT.splitlines()
+        if not line.startswith("- ") or line[2:].split(":", 1)[0] in tool_names
+    ]
+    return "\n".join(lines)
+
+
+def _build_agent(model_name: str, tool_names=None):
+    """ساخت گراف ReAct برای یک مدل و یک زیرمجموعه از ابزارها (None یعنی همه).
+    Build the compiled ReAct graph for one model and tool subset (None means all tools).
+    """
+    # ابزارهای زیرمجموعه جدا wrap می‌شن تا فقط ابزار جایگزینی رو پیشنهاد بدن که تو همین زیرمجموعه هست
+    # (circuit breaker ها بر اساس اسم ابزار مشترکن)
+    agent_tools = tools if tool_names is None else [guard_tool(tool, tool_names) for tool in _base_tools if tool.name in tool_names]
+    llm = get_llm(model_name)
+    # پرامپت سیستم با prompt جلوی پیام‌ها (یا llm_input_messages پنجره) گذاشته می‌شه؛
+    # with_config(system_message=...) هیچ‌وقت به مدل نمی‌رسید
+    prompt = _system_prompt(tool_names)
+    logger.info(f"🤖 Compiled agent graph for model '{model_name}' with {len(agent_tools)} tools (checkpointer: {AGENT_CHECKPOINTER}).")
+    if _checkpointer is None:
+        return create_react_agent(llm, tools=agent_tools, prompt=prompt)
+    return create_react_agent(llm, tools=agent_tools, prompt=prompt, checkpointer=_checkpointer, pre_model_hook=_window_hook)
+
+
+def get_agent(model_name: str, tool_names: tuple = None):
+    """بازگشت ایجنت کامپایل شده‌ی یک مدل و زیرمجموعه‌ی ابزار (اولین بار ساخته می‌شه).
+    Return the compiled agent for a model and tool subset, building it on first use.
+
+    tool_names is a sorted tuple from app/tool_router.route; the number of
+    subsets is bounded by the router's domain combinations.
+    """
+    key = (model_name, tool_names)
+    agent = _agents.get(key)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(key)
+            if agent is None:
+                agent = _agents[key] = _build_agent(model_name, tool_names)
+    return agent
+
+
+async def aclose_http_clients():
+    """بستن connection pool های OpenRouter موقع خاموش شدن برنامه."""
+    http_client.close()
+    await http_async_client.aclose()
@@ -0,0 +1,320 @@
+# app/api_capture.py
+"""
+استفاده از API های JSON خود سایت به جای خوندن DOM: شنود پاسخ‌ها تو Playwright و بعد فراخوانی مستقیم با httpx.
+Use the site's own JSON search APIs instead of the rendered DOM: capture them in Playwright, then call them directly over httpx.
+
+Modes (SCRAPER_API_MODE):
+    off      only the DOM is read
+    capture  search-API responses seen by the page are parsed into ScheduleRecords;
+             the DOM is read only when nothing usable was captured
+    direct   capture, plus: once a request template is known the API is called
+             with the pooled HTTP client and no browser; Playwright is the fallback
+
+A template is learned from the first captured request of each kind by
+replacing the route values (city codes, Jalali / Gregorian date) in its URL
+and body with placeholders, or set explicitly with SCRAPER_API_TEMPLATE_<KIND>
+as JSON: {"method": "GET", "url": "https://.../{origin_code}-{destination_code}?date={date_gregorian}"}.
+Placeholders: {origin_code}, {destination_code}, {date} (Jalali YYYY-MM-DD), {date_gregorian} (YYYY-MM-DD).
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+from app.models import ScheduleRecord
+from app.schedules import clock_time, SCHEDULE_MAX_RECORDS
+from app.url_builder import city_code, normalize_jalali_date, jalali_to_gregorian, normalize_text
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+SCRAPER_API_MODE = os.getenv("SCRAPER_API_MODE", "capture").lower()
+# واحد قیمت در پاسخ API ها (سایت قیمت‌ها رو به ریال برمی‌گردونه)
+SCRAPER_API_PRICE_UNIT = os.getenv("SCRAPER_API_PRICE_UNIT", "rial").lower()
+SCRAPER_API_TIMEOUT = float(os.getenv("SCRAPER_API_TIMEOUT", "10"))
+SCRAPER_API_MAX_CONNECTIONS = int(os.getenv("SCRAPER_API_MAX_CONNECTIONS", "20"))
+# حداکثر زمان انتظار برای خوندن بدنه‌ی پاسخ‌های شنود شده (ثانیه)
+SCRAPER_API_CAPTURE_WAIT = float(os.getenv("SCRAPER_API_CAPTURE_WAIT", "3"))
+
+# آدرس API جستجوی هر نوع؛ با SCRAPER_API_PATTERN_<KIND> قابل تغییره
+DEFAULT_API_PATTERNS = {
+    "flight": r"/api/v\d+/flights?/domestic/available",
+    "train": r"/api/v\d+/trains?/available",
+    "bus": r"/api/v\d+/bus(es)?/available",
+}
+API_PATTERNS = {
+    kind: re.compile(os.getenv(f"SCRAPER_API_PATTERN_{kind.upper()}", pattern))
+    for kind, pattern in DEFAULT_API_PATTERNS.items()
+}
+
+# اسم‌های احتمالی هر فیلد تو JSON (بدون حساسیت به حروف بزرگ و کوچک)
+FIELD_KEYS = {
+    "carrier": ["airlineName", "airline", "companyName", "company", "trainName", "carrierName", "carrier",
+                "busCompany", "operatorName", "operator"],
+    "departure": ["leaveDateTime", "departureDateTime", "departureTime", "departure", "moveDateTime", "moveTime",
+                  "leaveTime"],
+    "arrival": ["arrivalDateTime", "arrivalTime", "arrival", "arriveTime"],
+    "price": ["priceAdult", "adultPrice", "price", "fullPrice", "finalPrice", "amount", "cost"],
+    "seats": ["seat", "seats", "availableSeats", "seatsLeft", "remainingSeats", "capacity", "counter"],
+    "duration": ["duration", "flightDuration", "travelTime", "tripDuration"],
+}
+_LOWER_KEYS = {field: [key.lower() for key in keys] for field, keys in FIELD_KEYS.items()}
+# فقط همین هدرها تو template نگه داشته می‌شن (کوکی و توکن هیچ‌وقت)
+TEMPLATE_HEADERS = ("accept", "content-type", "accept-language")
+
+api_stats = {"captured": 0, "capture_hits": 0, "learned": 0, "direct_hits": 0, "direct_misses": 0, "direct_errors": 0}
+_templates = {}  # kind -> {"method", "url", "body", "headers"}
+_client = None
+
+
+# --- JSON payload -> ScheduleRecord ---
+
+def _find(item, keys: list, depth: int = 0):
+    """اولین مقدار ساده برای یکی از کلیدها، تا سه سطح داخل dict های تو در تو."""
+    if not isinstance(item, dict) or depth > 3:
+        return None
+    lowered = {str(key).lower(): value for key, value in item.items()}
+    for key in keys:
+        value = lowered.get(key)
+        if value is not None and not isinstance(value, (dict, list)):
+            return value
+    for key in keys:
+        value = lowered.get(key)
+        if isinstance(value, dict):
+            found = _find(value, keys, depth + 1)
+            if found is not None:
+                return found
+    for value in item.values():
+        if isinstance(value, dict):
+            found = _find(value, keys, depth + 1)
+            if found is not None:
+                return found
+    return None
+
+
+def _candidate_lists(payload, depth: int = 0):
+    """همه‌ی لیست‌های dict داخل payload که حداقل یه عضوشون قیمت داره."""
+    if depth > 6:
+        return
+    if isinstance(payload, list):
+        if payload and all(isinstance(item, dict) for item in payload) \
+                and any(_find(item, _LOWER_KEYS["price"]) is not None for item in payload[:5]):
+            yield payload
+        for item in payload[:50]:
+            yield from _candidate_lists(item, depth + 1)
+    elif isinstance(payload, dict):
+        for value in payload.values():
+            yield from _candidate_lists(value, depth + 1)
+
+
+def _int(value):
+    try:
+        return int(float(str(value).replace(",", "")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _duration_minutes(value):
+    if value is None:
+        return None
+    if isinstance(value, str) and ":" in value:
+        hours, _, minutes = value.partition(":")
+        return (_int(hours) or 0) * 60 + (_int(minutes[:2]) or 0)
+    return _int(value)
+
+
+def records_from_payload(payload, price_unit: str = SCRAPER_API_PRICE_UNIT) -> list:
+    """
+    تبدیل پاسخ JSON API جستجو به ScheduleRecord ها (بزرگ‌ترین لیست دارای قیمت).
+    Map a search-API JSON payload to ScheduleRecords, using its largest priced list.
+    """
+    items = max(_candidate_lists(payload), key=len, default=[])
+    records = []
+    for item in items[:SCHEDULE_MAX_RECORDS]:
+        departure = clock_time(str(_find(item, _LOWER_KEYS["departure"]) or ""))
+        arrival = clock_time(str(_find(item, _LOWER_KEYS["arrival"]) or ""))
+        price = _int(_find(item, _LOWER_KEYS["price"]))
+        if price is not None and price_unit == "rial":
+            price //= 10
+        duration = _duration_minutes(_find(item, _LOWER_KEYS["duration"]))
+        if duration is None and departure and arrival:
+            duration = (int(arrival[:2]) * 60 + int(arrival[3:]) - int(departure[:2]) * 60 - int(departure[3:])) % (24 * 60)
+        records.append(ScheduleRecord(
+            carrier=normalize_text(str(_find(item, _LOWER_KEYS["carrier"]) or "")),
+            departure=departure,
+            arrival=arrival,
+            price_toman=price,
+            seats_left=_int(_find(item, _LOWER_KEYS["seats"])),
+            duration_minutes=duration,
+        ))
+    return records
+
+
+# --- Request templates ---
+
+def route_values(origin: str, destination: str, date: str):
+    """مقادیر placeholder ها برای یه مسیر، یا None اگه شهر یا تاریخ ناشناخته باشه."""
+    src, dst, jalali = city_code(origin), city_code(destination), normalize_jalali_date(date)
+    if not (src and dst and jalali):
+        return None
+    gy, gm, gd = jalali_to_gregorian(*(int(part) for part in jalali.split("-")))
+    return {"origin_code": src, "destination_code": dst, "date": jalali, "date_gregorian": f"{gy:04d}-{gm:02d}-{gd:02d}"}
+
+
+def _fill(text: str, values: dict) -> str:
+    for name, value in values.items():
+        text = text.replace("{" + name + "}", value)
+    return text
+
+
+def _generalize(text: str, values: dict) -> str:
+    # تاریخ‌ها اول، کدهای شهر بعد (کد شهر ممکنه داخل تاریخ نباشه ولی برعکسش ممکنه)
+    for name in ("date_gregorian", "date", "origin_code", "destination_code"):
+        text = text.replace(values[name], "{" + name + "}")
+    return text
+
+
+def get_template(kind: str):
+    """template تنظیم شده با SCRAPER_API_TEMPLATE_<KIND> یا template یاد گرفته شده."""
+    configured = os.getenv(f"SCRAPER_API_TEMPLATE_{kind.upper()}")
+    if configured:
+        try:
+            return json.loads(configured)
+        except ValueError as e:
+            logger.error(f"Invalid SCRAPER_API_TEMPLATE_{kind.upper()}: {e}")
+    return _templates.get(kind)
+
+
+def learn_template(kind: str, request, values: dict):
+    """ساخت template از درخواستی که صفحه فرستاده؛ فقط اگه کد مبدا و مقصد توش پیدا بشن."""
+    if kind in _templates or values is None:
+        return
+    url = _generalize(request.url, values)
+    body = _generalize(request.post_data or "", values)
+    if "{origin_code}" not in url + body or "{destination_code}" not in url + body:
+        logger.info(f"Captured {kind} API request does not carry the route codes; not learning a template: {request.url}")
+        return
+    headers = {name: value for name, value in request.headers.items() if name.lower() in TEMPLATE_HEADERS}
+    _templates[kind] = {"method": request.method, "url": url, "body": body or None, "headers": headers}
+    api_stats["learned"] += 1
+    logger.info(f"📡 Learned {kind} API template: {request.method} {url}")
+
+
+# --- Capture inside Playwright ---
+
+class ApiCapture:
+    """
+    شنود پاسخ‌های API جستجو روی یه صفحه‌ی Playwright.
+    Listens for search-API responses on a Playwright page and turns them into ScheduleRecords.
+
+    Create it before navigating so the first response is not missed.
+    """
+
+    def __init__(self, page, kind: str, origin: str, destination: str, date: str):
+        self.kind = kind
+        self.pattern = API_PATTERNS.get(kind)
+        self.values = route_values(origin, destination, date)
+        self.payloads = []
+        self._tasks = []
+        if SCRAPER_API_MODE != "off" and self.pattern is not None:
+            page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        if response.request.resource_type in ("xhr", "fetch") and self.pattern.search(response.url):
+            self._tasks.append(asyncio.ensure_future(self._read(response)))
+
+    async def _read(self, response):
+        try:
+            if not response.ok:
+                return
+            payload = await response.json()
+        except Exception as e:
+            logger.debug(f"Could not read {self.kind} API response {response.url}: {e}")
+            return
+        api_stats["captured"] += 1
+        self.payloads.append(payload)
+        learn_template(self.kind, response.request, self.values)
+
+    async def records(self) -> list:
+        """رکوردهای پاسخ‌های شنود شده (خالی اگه چیزی به درد بخور نیومد)."""
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=SCRAPER_API_CAPTURE_WAIT)
+        for payload in self.payloads:
+            records = records_from_payload(payload)
+            if records:
+                api_stats["capture_hits"] += 1
+                logger.info(f"📡 {len(records)} {self.kind} records from the captured search API.")
+                return records
+        return []
+
+
+# --- Direct calls without a browser ---
+
+def _get_client():
+    # import تنبل: httpx فقط تو حالت direct لازمه
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            timeout=SCRAPER_API_TIMEOUT,
+            limits=httpx.Limits(max_connections=SCRAPER_API_MAX_CONNECTIONS,
+                                max_keepalive_connections=SCRAPER_API_MAX_CONNECTIONS),
+            headers={"User-Agent": "Mozilla/5.0", "Accept": "application/json"},
+        )
+    return _client
+
+
+async def fetch_direct(kind: str, origin: str, destination: str, date: str):
+    """
+    فراخوانی مستقیم API جستجو با connection pool مشترک؛ None یعنی برو سراغ Playwright.
+    Call the search API directly over the pooled HTTP client; None means fall back to Playwright.
+    """
+    if SCRAPER_API_MODE != "direct":
+        return None
+    template, values = get_template(kind), route_values(origin, destination, date)
+    if template is None or values is None:
+        return None
+    started = time.perf_counter()
+    try:
+        response = await _get_client().request(
+            template.get("method", "GET"),
+            _fill(template["url"], values),
+            content=_fill(template["body"], values).encode("utf-8") if template.get("body") else None,
+            headers=template.get("headers") or None,
+        )
+        response.raise_for_status()
+        records = records_from_payload(response.json())
+    except Exception as e:
+        api_stats["direct_errors"] += 1
+        logger.warning(f"Direct {kind} API call failed, falling back to Playwright: {e}")
+        return None
+    if not records:
+        api_stats["direct_misses"] += 1
+        logger.info(f"Direct {kind} API call returned no records, falling back to Playwright.")
+        return None
+    api_stats["direct_hits"] += 1
+    logger.info(f"📡 {len(records)} {kind} records from the direct API in {(time.perf_counter() - started) * 1000:.0f}ms.")
+    return records
+
+
+async def aclose_api_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def close_api_client():
+    """بستن connection pool روی event loop موتور، جایی که ساخته شده (موقع خاموش شدن برنامه)."""
+    if _client is None:
+        return
+    from app.browser_pool import run_sync
+    logger.info(f"📡 Search API stats: {api_stats}")
+    run_sync(aclose_api_client())
@@ -1,13 +1,13 @@
 #auth_reouter.py
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import  OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
 import uuid
 
 from app.users_db import create_user, verify_user
 from app.auth_utils import create_access_token, decode_token
-from app.agent import get_agent
-from app.chat_router import sessions, DEFAULT_MODEL, WELCOME_MESSAGE
-from app.database import save_message
+from app.chat_router import session_store, DEFAULT_MODEL, WELCOME_MESSAGE
+from app.database import asave_message
 from app.models import SignUpRequest, LoginRequest
 
 auth_router = APIRouter()
@@ -21,15 +21,16 @@ def signup(signup_data: SignUpRequest):
     return {"msg": "User created"}
 
 @auth_router.post("/login")
-def login(login_data: LoginRequest): 
-    if not verify_user(login_data.email, login_data.password):
+async def login(login_data: LoginRequest): 
+    # bcrypt کند و CPU-bound هست، نباید event loop رو بلاک کنه
+    if not await run_in_threadpool(verify_user, login_data.email, login_data.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_access_token({"sub": login_data.email})
 
     session_id = str(uuid.uuid4())
-    sessions[session_id] = {"agent": get_agent(DEFAULT_MODEL)}
-    save_message(session_id, "assistant", WELCOME_MESSAGE)
+    await session_store.create(session_id, DEFAULT_MODEL, owner=login_data.email)
+    await asave_message(session_id, "assistant", WELCOME_MESSAGE)
 
     return {
         "access_token": token,
@@ -0,0 +1,96 @@
+# app/bench_messages.py
+"""
+بنچمارک چیدمان‌های ذخیره‌ی پیام: تاخیر اضافه کردن پیام و خواندن پنجره‌ی آخر.
+Benchmark of the message storage layouts: append latency and tail-read latency.
+
+Usage:
+    python -m app.bench_messages
+    python -m app.bench_messages --sizes 10 1000 10000 --ops 200 --window 20
+
+Writes into a scratch database (BENCH_DB_NAME, default '<MONGO_DB_NAME>_bench')
+that is dropped at the end. Each (layout, size) pair pre-fills one session
+with `size` messages, then times `ops` appends and `ops` reads of the last
+`window` messages through MessageStore.
+"""
+import os
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+
+from app.database import async_client, MONGO_DB_NAME
+from app.message_store import MessageStore, STORAGE_MODES, MESSAGE_BUCKET_SIZE
+
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", f"{MONGO_DB_NAME}_bench")
+CONTENT = "سلام، بلیط قطار تهران به مشهد برای فردا دارید؟ " * 4
+
+
+async def _prefill(store: MessageStore, session_id: str, size: int):
+    """پر کردن سریع session با size پیام (مستقیم، بدون مسیر append)."""
+    now = datetime.now(timezone.utc)
+    messages = [{"seq": i, "role": "user" if i % 2 == 0 else "assistant", "content": CONTENT, "created_at": now}
+                for i in range(size)]
+    counters = {"message_count": size, "user_message_count": (size + 1) // 2, "has_counters": True}
+    if store.mode == "embedded":
+        await store.sessions.insert_one({"session_id": session_id, **counters,
+                                         "messages": [{"role": m["role"], "content": m["content"]} for m in messages]})
+        return
+    await store.sessions.insert_one({"session_id": session_id, **counters, "storage_mode": store.mode})
+    if store.mode == "message":
+        for start in range(0, size, 1000):
+            await store.messages.insert_many([{"session_id": session_id, **m} for m in messages[start:start + 1000]])
+    else:
+        k = store.bucket_size
+        buckets = [{"session_id": session_id, "bucket": b, "messages": messages[b * k:(b + 1) * k], "count": len(messages[b * k:(b + 1) * k])}
+                   for b in range((size + k - 1) // k)]
+        for start in range(0, len(buckets), 100):
+            await store.buckets.insert_many(buckets[start:start + 100])
+
+
+async def _timed(fn, ops: int) -> list:
+    samples = []
+    for _ in range(ops):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _summary(samples: list) -> str:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"p50={statistics.median(samples):7.2f}ms p95={p95:7.2f}ms"
+
+
+async def run(sizes: list, ops: int, window: int, bucket_size: int):
+    db = async_client[BENCH_DB_NAME]
+    try:
+        print(f"{'layout':<9} {'size':>6}  {'append':<30} {'tail read':<30}")
+        for mode in STORAGE_MODES:
+            store = MessageStore(db["sessions"], db["messages"], db["buckets"], mode=mode, bucket_size=bucket_size)
+            await store.sessions.create_index("session_id", unique=True)
+            await store.ensure_indexes()
+            for size in sizes:
+                session_id = str(uuid.uuid4())
+                await _prefill(store, session_id, size)
+                append = await _timed(lambda: store.append(session_id, "user", CONTENT), ops)
+                tail = await _timed(lambda: store.window(session_id, window), ops)
+                print(f"{mode:<9} {size:>6}  {_summary(append):<30} {_summary(tail):<30}")
+    finally:
+        await async_client.drop_database(BENCH_DB_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat message storage layouts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--window", type=int, default=20)
+    parser.add_argument("--bucket-size", type=int, default=MESSAGE_BUCKET_SIZE)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.ops, args.window, args.bucket_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# app/browser_pool.py
+import os
+import asyncio
+import threading
+import functools
+import logging
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from playwright.async_api import async_playwright
+
+from app.request_blocking import RequestBlocker
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- Pool configuration ---
+# تعداد مرورگرهای Chromium که همیشه گرم نگه داشته می‌شن
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+# حداکثر تعداد صفحه‌ی همزمان روی کل استخر (بقیه تو صف منتظر می‌مونن)
+BROWSER_POOL_MAX_CONCURRENCY = int(os.getenv("BROWSER_POOL_MAX_CONCURRENCY", "16"))
+# بعد از این تعداد استفاده، مرورگر بسته و دوباره ساخته می‌شه (جلوگیری از نشت حافظه)
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "100"))
+# حداکثر زمان انتظار برای گرفتن یه جای خالی تو استخر (ثانیه)
+BROWSER_ACQUIRE_TIMEOUT = float(os.getenv("BROWSER_ACQUIRE_TIMEOUT", "60"))
+# برای دیباگ می‌تونی BROWSER_HEADLESS=false بذاری
+BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "true").lower() != "false"
+# بلاک کردن تصاویر، فونت‌ها، مدیا و ردیاب‌ها (app/request_blocking.py)
+BROWSER_BLOCK_REQUESTS = os.getenv("BROWSER_BLOCK_REQUESTS", "true").lower() != "false"
+
+VIEWPORT = {"width": 1280, "height": 1024}
+
+
+# --- Engine event loop ---
+# همه‌ی اشیای Playwright به event loop ای که ساختشون وابسته‌ان.
+# برای اینکه یه استخر مشترک برای کل پروسه داشته باشیم، همه‌ی کارهای مرورگر
+# روی یه event loop اختصاصی (تو یه thread جدا) اجرا می‌شن.
+_engine_loop = None
+_engine_lock = threading.Lock()
+
+
+def _get_engine_loop() -> asyncio.AbstractEventLoop:
+    global _engine_loop
+    with _engine_lock:
+        if _engine_loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="playwright-engine", daemon=True)
+            thread.start()
+            _engine_loop = loop
+        return _engine_loop
+
+
+def _on_engine_loop() -> bool:
+    try:
+        return asyncio.get_running_loop() is _engine_loop
+    except RuntimeError:
+        return False
+
+
+async def run_on_engine(coro):
+    """
+    اجرای یه coroutine روی event loop موتور Playwright و await کردن نتیجه‌اش از هر loop دیگه‌ای.
+    Run a coroutine on the Playwright engine loop and await its result from any other loop.
+    """
+    if _on_engine_loop():
+        return await coro
+    future = asyncio.run_coroutine_threadsafe(coro, _get_engine_loop())
+    return await asyncio.wrap_future(future)
+
+
+def run_sync(coro):
+    """
+    اجرای blocking یه coroutine روی event loop موتور (برای adapter های sync، اسکریپت‌ها و تست).
+    Blocking run of a coroutine on the engine loop (for sync adapters, scripts and tests).
+    """
+    if _on_engine_loop():
+        raise RuntimeError("run_sync() cannot be called from the Playwright engine loop.")
+    return asyncio.run_coroutine_threadsafe(coro, _get_engine_loop()).result()
+
+
+def on_engine_loop(fn):
+    """دکوریتور: coroutine همیشه روی event loop موتور Playwright اجرا می‌شه."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_on_engine(fn(*args, **kwargs))
+    return wrapper
+
+
+class _BrowserSlot:
+    """یک مرورگر Chromium با عمر طولانی در استخر."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.uses = 0
+        self.active = 0
+        self.launches = 0
+
+    def is_healthy(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    استخر مرورگرهای گرم Chromium برای همه ابزارهای Playwright.
+    Process-wide pool of warm Chromium browsers shared by all Playwright tools.
+
+    Browsers are launched lazily on first use and then kept alive; every call
+    gets a fresh, isolated BrowserContext that is closed when the call ends.
+    All methods must run on the engine loop (see on_engine_loop).
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_concurrency: int = BROWSER_POOL_MAX_CONCURRENCY,
+                 max_uses: int = BROWSER_MAX_USES, acquire_timeout: float = BROWSER_ACQUIRE_TIMEOUT,
+                 headless: bool = BROWSER_HEADLESS, block_requests: bool = BROWSER_BLOCK_REQUESTS):
+        self.size = max(1, size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self.headless = headless
+        self.block_requests = block_requests
+        self._playwright = None
+        self._slots = [_BrowserSlot(i) for i in range(self.size)]
+        self._semaphore = None
+        self._lock = None
+
+    async def _ensure_started(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._playwright is None:
+            async with self._lock:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+
+    async def _close_browser(self, slot: _BrowserSlot):
+        browser, slot.browser = slot.browser, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.warning(f"Error closing browser #{slot.index}: {e}")
+
+    async def _checkout_slot(self) -> _BrowserSlot:
+        async with self._lock:
+            # کم‌مشغله‌ترین مرورگر رو انتخاب کن
+            slot = min(self._slots, key=lambda s: s.active)
+            # Health check: اگه مرورگر کرش کرده یا قطع شده، دوباره بساز
+            if slot.browser is not None and not slot.is_healthy():
+                logger.warning(f"Browser #{slot.index} is disconnected. Relaunching...")
+                await self._close_browser(slot)
+            # Recycling: بعد از max_uses بار و وقتی صفحه‌ی بازی نداره، مرورگر رو عوض کن
+            if slot.browser is not None and slot.uses >= self.max_uses and slot.active == 0:
+                logger.info(f"Browser #{slot.index} reached {slot.uses} uses. Recycling...")
+                await self._close_browser(slot)
+            if slot.browser is None:
+                slot.browser = await self._playwright.chromium.launch(headless=self.headless)
+                slot.uses = 0
+                slot.launches += 1
+                logger.info(f"🌐 Browser #{slot.index} launched (launch count: {slot.launches}).")
+            slot.active += 1
+            slot.uses += 1
+            return slot
+
+    @asynccontextmanager
+    async def context(self):
+        """
+        یه BrowserContext تازه و ایزوله از یکی از مرورگرهای استخر.
+        A fresh, isolated BrowserContext from one of the pooled browsers.
+        """
+        await self._ensure_started()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("No browser slot became available in the pool.")
+        try:
+            slot = await self._checkout_slot()
+            try:
+                context = await slot.browser.new_context(viewport=VIEWPORT)
+                blocker = RequestBlocker() if self.block_requests else None
+                try:
+                    if blocker is not None:
+                        await blocker.install(context)
+                    yield context
+                finally:
+                    await context.close()
+                    if blocker is not None:
+                        blocker.log()
+            finally:
+                slot.active -= 1
+        finally:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def page(self):
+        """یه صفحه‌ی تازه داخل یه BrowserContext ایزوله."""
+        async with self.context() as context:
+            yield await context.new_page()
+
+    def stats(self) -> dict:
+        """وضعیت فعلی استخر (برای لاگ و مانیتورینگ)."""
+        return {
+            "size": self.size,
+            "max_concurrency": self.max_concurrency,
+            "browsers": [
+                {"index": s.index, "uses": s.uses, "active": s.active, "launches": s.launches, "healthy": s.is_healthy()}
+                for s in self._slots
+            ],
+        }
+
+    async def aclose(self):
+        """بستن همه مرورگرها و خود Playwright."""
+        for slot in self._slots:
+            await self._close_browser(slot)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Browser pool closed.")
+
+    def close(self):
+        """بستن استخر از کد sync (موقع خاموش شدن برنامه)."""
+        if _engine_loop is None:
+            return
+        run_sync(self.aclose())
+
+
+# Shared pool instance used by app/playwright.py
+browser_pool = BrowserPool()
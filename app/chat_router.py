@@ -1,13 +1,25 @@
 #app/chat_router.py
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+import json
+import time
+import logging
 import traceback
 
 from app.models import UserMessage
-from app.database import save_message, get_history
-from app.agent import get_agent
+from app.database import asave_message, aget_history
+from app.history import aload_history, schedule_summary_update
+from app.session_store import build_session_store
+from app.agent import get_agent, uses_checkpointer, thread_config
+from app.tool_router import route
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 chat_router = APIRouter()
-sessions = {}
+# Session metadata (model, owner, created / last seen); memory or MongoDB (app/session_store.py)
+session_store = build_session_store()
 
 #DEFAULT_MODEL = "mistralai/mistral-7b-instruct"
 #DEFAULT_MODEL = "qwen/qwen2.5-72b-instruct"
@@ -17,29 +29,48 @@ DEFAULT_MODEL = "mistralai/mistral-small-3.2-24b-instruct"
 
 WELCOME_MESSAGE = "سلام من علی مدد ام، چطور میتونم کمکتون کنم؟ 😊"
 
+async def _agent_input(agent, session_id: str, history: list, content: str) -> tuple:
+    """
+    ورودی و config اجرای ایجنت برای این نوبت.
+    Agent input and run config for this turn.
+
+    Without a checkpointer the history window is sent every turn. With one,
+    the thread (thread_id=session_id) already holds earlier turns including
+    tool calls and their results, so only the new user message is sent; an
+    empty thread is seeded once from the stored history.
+    """
+    if not uses_checkpointer():
+        return {"messages": history}, None
+    config = thread_config(session_id)
+    state = await agent.aget_state(config)
+    if state.values.get("messages"):
+        return {"messages": [{"role": "user", "content": content}]}, config
+    return {"messages": history}, config
+
 @chat_router.post("/send_message")
-def send_message(message: UserMessage):
+async def send_message(message: UserMessage):
     session_id = message.session_id
     content = message.content
 
     
     # If the session does not exist, create it
-    if session_id not in sessions:
-        sessions[session_id] = {"agent": get_agent(DEFAULT_MODEL)}
+    # Sessions only hold lightweight metadata; the compiled agent is shared (app/agent.py)
+    session = await session_store.get(session_id)
+    if session is None:
+        session = await session_store.create(session_id, DEFAULT_MODEL)
 
-    session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=403, detail="Invalid or expired session_id.")
 
     # Save the user's message first
-    save_message(session_id, "user", content) # We moved this line here because the model must first have a message from the user in addition to its own message for the history to work properly.
+    await asave_message(session_id, "user", content) # We moved this line here because the model must first have a message from the user in addition to its own message for the history to work properly.
 
     
-    # Get the history AFTER saving the user message
-    history = get_history(session_id)
+    # Get the history window AFTER saving the user message
+    # (only the last HISTORY_WINDOW_MESSAGES messages; see app/history.py)
+    history, user_message_count = await aload_history(session_id)
 
     # Check message count (now including the new user message)
-    user_message_count = sum(1 for msg in history if msg["role"] == "user")
     if user_message_count > 20: # تغییر: از >= به > تغییر کرد
         # Optional: Remove the saved user message if limit is exceeded
         # This requires modifying save_message or adding a delete_message function
@@ -48,30 +79,105 @@ def send_message(message: UserMessage):
             "response": "⚠️ You can only send 20 messages in this session. Please start a new session."}
 
     # Continue the usual process
-    agent = session["agent"]
+    # فقط ابزارهای حوزه‌ی این پیام (app/tool_router.py)
+    domains, tool_names = route(content, history)
+    agent = get_agent(session["model_name"], tool_names)
+    started = time.perf_counter()
 
     # Make sure history is not empty and doesn't start with assistant message only
     # This check might be redundant now, but good to be sure.
     # The main fix is moving save_message before get_history.
     
-    response = agent.invoke({"messages": history}) # Now history includes the user's latest message
+    agent_input, config = await _agent_input(agent, session_id, history, content)
+    response = await agent.ainvoke(agent_input, config=config) # Now history includes the user's latest message
     
+    logger.info(f"🧭 Turn for session {session_id} routed to {domains or 'all tools'} "
+                f"({len(tool_names) if tool_names else 'all'} tools) took {time.perf_counter() - started:.2f}s.")
     # print (f"⚠️ Raw response: {response}")
     try:
         ai_message = response["messages"][-1]
         output = ai_message.content
         # Save the AI's response
-        save_message(session_id, "assistant", output)
+        await asave_message(session_id, "assistant", output)
+        schedule_summary_update(session_id, session["model_name"])
     except Exception as e:
         traceback.print_exc()
         output = f"❗ Error processing response: {str(e)}"
         # Even if processing fails, the user message is already saved.
     return {"response": output}
 
+def _sse(event: str, data: dict) -> str:
+    """یه رویداد Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@chat_router.post("/send_message/stream")
+async def send_message_stream(message: UserMessage):
+    """
+    نسخه‌ی استریم send_message با Server-Sent Events.
+    Streaming send_message over Server-Sent Events.
+
+    Emits 'tool_start' / 'tool_end' events around tool calls, 'token' events
+    with answer deltas, then 'done' with the full answer (or 'error').
+    """
+    session_id = message.session_id
+    content = message.content
+
+    session = await session_store.get(session_id)
+    if session is None:
+        session = await session_store.create(session_id, DEFAULT_MODEL)
+
+    await asave_message(session_id, "user", content)
+    history, user_message_count = await aload_history(session_id)
+
+    if user_message_count > 20:
+        async def limit_reached():
+            yield _sse("done", {"response": "⚠️ You can only send 20 messages in this session. Please start a new session."})
+        return StreamingResponse(limit_reached(), media_type="text/event-stream")
+
+    domains, tool_names = route(content, history)
+    agent = get_agent(session["model_name"], tool_names)
+
+    async def event_stream():
+        answer = ""  # متن آخرین فراخوانی LLM (همون جواب نهایی)
+        final_output = None
+        try:
+            agent_input, config = await _agent_input(agent, session_id, history, content)
+            async for event in agent.astream_events(agent_input, config=config, version="v2"):
+                kind = event["event"]
+                if kind == "on_tool_start":
+                    yield _sse("tool_start", {"name": event["name"], "input": event["data"].get("input")})
+                elif kind == "on_tool_end":
+                    yield _sse("tool_end", {"name": event["name"]})
+                elif kind == "on_chat_model_start":
+                    answer = ""
+                elif kind == "on_chat_model_stream":
+                    delta = event["data"]["chunk"].content
+                    if isinstance(delta, str) and delta:
+                        answer += delta
+                        yield _sse("token", {"delta": delta})
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # پایان گراف اصلی: پیام آخر همون جواب ایجنته
+                    output = event["data"].get("output")
+                    if isinstance(output, dict) and output.get("messages"):
+                        final_output = output["messages"][-1].content
+            output = final_output if final_output is not None else answer
+            await asave_message(session_id, "assistant", output)
+            schedule_summary_update(session_id, session["model_name"])
+            yield _sse("done", {"response": output})
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse("error", {"response": f"❗ Error processing response: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @chat_router.get("/get_history/{session_id}")
-def get_chat_history(session_id: str):
-    session = sessions.get(session_id)
+async def get_chat_history(session_id: str):
+    session = await session_store.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    return get_history(session_id)
+    return await aget_history(session_id)
@@ -1,9 +1,16 @@
 ### app/database.py
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 
+from app.message_store import (
+    MessageStore, push_message_update,
+    MESSAGE_STORAGE_MODE, MESSAGES_COLLECTION_NAME, BUCKETS_COLLECTION_NAME
+)
+from app.write_behind import WriteBehindQueue, WRITE_BEHIND_ENABLED
+
 # Load environment variables
 load_dotenv("./app/.env")
 
@@ -39,6 +46,24 @@ except Exception as e:
     print(f"❌ Error connecting to MongoDB: {e}")
     raise e 
 
+# Async client (Motor) for the async request path.
+# Motor connects lazily on first use, on the event loop that uses it.
+async_client = AsyncIOMotorClient(MONGO_URI, server_api=ServerApi('1'))
+async_db = async_client[MONGO_DB_NAME]
+async_chat_sessions_collection = async_db[MONGO_COLLECTION_NAME]
+
+# Message layout for the async path is chosen with MESSAGE_STORAGE_MODE (app/message_store.py).
+# The sync helpers below always use the embedded layout.
+message_store = MessageStore(
+    async_chat_sessions_collection,
+    async_db[MESSAGES_COLLECTION_NAME],
+    async_db[BUCKETS_COLLECTION_NAME],
+    mode=MESSAGE_STORAGE_MODE
+)
+
+# Optional write-behind batching of message writes (WRITE_BEHIND_ENABLED, app/write_behind.py)
+write_behind = WriteBehindQueue(message_store) if WRITE_BEHIND_ENABLED else None
+
 def save_message(session_id: str, role: str, content: str):
     """
 Storing a message in MongoDB.
@@ -50,10 +75,7 @@ All messages for a session_id are stored in a document.
 # $push: Adds the new message to the 'messages' array.
         result = chat_sessions_collection.update_one(
             {"session_id": session_id}, # Filter: Find document with session_id
-            {
-                "$push": {"messages": {"role": role, "content": content}},
-                "$setOnInsert": {"session_id": session_id} # If the document does not exist, create the session_id as well
-            },
+            push_message_update(session_id, role, content),
             upsert=True # If document not found, create one
         )
         #    print(f"💾 Message saved for session {session_id}. Matched: {result.matched_count}, Modified: {result.modified_count}, Upserted: {result.upserted_id}")
@@ -75,4 +97,70 @@ def get_history(session_id: str) -> list:
             return []
     except Exception as e:
         print(f"❗ Error retrieving history from MongoDB for session {session_id}: {e}")
-        return [] 
+        return []
+
+async def asave_message(session_id: str, role: str, content: str):
+    """
+    Async version of save_message (Motor), using the configured storage layout.
+    """
+    try:
+        if write_behind is not None:
+            await write_behind.enqueue(session_id, role, content)
+        else:
+            await message_store.append(session_id, role, content)
+    except Exception as e:
+        print(f"❗ Error saving message to MongoDB for session {session_id}: {e}")
+
+async def aget_history(session_id: str) -> list:
+    """
+    Async version of get_history (Motor), using the configured storage layout.
+    """
+    try:
+        if write_behind is not None:
+            return await write_behind.read_all(session_id)
+        return await message_store.all(session_id)
+    except Exception as e:
+        print(f"❗ Error retrieving history from MongoDB for session {session_id}: {e}")
+        return []
+
+async def aget_history_window(session_id: str, limit: int) -> dict:
+    """
+    Get only the last `limit` messages of a session plus its counters and summary.
+    The read is O(limit) instead of O(session length) in every storage layout.
+    """
+    try:
+        if write_behind is not None:
+            return await write_behind.read_window(session_id, limit)
+        return await message_store.window(session_id, limit)
+    except Exception as e:
+        print(f"❗ Error retrieving history window from MongoDB for session {session_id}: {e}")
+        return {}
+
+async def aget_message_range(session_id: str, skip: int, limit: int) -> list:
+    """
+    Get `limit` messages of a session starting at index `skip` (for summarising older turns).
+    """
+    try:
+        return await message_store.range(session_id, skip, limit)
+    except Exception as e:
+        print(f"❗ Error retrieving messages from MongoDB for session {session_id}: {e}")
+        return []
+
+async def aset_summary(session_id: str, summary: str, summarized_count: int):
+    """
+    Store the running summary of the first `summarized_count` messages of a session.
+    """
+    try:
+        await async_chat_sessions_collection.update_one(
+            {"session_id": session_id},
+            {"$set": {"summary": summary, "summarized_count": summarized_count}}
+        )
+    except Exception as e:
+        print(f"❗ Error saving summary to MongoDB for session {session_id}: {e}")
+
+async def aflush_messages():
+    """
+    Write every message still queued by the write-behind layer (called on shutdown).
+    """
+    if write_behind is not None:
+        await write_behind.aclose()
@@ -0,0 +1,269 @@
+# app/extraction.py
+"""
+استخراج دسته‌ای نتایج: یک page.evaluate برای کل صفحه‌ی نتایج به جای count/text_content برای هر فیلد هر کارت.
+Bulk DOM extraction: one page.evaluate per results page instead of a count()/text_content() round-trip per field.
+
+Usage:
+    python -m app.extraction --bench               # per-locator loop vs one evaluate on a synthetic page
+    python -m app.extraction --bench --cards 50 --runs 20
+    python -m app.extraction --bench --cdp http://127.0.0.1:9222   # against an already running Chromium
+
+Measured (--runs 20, Chromium 140 over CDP, 1 vCPU), p50 per results page:
+    cards=30 limit=3    per-locator   75.9ms   evaluate  3.7ms
+    cards=30 limit=10   per-locator  252.0ms   evaluate  4.1ms
+    cards=30 limit=30   per-locator  609.0ms   evaluate  6.5ms
+    cards=50 limit=50   per-locator 1115.9ms   evaluate 10.9ms
+"""
+import os
+import time
+import argparse
+import asyncio
+import statistics
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# تعداد کارت‌هایی که از هر صفحه برگردونده می‌شه (مثل قبل، 3 تای اول)
+DEFAULT_LIMIT = 3
+# live: اسکریپت داخل صفحه | offline: snapshot از page.content()، بستن صفحه، پارس با app/soup.py تو process pool
+SCRAPER_PARSE_MODE = os.getenv("SCRAPER_PARSE_MODE", "live").lower()
+# اگه تنظیم بشه، HTML هر صفحه‌ی نتایج اینجا ذخیره می‌شه (برای ساختن fixture های app/soup.py)
+SCRAPER_SNAPSHOT_DIR = os.getenv("SCRAPER_SNAPSHOT_DIR", "")
+
+# اسکریپت داخل صفحه: استراتژی‌ها به ترتیب امتحان می‌شن و اولین استراتژی که کارت داشت استفاده می‌شه.
+# هر استراتژی: cards (CSS)، has_text (اختیاری، مثل :has-text در Playwright)،
+# expand (از درونی‌ترین المنت‌های پیدا شده تا بزرگ‌ترین والدی که فقط همون یه نتیجه رو داره بالا می‌ره؛
+# :has-text همه‌ی والدها رو هم می‌گیره و درونی‌ترینش معمولاً فقط ردیف قیمته)،
+# outermost (حذف المنت‌های داخل یه کارت دیگه؛ [class*='bus'] فیلدهایی مثل bus-company رو هم می‌گیره)،
+# parent (کارت = والد المنت پیدا شده) و fields (اسم فیلد -> CSS داخل کارت).
+EXTRACT_CARDS_JS = """
+({strategies, limit}) => {
+    const norm = (s) => (s || "").replace(/\\s+/g, " ").trim().toLowerCase();
+    for (let index = 0; index < strategies.length; index++) {
+        const strategy = strategies[index];
+        let cards = Array.from(document.querySelectorAll(strategy.cards));
+        if (strategy.has_text) {
+            const needle = norm(strategy.has_text);
+            cards = cards.filter((el) => norm(el.textContent).includes(needle));
+        }
+        if (strategy.outermost) {
+            cards = cards.filter((el) => !cards.some((other) => other !== el && other.contains(el)));
+        }
+        if (strategy.expand) {
+            const inner = cards.filter((el) => !cards.some((other) => other !== el && el.contains(other)));
+            const matches = (node) => inner.filter((other) => node.contains(other)).length;
+            cards = inner.map((el) => {
+                let node = el;
+                while (node.parentElement && node.parentElement !== document.body && matches(node.parentElement) === 1) {
+                    node = node.parentElement;
+                }
+                return node;
+            });
+        }
+        if (strategy.parent) {
+            cards = Array.from(new Set(cards.map((el) => el.parentElement).filter(Boolean)));
+        }
+        if (!cards.length) continue;
+        const records = cards.slice(0, limit).map((card) => {
+            const fields = {};
+            for (const [name, selector] of Object.entries(strategy.fields || {})) {
+                const el = card.querySelector(selector);
+                fields[name] = el ? (el.textContent || "").trim() : "";
+            }
+            return {text: card.textContent || "", fields};
+        });
+        return {strategy: index, total: cards.length, records};
+    }
+    return {strategy: -1, total: 0, records: []};
+}
+"""
+
+# --- Card strategies per results page ---
+# همون selector هایی که قبلاً با locator استفاده می‌شد
+FLIGHT_CARDS = [
+    # والد دکمه "انتخاب"
+    {"cards": "button", "has_text": "انتخاب", "parent": True},
+]
+TRAIN_CARDS = [
+    {"cards": "div", "has_text": "تومانانتخاب بلیط", "expand": True},
+]
+VILLA_CARDS = [
+    {"cards": "section", "has_text": "رزرو آنی"},
+]
+HOTEL_CARDS = [
+    {"cards": ".hotel-item, .HotelCard",
+     "fields": {"name": ".hotel-name, .HotelCard__name, h3",
+                "rating": ".hotel-rating, .HotelCard__rating",
+                "price": ".price, .HotelCard__price",
+                "location": ".location, .HotelCard__location"}},
+    {"cards": ".hotel-item, .HotelCard, [class*='hotel'], [class*='Hotel']", "outermost": True,
+     "fields": {"name": ".hotel-name, .HotelCard__name, h3, [class*='name']",
+                "rating": ".hotel-rating, .HotelCard__rating, [class*='rating']",
+                "price": ".price, .HotelCard__price, [class*='price']",
+                "location": ".location, .HotelCard__location, [class*='location']"}},
+]
+BUS_CARDS = [
+    {"cards": ".bus-item, .BusCard, [class*='bus'], [class*='Bus']", "outermost": True,
+     "fields": {"company": ".company-name, .bus-company",
+                "departure": ".departure-time, .bus-departure",
+                "arrival": ".arrival-time, .bus-arrival",
+                "price": ".price, .bus-price",
+                "seats": ".seats-left, .bus-seats"}},
+    {"cards": ".bus-search-result-item, .available-bus, [data-test*='bus']",
+     "fields": {"company": ".company-name, .bus-company, [class*='company']",
+                "departure": ".departure-time, .bus-departure, [class*='departure']",
+                "arrival": ".arrival-time, .bus-arrival, [class*='arrival']",
+                "price": ".price, .bus-price, [class*='price']",
+                "seats": ".seats-left, .bus-seats, [class*='seats']"}},
+]
+TOUR_CARDS = [
+    {"cards": ".tour-item, .TourCard, [class*='tour'], [class*='Tour']", "outermost": True,
+     "fields": {"name": ".tour-name, .TourCard__name",
+                "price": ".price, .TourCard__price",
+                "rating": ".rating, .TourCard__rating",
+                "duration": ".duration, .TourCard__duration"}},
+    {"cards": ".tour-search-result-item, .available-tour, [data-test*='tour']",
+     "fields": {"name": ".tour-name, .TourCard__name, h3, [class*='name']",
+                "price": ".price, .TourCard__price, [class*='price']",
+                "rating": ".rating, .TourCard__rating, [class*='rating']",
+                "duration": ".duration, .TourCard__duration, [class*='duration']"}},
+]
+
+# selector های کارت نتیجه برای تشخیص رسیدن به صفحه‌ی نتایج (بدون [class*=...] کلی که رو هر صفحه‌ای پیدا می‌شه)
+HOTEL_RESULTS_MARKER = HOTEL_CARDS[0]["cards"]
+TOUR_RESULTS_MARKER = ".tour-item, .TourCard, " + TOUR_CARDS[1]["cards"]
+
+CARD_STRATEGIES = {
+    "flight": FLIGHT_CARDS,
+    "train": TRAIN_CARDS,
+    "bus": BUS_CARDS,
+    "hotel": HOTEL_CARDS,
+    "villa": VILLA_CARDS,
+    "tour": TOUR_CARDS,
+}
+
+
+def save_snapshot(kind: str, html: str):
+    """ذخیره‌ی HTML صفحه‌ی نتایج تو SCRAPER_SNAPSHOT_DIR به اسم <kind>-<زمان>.html."""
+    try:
+        os.makedirs(SCRAPER_SNAPSHOT_DIR, exist_ok=True)
+        path = os.path.join(SCRAPER_SNAPSHOT_DIR, f"{kind}-{datetime.now():%Y%m%d-%H%M%S-%f}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+    except OSError as e:
+        logger.warning(f"Could not save {kind} snapshot: {e}")
+
+
+async def extract_cards(page, kind: str, strategies: list, limit: int = DEFAULT_LIMIT) -> dict:
+    """
+    استخراج همه‌ی کارت‌های نتایج با یک رفت و برگشت به مرورگر.
+    Extract the result cards of a page in a single browser round-trip.
+
+    Returns {"strategy", "total", "records"}, where records holds up to `limit`
+    cards as {"text": full card text, "fields": {name: text}} and strategy is
+    the index of the first strategy that found cards (-1 if none did).
+
+    In offline mode the page HTML is captured, the page's context is closed
+    right away and the same strategies run in app/soup.py's process pool.
+    The page must not be used after this call in that mode.
+    """
+    started = time.perf_counter()
+    if SCRAPER_PARSE_MODE == "offline" or SCRAPER_SNAPSHOT_DIR:
+        html = await page.content()
+        if SCRAPER_SNAPSHOT_DIR:
+            save_snapshot(kind, html)
+    if SCRAPER_PARSE_MODE == "offline":
+        from app.soup import run_parser, parse_cards
+        # آزاد کردن مرورگر قبل از پارس؛ close دوباره‌ی استخر روی context بسته‌شده کاری نمی‌کنه
+        await page.context.close()
+        captured = time.perf_counter()
+        extracted = await run_parser(parse_cards, html, strategies, limit)
+        logger.info(f"⚡ Parsed {len(extracted['records'])}/{extracted['total']} {kind} cards offline "
+                    f"(strategy {extracted['strategy']}): capture {(captured - started) * 1000:.1f}ms, "
+                    f"parse {(time.perf_counter() - captured) * 1000:.1f}ms.")
+        return extracted
+    extracted = await page.evaluate(EXTRACT_CARDS_JS, {"strategies": strategies, "limit": limit})
+    logger.info(f"⚡ Extracted {len(extracted['records'])}/{extracted['total']} {kind} cards "
+                f"(strategy {extracted['strategy']}) in {(time.perf_counter() - started) * 1000:.1f}ms.")
+    return extracted
+
+
+def text_lines(text: str) -> list:
+    """خطوط غیر خالی متن کارت."""
+    return [line.strip() for line in (text or "").strip().split('\n') if line.strip()]
+
+
+# --- Benchmark ---
+
+def _synthetic_hotel_page(cards: int) -> str:
+    items = "".join(
+        f"<div class='HotelCard'><h3 class='HotelCard__name'>هتل نمونه {i}</h3>"
+        f"<span class='HotelCard__rating'>{4 + i % 10 / 10:.1f}</span>"
+        f"<div class='HotelCard__price'>{1_500_000 + i * 10_000:,} تومان / هر شب</div>"
+        f"<span class='HotelCard__location'>مرکز شهر</span></div>"
+        for i in range(cards)
+    )
+    return f"<html><body><div>نتایج هتل</div>{items}</body></html>"
+
+
+async def _legacy_extract(page, limit: int) -> list:
+    """روش قبلی: count و text_content برای هر فیلد هر کارت."""
+    cards = page.locator(".hotel-item, .HotelCard")
+    records = []
+    for i in range(min(await cards.count(), limit)):
+        card = cards.nth(i)
+        fields = {}
+        for name, selector in HOTEL_CARDS[0]["fields"].items():
+            element = card.locator(selector)
+            fields[name] = (await element.first.text_content(timeout=2000)).strip() if await element.count() > 0 else ""
+        records.append(fields)
+    return records
+
+
+async def bench(cards: int, runs: int, limit: int, cdp_url: str = None):
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        if cdp_url:
+            # مرورگری که از قبل با --remote-debugging-port بالا اومده
+            browser = await p.chromium.connect_over_cdp(cdp_url)
+            page = browser.contexts[0].pages[0] if browser.contexts and browser.contexts[0].pages else await browser.new_page()
+        else:
+            browser = await p.chromium.launch(headless=True)
+            page = await browser.new_page()
+        await page.set_content(_synthetic_hotel_page(cards))
+        for name, extract in (("per-locator", lambda: _legacy_extract(page, limit)),
+                              ("evaluate", lambda: extract_cards(page, "hotel", HOTEL_CARDS, limit))):
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                await extract()
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{name:<12} cards={cards:<4} limit={limit:<4} p50={statistics.median(timings):7.2f}ms "
+                  f"max={max(timings):7.2f}ms")
+        await browser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk DOM extraction.")
+    parser.add_argument("--bench", action="store_true", help="compare per-locator extraction with one evaluate")
+    parser.add_argument("--cards", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--cdp", default=None, help="benchmark a running Chromium (e.g. http://localhost:9222) instead of launching one")
+    args = parser.parse_args()
+    if args.bench:
+        logging.getLogger(__name__).setLevel(logging.WARNING)
+        asyncio.run(bench(args.cards, args.runs, args.limit, args.cdp))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
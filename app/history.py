@@ -0,0 +1,112 @@
+# app/history.py
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+from app.database import aget_history_window, aget_message_range, aset_summary
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- History window configuration ---
+# تعداد پیام‌های آخر که به ایجنت داده می‌شه
+HISTORY_WINDOW_MESSAGES = int(os.getenv("HISTORY_WINDOW_MESSAGES", "20"))
+# سقف تقریبی توکن برای پنجره (0 یعنی بدون سقف)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "0"))
+# خلاصه کردن پیام‌های قدیمی‌تر از پنجره در یک خلاصه‌ی در حال رشد
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "false").lower() == "true"
+# هر وقت این تعداد پیام بیرون از پنجره و خلاصه نشده جمع شد، خلاصه به‌روز می‌شه
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "10"))
+
+SUMMARY_PROMPT = """خلاصه‌ی فعلی گفتگو (ممکنه خالی باشه):
+{summary}
+
+پیام‌های جدید:
+{messages}
+
+یه خلاصه‌ی کوتاه و به‌روز (حداکثر ۱۰ خط، فارسی) از کل گفتگو بنویس که اطلاعات مهم مثل مبدا، مقصد، تاریخ‌ها، تعداد مسافر و درخواست‌های کاربر رو نگه داره."""
+
+# Background summary tasks (keep references so they are not garbage-collected)
+_summary_tasks = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """تخمین سرانگشتی تعداد توکن (حدود ۴ کاراکتر برای هر توکن)."""
+    return len(text or "") // 4 + 1
+
+
+def trim_to_token_budget(messages: list, budget: int) -> list:
+    """
+    نگه داشتن جدیدترین پیام‌ها تا سقف توکن؛ آخرین پیام همیشه می‌مونه.
+    Keep the newest messages that fit in the token budget; the last message is always kept.
+    """
+    if budget <= 0 or not messages:
+        return messages
+    kept, used = [], 0
+    for message in reversed(messages):
+        cost = estimate_tokens(message.get("content", ""))
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    return list(reversed(kept))
+
+
+async def aload_history(session_id: str) -> tuple:
+    """
+    پنجره‌ی آخر گفتگو برای ایجنت و تعداد پیام‌های کاربر.
+    Load the recent history window for the agent and the session's user-message count.
+
+    Returns (messages, user_message_count). If a running summary exists it is
+    prepended as a system message.
+    """
+    document = await aget_history_window(session_id, HISTORY_WINDOW_MESSAGES)
+    messages = trim_to_token_budget(document.get("messages", []), HISTORY_TOKEN_BUDGET)
+    summary = document.get("summary")
+    if summary:
+        messages = [{"role": "system", "content": f"خلاصه‌ی بخش‌های قبلی گفتگو:\n{summary}"}] + messages
+    return messages, document.get("user_message_count", 0)
+
+
+async def aupdate_summary(session_id: str, model_name: str):
+    """
+    اضافه کردن پیام‌هایی که از پنجره بیرون رفتن به خلاصه‌ی در حال رشد گفتگو.
+    Fold messages that have left the window into the session's running summary.
+    """
+    document = await aget_history_window(session_id, 1)
+    message_count = document.get("message_count", 0)
+    summarized_count = document.get("summarized_count", 0)
+    end = message_count - HISTORY_WINDOW_MESSAGES
+    if end - summarized_count < HISTORY_SUMMARY_BATCH:
+        return
+    older = await aget_message_range(session_id, summarized_count, end - summarized_count)
+    if not older:
+        return
+    # import تنبل برای جلوگیری از import حلقوی
+    from app.agent import get_llm
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+    prompt = SUMMARY_PROMPT.format(summary=document.get("summary") or "-", messages=transcript)
+    response = await get_llm(model_name).ainvoke(prompt)
+    await aset_summary(session_id, response.content, summarized_count + len(older))
+    logger.info(f"📝 Summarised messages {summarized_count}-{summarized_count + len(older)} of session {session_id}.")
+
+
+def schedule_summary_update(session_id: str, model_name: str):
+    """اجرای aupdate_summary در پس‌زمینه (اگه فعال باشه)، بدون معطل کردن جواب کاربر."""
+    if not HISTORY_SUMMARY_ENABLED:
+        return
+
+    async def run():
+        try:
+            await aupdate_summary(session_id, model_name)
+        except Exception as e:
+            logger.error(f"Error updating summary for session {session_id}: {e}")
+
+    task = asyncio.create_task(run())
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
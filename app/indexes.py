@@ -0,0 +1,210 @@
+# app/indexes.py
+"""
+مدیریت ایندکس‌های MongoDB: ساخت موقع شروع برنامه و گزارش استفاده / query plan.
+MongoDB index management: created at application startup, plus a usage / query-plan report.
+
+Usage:
+    python -m app.indexes            # create the indexes
+    python -m app.indexes --report   # $indexStats and explain() of the hot queries
+    python -m app.indexes --purge    # delete idle sessions together with their messages
+"""
+import os
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.database import async_chat_sessions_collection, message_store
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# session هایی که این مدت (روز) پیامی نداشتن خودکار پاک می‌شن (0 یعنی هیچ‌وقت)
+SESSION_TTL_DAYS = float(os.getenv("SESSION_TTL_DAYS", "30"))
+# فاصله‌ی بین دو بار پاک‌سازی session های بیکار (ثانیه)
+SESSION_PURGE_INTERVAL_SECONDS = float(os.getenv("SESSION_PURGE_INTERVAL_SECONDS", "3600"))
+SESSION_PURGE_BATCH = int(os.getenv("SESSION_PURGE_BATCH", "500"))
+
+
+def _ttl_seconds() -> int:
+    return int(SESSION_TTL_DAYS * 24 * 60 * 60)
+
+
+async def _create(collection, keys, **options):
+    """ساخت یه ایندکس؛ اگه با همون اسم و تنظیمات دیگه وجود داشته باشه، جایگزین می‌شه."""
+    try:
+        return await collection.create_index(keys, **options)
+    except OperationFailure as e:
+        # IndexOptionsConflict / IndexKeySpecsConflict: مثلاً TTL عوض شده
+        if e.code in (85, 86) and options.get("name"):
+            logger.warning(f"Recreating index {collection.name}.{options['name']}: {e}")
+            await collection.drop_index(options["name"])
+            return await collection.create_index(keys, **options)
+        raise
+
+
+async def _drop(collection, name: str):
+    try:
+        await collection.drop_index(name)
+        logger.info(f"Dropped index {collection.name}.{name}.")
+    except OperationFailure:
+        # ایندکس وجود نداره
+        pass
+
+
+async def ensure_indexes():
+    """
+    ساخت همه‌ی ایندکس‌های مورد نیاز (idempotent).
+    Create every index the app relies on; safe to run on every startup.
+    """
+    sessions = async_chat_sessions_collection
+    try:
+        # save_message (upsert) و همه‌ی خواندن‌های تاریخچه با session_id
+        await _create(sessions, [("session_id", ASCENDING)], name="session_id_unique", unique=True)
+    except OperationFailure as e:
+        # session_id تکراری از قبل: حداقل یه ایندکس غیر یکتا بساز تا collection scan نشه
+        logger.error(f"Could not create unique index on session_id (duplicates?): {e}")
+        await _create(sessions, [("session_id", ASCENDING)], name="session_id")
+
+    # TTL روی سن هر پیام، پیام‌های قدیمی session های فعال رو پاک می‌کرد و شمارنده‌ها با پیام‌ها نمی‌خوند؛
+    # حالا session و پیام‌هاش با هم توسط purge_idle_sessions پاک می‌شن
+    await _drop(sessions, "last_seen_at_ttl")
+    await _drop(message_store.messages, "created_at_ttl")
+    await _drop(message_store.buckets, "last_seen_at_ttl")
+    # last_seen_at با هر پیام به‌روز می‌شه: session های بیکار و کوئری‌های زمانی (session های اخیر)
+    await _create(sessions, [("last_seen_at", DESCENDING)], name="last_seen_at")
+
+    # session های هر کاربر (متادیتای app/session_store.py)
+    await _create(sessions, [("owner", ASCENDING), ("last_seen_at", DESCENDING)], name="owner_last_seen", sparse=True)
+
+    await message_store.ensure_indexes()
+    logger.info("✅ MongoDB indexes are in place.")
+
+
+async def _delete_messages(session_ids: list) -> int:
+    deleted = 0
+    for collection in (message_store.messages, message_store.buckets):
+        result = await collection.delete_many({"session_id": {"$in": session_ids}})
+        deleted += result.deleted_count
+    return deleted
+
+
+async def _purge_orphans() -> int:
+    """پیام‌هایی که session شون دیگه وجود نداره (مثلاً پاک شده با TTL قبلی)."""
+    deleted = 0
+    for collection in (message_store.messages, message_store.buckets):
+        session_ids = [doc["_id"] async for doc in collection.aggregate(
+            [{"$group": {"_id": "$session_id"}}], allowDiskUse=True)]
+        for i in range(0, len(session_ids), SESSION_PURGE_BATCH):
+            batch = session_ids[i:i + SESSION_PURGE_BATCH]
+            existing = {doc["session_id"] async for doc in async_chat_sessions_collection.find(
+                {"session_id": {"$in": batch}}, {"_id": 0, "session_id": 1})}
+            orphans = [session_id for session_id in batch if session_id not in existing]
+            if orphans:
+                deleted += await _delete_messages(orphans)
+    return deleted
+
+
+async def purge_idle_sessions(orphans: bool = True) -> dict:
+    """
+    پاک کردن session هایی که SESSION_TTL_DAYS روز پیامی نداشتن، همراه با همه‌ی پیام‌هاشون.
+    Delete sessions idle for SESSION_TTL_DAYS together with all of their messages.
+
+    Expiry is decided per session by last_seen_at, so an active session never
+    loses old messages and its counters keep matching the stored messages.
+    The session document is deleted first and only if it is still idle, then
+    its messages and buckets.
+    """
+    ttl = _ttl_seconds()
+    stats = {"sessions": 0, "messages": 0, "orphans": 0}
+    if ttl <= 0:
+        return stats
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl)
+    while True:
+        batch = [doc["session_id"] async for doc in async_chat_sessions_collection.find(
+            {"last_seen_at": {"$lt": cutoff}}, {"_id": 0, "session_id": 1}).limit(SESSION_PURGE_BATCH)]
+        if not batch:
+            break
+        # اگه وسط کار پیام جدیدی اومده باشه، last_seen_at تازه شده و session پاک نمی‌شه
+        result = await async_chat_sessions_collection.delete_many(
+            {"session_id": {"$in": batch}, "last_seen_at": {"$lt": cutoff}})
+        stats["sessions"] += result.deleted_count
+        stats["messages"] += await _delete_messages(batch)
+        if len(batch) < SESSION_PURGE_BATCH:
+            break
+    if orphans and message_store.mode != "embedded":
+        stats["orphans"] = await _purge_orphans()
+    if any(stats.values()):
+        logger.info(f"🧹 Purged idle sessions: {stats}")
+    return stats
+
+
+async def run_session_purge():
+    """پاک‌سازی دوره‌ای session های بیکار (تسک پس‌زمینه‌ی برنامه)."""
+    while True:
+        try:
+            await purge_idle_sessions()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Idle session purge failed: {e}", exc_info=True)
+        await asyncio.sleep(SESSION_PURGE_INTERVAL_SECONDS)
+
+
+def _plan_summary(plan: dict) -> str:
+    """خلاصه‌ی winning plan، مثل 'PROJECTION_SIMPLE <- FETCH <- IXSCAN(session_id_unique)'."""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+
+async def report():
+    """چاپ آمار استفاده از ایندکس‌ها و query plan کوئری‌های اصلی."""
+    collections = [async_chat_sessions_collection, message_store.messages, message_store.buckets]
+    for collection in collections:
+        print(f"\n📚 {collection.name}")
+        async for stat in collection.aggregate([{"$indexStats": {}}]):
+            print(f"  {stat['name']:<24} ops={stat['accesses']['ops']:<10} since={stat['accesses']['since']:%Y-%m-%d %H:%M}")
+
+    sample = await async_chat_sessions_collection.find_one({}, {"session_id": 1, "last_seen_at": 1}) or {}
+    session_id = sample.get("session_id", "missing")
+    queries = [
+        ("history window (embedded)", async_chat_sessions_collection.find({"session_id": session_id}, {"messages": {"$slice": -20}})),
+        ("messages tail (message)", message_store.messages.find({"session_id": session_id, "seq": {"$gte": 0}}).sort("seq", ASCENDING)),
+        ("buckets tail (bucket)", message_store.buckets.find({"session_id": session_id, "bucket": {"$gte": 0}}).sort("bucket", ASCENDING)),
+        ("idle sessions", async_chat_sessions_collection.find({"last_seen_at": {"$lt": sample.get("last_seen_at") or 0}})),
+    ]
+    print(f"\n🔎 Query plans (session_id={session_id})")
+    for name, cursor in queries:
+        explain = await cursor.explain()
+        plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stats = explain.get("executionStats", {})
+        examined = f" docsExamined={stats['totalDocsExamined']}" if "totalDocsExamined" in stats else ""
+        print(f"  {name:<28} {_plan_summary(plan)}{examined}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes or report their usage.")
+    parser.add_argument("--report", action="store_true", help="show $indexStats and query plans instead of creating indexes")
+    parser.add_argument("--purge", action="store_true", help="delete idle sessions and their messages once")
+    args = parser.parse_args()
+    if args.purge:
+        asyncio.run(purge_idle_sessions())
+    else:
+        asyncio.run(report() if args.report else ensure_indexes())
+
+
+if __name__ == "__main__":
+    main()
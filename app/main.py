@@ -4,10 +4,18 @@ from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 import os
+import asyncio
 from dotenv import load_dotenv
 
 from app.chat_router import chat_router
 from app.auth_router import auth_router
+from app.browser_pool import browser_pool
+from app.agent import aclose_http_clients, aopen_checkpointer, aclose_checkpointer
+from app.indexes import ensure_indexes, run_session_purge
+from app.database import aflush_messages
+from app.soup import shutdown_parser_pool
+from app.api_capture import close_api_client as close_search_api_client
+from app.prefetch import start_prefetch, stop_prefetch
 
 load_dotenv("./app/.env")
 
@@ -19,6 +27,63 @@ app = FastAPI(title="Smart Support Chatbot")
 def root():
     return RedirectResponse("/docs") # or return a simple message
 
+@app.on_event("startup")
+async def create_indexes():
+    # ایندکس session_id، last_seen_at و ایندکس‌های چیدمان پیام‌ها (app/indexes.py)
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_session_purge():
+    # پاک کردن session های بیکار همراه با پیام‌هاشون (SESSION_TTL_DAYS، app/indexes.py)
+    app.state.session_purge = asyncio.create_task(run_session_purge())
+
+@app.on_event("shutdown")
+async def stop_session_purge():
+    app.state.session_purge.cancel()
+
+@app.on_event("startup")
+async def open_checkpointer():
+    # state گفتگوی ایجنت (AGENT_CHECKPOINTER، app/agent.py)
+    await aopen_checkpointer()
+
+@app.on_event("startup")
+async def start_background_prefetch():
+    # گرم نگه داشتن cache مسیرها و سوال‌های پرتکرار (PREFETCH_ENABLED، app/prefetch.py)
+    start_prefetch()
+
+@app.on_event("shutdown")
+async def stop_background_prefetch():
+    await stop_prefetch()
+
+@app.on_event("shutdown")
+def close_browser_pool():
+    # بستن مرورگرهای گرم استخر Playwright
+    browser_pool.close()
+
+@app.on_event("shutdown")
+def close_api_client():
+    # بستن connection pool فراخوانی مستقیم API جستجو (app/api_capture.py)
+    close_search_api_client()
+
+@app.on_event("shutdown")
+def close_parser_pool():
+    # بستن process pool پارسرهای آفلاین (app/soup.py)
+    shutdown_parser_pool()
+
+@app.on_event("shutdown")
+async def flush_messages():
+    # نوشتن پیام‌های باقی‌مونده تو صف write-behind
+    await aflush_messages()
+
+@app.on_event("shutdown")
+async def close_checkpointer():
+    await aclose_checkpointer()
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    # بستن connection pool مشترک OpenRouter
+    await aclose_http_clients()
+
 @app.get("/favicon.ico")
 def favicon():
     return {}
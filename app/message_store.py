@@ -0,0 +1,219 @@
+# app/message_store.py
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- Storage layout ---
+# embedded: همه‌ی پیام‌ها تو آرایه‌ی messages سند session (رفتار قبلی)
+# message:  هر پیام یه سند جدا با کلید (session_id, seq)
+# bucket:   هر K پیام پشت سر هم تو یه سند (session_id, bucket)
+STORAGE_MODES = ("embedded", "message", "bucket")
+MESSAGE_STORAGE_MODE = os.getenv("MESSAGE_STORAGE_MODE", "embedded").lower()
+MESSAGE_BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", "50"))
+MESSAGES_COLLECTION_NAME = os.getenv("MESSAGES_COLLECTION_NAME", "chat_messages")
+BUCKETS_COLLECTION_NAME = os.getenv("BUCKETS_COLLECTION_NAME", "chat_message_buckets")
+
+
+def push_message_update(session_id: str, role: str, content: str) -> dict:
+    """
+    Update document for appending one message to the embedded array.
+    message_count / user_message_count are kept next to the array so the
+    20-message limit and the history window never need the whole array.
+    """
+    inc = {"message_count": 1}
+    if role == "user":
+        inc["user_message_count"] = 1
+    return {
+        "$push": {"messages": {"role": role, "content": content}},
+        "$inc": inc,
+        # last_seen_at drives the idle-session purge (app/indexes.py)
+        "$set": {"last_seen_at": datetime.now(timezone.utc)},
+        # If the document does not exist, create the session_id as well
+        "$setOnInsert": {"session_id": session_id, "has_counters": True}
+    }
+
+def embedded_append_update(session_id: str, messages: list) -> dict:
+    """Update document for appending several messages to the embedded array at once."""
+    inc = {"message_count": len(messages)}
+    user_count = sum(1 for m in messages if m["role"] == "user")
+    if user_count:
+        inc["user_message_count"] = user_count
+    return {
+        "$push": {"messages": {"$each": [{"role": m["role"], "content": m["content"]} for m in messages]}},
+        "$inc": inc,
+        "$set": {"last_seen_at": datetime.now(timezone.utc)},
+        "$setOnInsert": {"session_id": session_id, "has_counters": True}
+    }
+
+# Sessions written before the counters existed get them computed once from the array, atomically.
+BACKFILL_COUNTERS = [{"$set": {
+    "message_count": {"$size": {"$ifNull": ["$messages", []]}},
+    "user_message_count": {"$size": {"$filter": {
+        "input": {"$ifNull": ["$messages", []]},
+        "cond": {"$eq": ["$$this.role", "user"]}
+    }}},
+    "has_counters": True
+}}]
+
+# Fields of the session document returned with a history window
+SESSION_FIELDS = {"_id": 0, "message_count": 1, "user_message_count": 1, "has_counters": 1,
+                  "summary": 1, "summarized_count": 1}
+
+
+def _strip(message: dict) -> dict:
+    return {"role": message["role"], "content": message["content"]}
+
+
+class MessageStore:
+    """
+    ذخیره و خواندن پیام‌های گفتگو با یکی از سه چیدمان embedded / message / bucket.
+    Stores and reads chat messages in one of three layouts: embedded, message or bucket.
+
+    In every layout the session document (chat_sessions_collection) keeps the
+    counters and the summary. In the message and bucket layouts the counter
+    update also hands out the message's sequence number, so the session
+    document never grows with the conversation.
+    """
+
+    def __init__(self, sessions, messages, buckets, mode: str = MESSAGE_STORAGE_MODE,
+                 bucket_size: int = MESSAGE_BUCKET_SIZE):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown MESSAGE_STORAGE_MODE '{mode}', expected one of {STORAGE_MODES}.")
+        self.sessions = sessions
+        self.messages = messages
+        self.buckets = buckets
+        self.mode = mode
+        self.bucket_size = max(1, bucket_size)
+
+    async def ensure_indexes(self):
+        """ایندکس‌های مرکب (session_id, seq) و (session_id, bucket)."""
+        await self.messages.create_index([("session_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+        await self.buckets.create_index([("session_id", ASCENDING), ("bucket", ASCENDING)], unique=True)
+
+    async def _next_seq(self, session_id: str, role: str) -> int:
+        inc = {"message_count": 1}
+        if role == "user":
+            inc["user_message_count"] = 1
+        document = await self.sessions.find_one_and_update(
+            {"session_id": session_id},
+            {"$inc": inc, "$set": {"last_seen_at": datetime.now(timezone.utc)},
+             "$setOnInsert": {"session_id": session_id, "has_counters": True, "storage_mode": self.mode}},
+            projection={"message_count": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return document["message_count"] - 1
+
+    async def append(self, session_id: str, role: str, content: str):
+        if self.mode == "embedded":
+            await self.sessions.update_one({"session_id": session_id}, push_message_update(session_id, role, content), upsert=True)
+            return
+        seq = await self._next_seq(session_id, role)
+        message = {"seq": seq, "role": role, "content": content, "created_at": datetime.now(timezone.utc)}
+        if self.mode == "message":
+            await self.messages.insert_one({"session_id": session_id, **message})
+        else:
+            await self.buckets.update_one(
+                {"session_id": session_id, "bucket": seq // self.bucket_size},
+                {"$push": {"messages": message}, "$inc": {"count": 1}, "$set": {"last_seen_at": message["created_at"]}},
+                upsert=True
+            )
+
+    async def append_many(self, session_id: str, messages: list):
+        """
+        اضافه کردن چند پیام یک session با کمترین رفت و برگشت (برای write-behind).
+        Append several messages of one session in as few round-trips as possible.
+        """
+        if not messages:
+            return
+        now = datetime.now(timezone.utc)
+        inc = {"message_count": len(messages)}
+        user_count = sum(1 for m in messages if m["role"] == "user")
+        if user_count:
+            inc["user_message_count"] = user_count
+        if self.mode == "embedded":
+            await self.sessions.update_one({"session_id": session_id}, embedded_append_update(session_id, messages), upsert=True)
+            return
+        # رزرو یه بازه‌ی seq با یه $inc
+        document = await self.sessions.find_one_and_update(
+            {"session_id": session_id},
+            {"$inc": inc, "$set": {"last_seen_at": now},
+             "$setOnInsert": {"session_id": session_id, "has_counters": True, "storage_mode": self.mode}},
+            projection={"message_count": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        first_seq = document["message_count"] - len(messages)
+        records = [{"seq": first_seq + i, "role": m["role"], "content": m["content"], "created_at": now}
+                   for i, m in enumerate(messages)]
+        if self.mode == "message":
+            await self.messages.insert_many([{"session_id": session_id, **r} for r in records], ordered=True)
+            return
+        by_bucket = {}
+        for record in records:
+            by_bucket.setdefault(record["seq"] // self.bucket_size, []).append(record)
+        await self.buckets.bulk_write([
+            UpdateOne({"session_id": session_id, "bucket": bucket},
+                      {"$push": {"messages": {"$each": chunk}}, "$inc": {"count": len(chunk)}, "$set": {"last_seen_at": now}},
+                      upsert=True)
+            for bucket, chunk in by_bucket.items()
+        ], ordered=False)
+
+    async def _read_range(self, session_id: str, start: int, end: int) -> list:
+        """پیام‌های با seq در بازه‌ی [start, end) به ترتیب."""
+        if end <= start:
+            return []
+        if self.mode == "message":
+            cursor = self.messages.find(
+                {"session_id": session_id, "seq": {"$gte": start, "$lt": end}},
+                {"_id": 0, "role": 1, "content": 1}
+            ).sort("seq", ASCENDING)
+            return [_strip(m) async for m in cursor]
+        cursor = self.buckets.find(
+            {"session_id": session_id, "bucket": {"$gte": start // self.bucket_size, "$lte": (end - 1) // self.bucket_size}},
+            {"_id": 0, "messages": 1}
+        ).sort("bucket", ASCENDING)
+        messages = [m async for bucket in cursor for m in bucket["messages"] if start <= m["seq"] < end]
+        # push های همزمان ممکنه داخل یه bucket جابجا ذخیره بشن
+        messages.sort(key=lambda m: m["seq"])
+        return [_strip(m) for m in messages]
+
+    async def window(self, session_id: str, limit: int) -> dict:
+        """
+        آخرین limit پیام به همراه شمارنده‌ها و خلاصه‌ی session.
+        The last `limit` messages plus the session's counters and summary.
+        """
+        if self.mode == "embedded":
+            projection = {**SESSION_FIELDS, "messages": {"$slice": -limit}}
+            document = await self.sessions.find_one({"session_id": session_id}, projection)
+            if document and not document.get("has_counters"):
+                await self.sessions.update_one({"session_id": session_id, "has_counters": {"$ne": True}}, BACKFILL_COUNTERS)
+                document = await self.sessions.find_one({"session_id": session_id}, projection)
+            return document or {}
+        document = await self.sessions.find_one({"session_id": session_id}, SESSION_FIELDS)
+        if not document:
+            return {}
+        count = document.get("message_count", 0)
+        document["messages"] = await self._read_range(session_id, max(0, count - limit), count)
+        return document
+
+    async def range(self, session_id: str, skip: int, limit: int) -> list:
+        """limit پیام از اندیس skip به بعد."""
+        if self.mode == "embedded":
+            document = await self.sessions.find_one({"session_id": session_id}, {"_id": 0, "messages": {"$slice": [skip, limit]}})
+            return document.get("messages", []) if document else []
+        return await self._read_range(session_id, skip, skip + limit)
+
+    async def all(self, session_id: str) -> list:
+        """کل تاریخچه‌ی session."""
+        if self.mode == "embedded":
+            document = await self.sessions.find_one({"session_id": session_id}, {"_id": 0, "messages": 1})
+            return document.get("messages", []) if document else []
+        document = await self.sessions.find_one({"session_id": session_id}, {"message_count": 1})
+        if not document:
+            return []
+        return await self._read_range(session_id, 0, document.get("message_count", 0))
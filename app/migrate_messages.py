@@ -0,0 +1,101 @@
+# app/migrate_messages.py
+"""
+مهاجرت پیام‌ها از چیدمان embedded (آرایه‌ی messages داخل سند session) به چیدمان message یا bucket.
+Migrate chat messages from the embedded layout to the message or bucket layout.
+
+Usage:
+    python -m app.migrate_messages --mode message
+    python -m app.migrate_messages --mode bucket --bucket-size 50 --drop-embedded
+
+Run it while the app is stopped: messages appended to a session during its
+copy would be missed. Safe to re-run: message and bucket documents are
+upserted by (session_id, seq) and (session_id, bucket). The embedded array
+is only removed with --drop-embedded.
+Set MESSAGE_STORAGE_MODE to the same mode once the migration has finished.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+
+from app.database import async_chat_sessions_collection, async_db
+from app.message_store import MessageStore, MESSAGES_COLLECTION_NAME, BUCKETS_COLLECTION_NAME, MESSAGE_BUCKET_SIZE
+
+
+def _message_ops(session_id: str, messages: list, created_at: datetime) -> list:
+    return [
+        UpdateOne(
+            {"session_id": session_id, "seq": seq},
+            {"$setOnInsert": {"session_id": session_id, "seq": seq, "role": m["role"], "content": m["content"], "created_at": created_at}},
+            upsert=True
+        )
+        for seq, m in enumerate(messages)
+    ]
+
+
+def _bucket_ops(session_id: str, messages: list, created_at: datetime, bucket_size: int) -> list:
+    ops = []
+    for start in range(0, len(messages), bucket_size):
+        chunk = [
+            {"seq": start + i, "role": m["role"], "content": m["content"], "created_at": created_at}
+            for i, m in enumerate(messages[start:start + bucket_size])
+        ]
+        ops.append(UpdateOne(
+            {"session_id": session_id, "bucket": start // bucket_size},
+            {"$set": {"messages": chunk, "count": len(chunk)}},
+            upsert=True
+        ))
+    return ops
+
+
+async def migrate(mode: str, bucket_size: int = MESSAGE_BUCKET_SIZE, drop_embedded: bool = False) -> dict:
+    store = MessageStore(async_chat_sessions_collection, async_db[MESSAGES_COLLECTION_NAME],
+                         async_db[BUCKETS_COLLECTION_NAME], mode=mode, bucket_size=bucket_size)
+    await store.ensure_indexes()
+    stats = {"sessions": 0, "messages": 0}
+    created_at = datetime.now(timezone.utc)
+
+    cursor = async_chat_sessions_collection.find(
+        {"messages.0": {"$exists": True}, "storage_mode": {"$ne": mode}},
+        {"session_id": 1, "messages": 1}
+    )
+    async for document in cursor:
+        session_id = document["session_id"]
+        messages = document["messages"]
+        if mode == "message":
+            ops = _message_ops(session_id, messages, created_at)
+            await store.messages.bulk_write(ops, ordered=False)
+        else:
+            ops = _bucket_ops(session_id, messages, created_at, bucket_size)
+            await store.buckets.bulk_write(ops, ordered=False)
+
+        update = {"$set": {
+            "storage_mode": mode,
+            "has_counters": True,
+            "message_count": len(messages),
+            "user_message_count": sum(1 for m in messages if m["role"] == "user")
+        }}
+        if drop_embedded:
+            update["$unset"] = {"messages": ""}
+        await async_chat_sessions_collection.update_one({"_id": document["_id"]}, update)
+        stats["sessions"] += 1
+        stats["messages"] += len(messages)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chat messages out of the embedded session array.")
+    parser.add_argument("--mode", choices=["message", "bucket"], required=True)
+    parser.add_argument("--bucket-size", type=int, default=MESSAGE_BUCKET_SIZE)
+    parser.add_argument("--drop-embedded", action="store_true", help="remove the messages array after copying it")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = asyncio.run(migrate(args.mode, args.bucket_size, args.drop_embedded))
+    print(f"✅ Migrated {stats['messages']} messages in {stats['sessions']} sessions to '{args.mode}' "
+          f"in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
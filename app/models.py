@@ -1,6 +1,6 @@
 ### app/models.py
 from pydantic import BaseModel, EmailStr, field_validator, Field
-from typing import List, Optional, TypedDict
+from typing import List, Literal, Optional, TypedDict
 
 class Message(BaseModel):
     role: str  # 'user', 'assistant', 'system', etc.
@@ -62,13 +62,28 @@ class SearchInput(BaseModel):
     """Input schema for general search tools."""
     query: str = Field(description="کلمات کلیدی برای جستجو")
 
-class TrainScheduleSearchInput(BaseModel):
+class MultiSectionSearchInput(BaseModel):
+    """Input schema for searching several alibaba.ir sections at once."""
+    query: str = Field(description="کلمات کلیدی برای جستجو")
+    sections: List[str] = Field(description="بخش‌هایی که باید همزمان جستجو بشن، از بین: general, faq, magazine, profile, flights_domestic, flights_international, trains, buses, tours, hotels, accommodations, visa, insurance")
+
+class ScheduleFilters(BaseModel):
+    """Server-side sort / filter / top-k options shared by the schedule searches."""
+    sort_by: Optional[Literal["price", "departure", "arrival", "duration", "seats"]] = Field(
+        default=None, description="مرتب‌سازی نتایج: price (ارزان‌ترین)، departure، arrival، duration (کوتاه‌ترین)، seats (بیشترین صندلی)")
+    max_price: Optional[int] = Field(default=None, description="حداکثر قیمت به تومان")
+    depart_after: Optional[str] = Field(default=None, description="حرکت از این ساعت به بعد (مثلاً 08:00)")
+    depart_before: Optional[str] = Field(default=None, description="حرکت تا این ساعت (مثلاً 14:00)")
+    min_seats: Optional[int] = Field(default=None, description="حداقل تعداد صندلی خالی")
+    top_k: int = Field(default=5, ge=1, le=20, description="تعداد نتایجی که برگردونده می‌شه")
+
+class TrainScheduleSearchInput(ScheduleFilters):
     """Input schema for train schedule search."""
     origin: str = Field(description="نام شهر مبدا (مثلاً تهران)")
     destination: str = Field(description="نام شهر مقصد (مثلاً مشهد)")
     date: str = Field(description="تاریخ سفر (مثلاً 1403/05/10)")
 
-class FlightScheduleSearchInput(BaseModel):
+class FlightScheduleSearchInput(ScheduleFilters):
     """Input schema for domestic flight search."""
     origin: str = Field(description="نام شهر مبدا (مثلاً تهران)")
     destination: str = Field(description="نام شهر مقصد (مثلاً مشهد)")
@@ -86,6 +101,25 @@ class VillaSearchInput(BaseModel):
     checkin_date: str = Field(description="تاریخ ورود (مثلاً 1403/05/10)")
     checkout_date: str = Field(description="تاریخ خروج (مثلاً 1403/05/12)")
 
+class TourSearchInput(BaseModel):
+    """Input schema for tour search."""
+    origin: str = Field(description="نام شهر مبدا (مثلاً تهران)")
+    destination: str = Field(description="نام شهر یا کشور مقصد (مثلاً کیش)")
+    start_date: str = Field(description="تاریخ رفت (مثلاً 1403/05/10)")
+    end_date: str = Field(description="تاریخ برگشت (مثلاً 1403/05/15)")
+
 class FAQSearchInput(BaseModel):
     """Input schema for FAQ search."""
     question: str = Field(description="سوالی که کاربر داره")
+
+# --- Result Records for Agent Tools ---
+# خروجی ساختاریافته‌ی ابزارهای زمانبندی (پرواز، قطار، اتوبوس)
+
+class ScheduleRecord(BaseModel):
+    """One scraped flight / train / bus option."""
+    carrier: str = ""                        # ایرلاین، شرکت ریلی یا تعاونی
+    departure: Optional[str] = None          # HH:MM
+    arrival: Optional[str] = None            # HH:MM
+    price_toman: Optional[int] = None
+    seats_left: Optional[int] = None
+    duration_minutes: Optional[int] = None
@@ -1,1210 +1,1152 @@
 # app/playwright.py
-import asyncio
-from playwright.sync_api import sync_playwright
+import os
 import logging
 import regex
 
+from app.browser_pool import browser_pool, on_engine_loop, run_sync
+from app.waits import StepWaits, RESULTS_TIMEOUT_MS
+from app.result_cache import cached_tool, route_key, stay_key, tour_key, faq_key
+from app.extraction import (
+    extract_cards,
+    save_snapshot,
+    text_lines,
+    SCRAPER_PARSE_MODE,
+    SCRAPER_SNAPSHOT_DIR,
+    FLIGHT_CARDS,
+    TRAIN_CARDS,
+    BUS_CARDS,
+    HOTEL_CARDS,
+    VILLA_CARDS,
+    TOUR_CARDS,
+    HOTEL_RESULTS_MARKER,
+    TOUR_RESULTS_MARKER
+)
+from app.schedules import parse_schedule, render_schedules, SCHEDULE_MAX_RECORDS
+from app.soup import run_parser, parse_faq_answer
+from app.api_capture import ApiCapture, fetch_direct
+from app.url_builder import (
+    flight_results_url,
+    train_results_url,
+    bus_results_url,
+    hotel_results_url,
+    villa_results_url,
+    tour_results_url,
+    normalize_jalali_date
+)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def search_faq_simple(question: str, category: str = "پرواز داخلی") -> str:
+# حداکثر زمان انتظار برای نتایج روی آدرس مستقیم، قبل از برگشتن به فرم
+DIRECT_RESULTS_TIMEOUT_MS = int(os.getenv("SCRAPER_DIRECT_RESULTS_TIMEOUT_MS", "15000"))
+
+async def _goto_results_directly(page, waits: StepWaits, url: str, results_marker) -> bool:
+    """
+    تلاش برای باز کردن مستقیم صفحه نتایج (بدون پر کردن فرم).
+    Try to open the results page directly; returns False so the caller falls back to the form flow.
+    """
+    if not url:
+        return False
+    logger.info(f"Navigating directly to results: {url}")
+    try:
+        await page.goto(url, wait_until='domcontentloaded')
+    except Exception as e:
+        logger.warning(f"Direct results URL failed to load: {e}")
+        return False
+    if await waits.visible("direct_results", results_marker, timeout_ms=DIRECT_RESULTS_TIMEOUT_MS, required=False):
+        return True
+    logger.warning(f"No results on direct URL {url}. Falling back to the search form...")
+    return False
+
+
+def _picker_day(jalali: str) -> str:
+    """
+    روز تقویم فرم جستجو (بدون صفر اول) از تاریخ نرمال‌شده‌ی 'YYYY-MM-DD'.
+    Day-of-month label clicked in the search form's date picker.
+    """
+    return str(int(jalali.split("-")[2]))
+
+
+def _invalid_date(value: str) -> str:
+    return f"❌ تاریخ «{value}» معتبر نیست. لطفاً تاریخ رو به شکل 1403/07/15 یا «امروز»/«فردا» بدید."
+
+async def _search_faq_on_page(page, waits: StepWaits, question: str, category: str) -> str:
+    """
+    بدنه‌ی جستجوی تعاملی FAQ روی صفحه‌ای که استخر مرورگر می‌ده.
+    Interactive FAQ search body, run on a page handed out by the browser pool.
+    """
+    url = "https://www.alibaba.ir/help-center/categories/faq"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === انتخاب دسته ===
+    logger.info(f"Selecting category: {category}")
+    # استفاده از selector از recorder
+    # توجه: بعضی اوقات لینک‌ها ممکنه دقیقاً مطابقت نداشته باشن، یا نیاز به کلیک خاصی داشته باشن.
+    # از کد codegen: await page.getByRole('link', { name: 'اتوبوس', exact: true }).click();
+    category_link = page.get_by_role("link", name=category, exact=True)
+    if await category_link.count() > 0:
+        await category_link.click()
+        # صبر تا سوالات دسته ظاهر بشن (نه sleep ثابت)
+        await waits.visible("category_questions", page.get_by_text(question), required=False)
+    else:
+        logger.warning(f"Category '{category}' not found with exact match. Trying partial match...")
+        # اگه مطابقت دقیق نبود، مطابقت جزئی رو امتحان کن
+        category_link_partial = page.get_by_role("link").filter(has_text=category)
+        if await category_link_partial.count() > 0:
+             await category_link_partial.first.click()
+             await waits.visible("category_questions", page.get_by_text(question), required=False)
+        else:
+             logger.warning(f"Category '{category}' not found with partial match either. Proceeding without category selection.")
+             # اگه دسته پیدا نشد، سعی می‌کنیم تو همه سوالات جستجو کنیم
+             # یا می‌تونیم یه پیام خطا برگردونیم
+
+    # === جستجوی سوال ===
+    # روش 1: جستجوی متنی در بین سوالات موجود
+    # فرض کنیم سوالات تو المنت‌های <summary> هستن (همونطور که تو کد codegen دیدیم)
+    logger.info("Searching for question in the list...")
+    # از کد codegen: await page.getByText('میزان بار مجاز هر مسافر در سفر با اتوبوس داخلی چقدر است؟').click();
+    # یعنی سوالات تو یه المنت متنی ساده هستن، نه لزوماً summary.
+    # پس بهتره از has_text استفاده کنیم.
+    
+    # روش پیشنهادی: جستجو برای المنتی که متن سوال کاربر رو داره.
+    # این روش انعطاف بیشتری می‌ده.
+    matching_question_element = page.get_by_text(question)
+    if await matching_question_element.count() > 0:
+        logger.info(f"Found matching question element. Clicking...")
+        await matching_question_element.first.click()
+        # صبر تا پاسخ زیر سوال باز بشه
+        await waits.visible("answer_expanded", matching_question_element.first.locator('xpath=following::*[self::p or self::div][1]'), required=False)
+
+        # === استخراج پاسخ ===
+        # بعد از کلیک روی سوال، پاسخ ظاهر می‌شه.
+        # باید المنتی که پاسخ توشه رو پیدا کنیم.
+        # از کد codegen: await page.getByText('طبق قوانین سازمان حمل‌ونقل، میزان بار مجاز 20').click();
+        # یعنی پاسخ هم یه متن ساده هست.
+        # یه راه خوب اینه که المنت بعدی از سوال رو پیدا کنیم یا المنتی که بعد از سوال ظاهر می‌شه.
+        # ولی این کمی tricky هست.
+        # راه ساده‌تر: گرفتن تمام متن صفحه بعد از کلیک و استخراج متن اطراف سوال.
+        # یا اینکه سعی کنیم المنتی که حاوی پاسخ هست رو پیدا کنیم.
+        
+        # فرض: پاسخ تو یه المنت بعدی یا یه المنت با کلاس خاص هست.
+        # اما چون ساختار دقیق رو نمی‌دونیم، می‌تونیم یه روش عمومی‌تر استفاده کنیم.
+        # مثلاً گرفتن متن کل صفحه و استخراج متن بعد از سوال.
+        # ولی بهتره سعی کنیم یه المنت منطقی پیدا کنیم.
+        
+        # روش ساده: گرفتن متن المنتی که کلیک کردیم + متن المنت‌های بعدی
+        # ولی بهتره یه کم هوشمندانه‌تر عمل کنیم.
+        # فرض کنیم پاسخ تو یه div یا p بعد از سوال هست.
+        # می‌تونیم از xpath استفاده کنیم تا المنت بعدی رو پیدا کنیم.
+        # ولی برای سادگی، یه روش دیگه:
+        # گرفتن محتوای کل صفحه و جستجوی متن سوال، بعد استخراج متن بعد از اون.
+        
+        # راه بهتر: استفاده از والد سوال و پیدا کردن پاسخ نسبت به اون.
+        # ولی چون سوال یه text element هست، والدش رو می‌گیریم.
+        parent_of_question = matching_question_element.first.locator('xpath=..')
+        # حالا سعی می‌کنیم پاسخ رو تو والد یا فرزندان والد پیدا کنیم.
+        # این کمی سخته بدون دیدن ساختار دقیق DOM.
+        
+        # حالت offline: پارس snapshot صفحه با app/soup.py تو process pool
+        if SCRAPER_PARSE_MODE == "offline" or SCRAPER_SNAPSHOT_DIR:
+            html = await page.content()
+            if SCRAPER_SNAPSHOT_DIR:
+                save_snapshot("faq", html)
+            if SCRAPER_PARSE_MODE == "offline":
+                answer_clean = await run_parser(parse_faq_answer, html, question)
+                if answer_clean:
+                    return f"سؤال: {question}\nپاسخ: {answer_clean}"
+                logger.warning("Offline parser found no answer text. Trying the live page...")
+
+        # راه عملی: گرفتن متن کل صفحه و جستجو
+        full_page_text = await page.text_content("body")
+        if full_page_text:
+            question_index = full_page_text.find(question)
+            if question_index != -1:
+                # شروع جستجو از بعد از سوال
+                start_extract_index = question_index + len(question)
+                # گرفتن چند کاراکتر بعدی (مثلاً 500 تا)
+                answer_snippet = full_page_text[start_extract_index:start_extract_index + 500].strip()
+                # حذف خطوط خالی اولیه
+                answer_lines = answer_snippet.split('\n')
+                answer_lines = [line.strip() for line in answer_lines if line.strip()]
+                answer_clean = "\n".join(answer_lines[:5]) # مثلاً 5 خط اول غیر خالی
+                if answer_clean:
+                    return f"سؤال: {question}\nپاسخ: {answer_clean}"
+                else:
+                    logger.warning("Could not extract clean answer text.")
+            else:
+                logger.warning("Question text not found in full page text (unexpected).")
+        else:
+            logger.warning("Could not get full page text content.")
+
+        # اگه روش بالا جواب نداد، یه fallback ساده:
+        # گرفتن متن چند تا از المنت‌های بعدی
+        try:
+            # فرض: پاسخ تو یه p یا div بعد از سوال هست
+            # این روش ممکنه نیاز به تنظیم بیشتری داشته باشه
+            next_elements = parent_of_question.locator('xpath=following::*[self::p or self::div]') # یا سلکتورهای دیگه
+            if await next_elements.count() > 0:
+                 answer_text = await next_elements.first.text_content()
+                 if answer_text:
+                      return f"سؤال: {question}\nپاسخ (Fallback): {answer_text.strip()[:200]}..." # فقط 200 کاراکتر اول
+        except Exception as e_fallback:
+             logger.error(f"Fallback method for answer extraction also failed: {e_fallback}")
+
+        return f"سؤال: {question}\nپاسخ: (نتونستم متن پاسخ رو استخراج کنم، ولی سوال پیدا شد.)"
+    else:
+        return f"برای سوال '{question}' در دسته '{category}' سوال مرتبطی پیدا نکردم."
+
+
+@on_engine_loop
+@cached_tool("faq", faq_key)
+async def search_faq_async(question: str, category: str = "پرواز داخلی") -> str:
     """
-    نسخه ساده (sync) از جستجوی تعاملی FAQ.
-    Simple (sync) version of interactive FAQ search.
+    نسخه async از جستجوی تعاملی FAQ (روی event loop موتور Playwright).
+    Async interactive FAQ search, driven on the Playwright engine loop.
     """
     if not category:
         category = "پرواز داخلی" # دسته‌ی پیش‌فرض
     logger.info(f"Starting FAQ search for question: '{question}' in category: '{category}'")
 
+    waits = StepWaits("faq")
     try:
-        with sync_playwright() as p:
-            # برای دیباگ می‌تونی headless=False بذاری
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/help-center/categories/faq"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === انتخاب دسته ===
-            logger.info(f"Selecting category: {category}")
-            # استفاده از selector از recorder
-            # توجه: بعضی اوقات لینک‌ها ممکنه دقیقاً مطابقت نداشته باشن، یا نیاز به کلیک خاصی داشته باشن.
-            # از کد codegen: await page.getByRole('link', { name: 'اتوبوس', exact: true }).click();
-            category_link = page.get_by_role("link", name=category, exact=True)
-            if category_link.count() > 0:
-                category_link.click()
-                page.wait_for_timeout(1000) # صبر کمی برای بارگذاری سوالات
-            else:
-                logger.warning(f"Category '{category}' not found with exact match. Trying partial match...")
-                # اگه مطابقت دقیق نبود، مطابقت جزئی رو امتحان کن
-                category_link_partial = page.get_by_role("link").filter(has_text=category)
-                if category_link_partial.count() > 0:
-                     category_link_partial.first.click()
-                     page.wait_for_timeout(1000)
-                else:
-                     logger.warning(f"Category '{category}' not found with partial match either. Proceeding without category selection.")
-                     # اگه دسته پیدا نشد، سعی می‌کنیم تو همه سوالات جستجو کنیم
-                     # یا می‌تونیم یه پیام خطا برگردونیم
-
-            # === جستجوی سوال ===
-            # روش 1: جستجوی متنی در بین سوالات موجود
-            # فرض کنیم سوالات تو المنت‌های <summary> هستن (همونطور که تو کد codegen دیدیم)
-            logger.info("Searching for question in the list...")
-            # از کد codegen: await page.getByText('میزان بار مجاز هر مسافر در سفر با اتوبوس داخلی چقدر است؟').click();
-            # یعنی سوالات تو یه المنت متنی ساده هستن، نه لزوماً summary.
-            # پس بهتره از has_text استفاده کنیم.
-            
-            # روش پیشنهادی: جستجو برای المنتی که متن سوال کاربر رو داره.
-            # این روش انعطاف بیشتری می‌ده.
-            matching_question_element = page.get_by_text(question)
-            if matching_question_element.count() > 0:
-                logger.info(f"Found matching question element. Clicking...")
-                matching_question_element.first.click()
-                page.wait_for_timeout(1000) # صبر کمی برای باز شدن پاسخ
-
-                # === استخراج پاسخ ===
-                # بعد از کلیک روی سوال، پاسخ ظاهر می‌شه.
-                # باید المنتی که پاسخ توشه رو پیدا کنیم.
-                # از کد codegen: await page.getByText('طبق قوانین سازمان حمل‌ونقل، میزان بار مجاز 20').click();
-                # یعنی پاسخ هم یه متن ساده هست.
-                # یه راه خوب اینه که المنت بعدی از سوال رو پیدا کنیم یا المنتی که بعد از سوال ظاهر می‌شه.
-                # ولی این کمی tricky هست.
-                # راه ساده‌تر: گرفتن تمام متن صفحه بعد از کلیک و استخراج متن اطراف سوال.
-                # یا اینکه سعی کنیم المنتی که حاوی پاسخ هست رو پیدا کنیم.
-                
-                # فرض: پاسخ تو یه المنت بعدی یا یه المنت با کلاس خاص هست.
-                # اما چون ساختار دقیق رو نمی‌دونیم، می‌تونیم یه روش عمومی‌تر استفاده کنیم.
-                # مثلاً گرفتن متن کل صفحه و استخراج متن بعد از سوال.
-                # ولی بهتره سعی کنیم یه المنت منطقی پیدا کنیم.
-                
-                # روش ساده: گرفتن متن المنتی که کلیک کردیم + متن المنت‌های بعدی
-                # ولی بهتره یه کم هوشمندانه‌تر عمل کنیم.
-                # فرض کنیم پاسخ تو یه div یا p بعد از سوال هست.
-                # می‌تونیم از xpath استفاده کنیم تا المنت بعدی رو پیدا کنیم.
-                # ولی برای سادگی، یه روش دیگه:
-                # گرفتن محتوای کل صفحه و جستجوی متن سوال، بعد استخراج متن بعد از اون.
-                
-                # راه بهتر: استفاده از والد سوال و پیدا کردن پاسخ نسبت به اون.
-                # ولی چون سوال یه text element هست، والدش رو می‌گیریم.
-                parent_of_question = matching_question_element.first.locator('xpath=..')
-                # حالا سعی می‌کنیم پاسخ رو تو والد یا فرزندان والد پیدا کنیم.
-                # این کمی سخته بدون دیدن ساختار دقیق DOM.
-                
-                # راه عملی: گرفتن متن کل صفحه و جستجو
-                full_page_text = page.text_content("body")
-                if full_page_text:
-                    question_index = full_page_text.find(question)
-                    if question_index != -1:
-                        # شروع جستجو از بعد از سوال
-                        start_extract_index = question_index + len(question)
-                        # گرفتن چند کاراکتر بعدی (مثلاً 500 تا)
-                        answer_snippet = full_page_text[start_extract_index:start_extract_index + 500].strip()
-                        # حذف خطوط خالی اولیه
-                        answer_lines = answer_snippet.split('\n')
-                        answer_lines = [line.strip() for line in answer_lines if line.strip()]
-                        answer_clean = "\n".join(answer_lines[:5]) # مثلاً 5 خط اول غیر خالی
-                        if answer_clean:
-                            browser.close()
-                            logger.info("Browser closed (FAQ SIMPLE).")
-                            return f"سؤال: {question}\nپاسخ: {answer_clean}"
-                        else:
-                            logger.warning("Could not extract clean answer text.")
-                    else:
-                        logger.warning("Question text not found in full page text (unexpected).")
-                else:
-                    logger.warning("Could not get full page text content.")
-
-                # اگه روش بالا جواب نداد، یه fallback ساده:
-                # گرفتن متن چند تا از المنت‌های بعدی
-                try:
-                    # فرض: پاسخ تو یه p یا div بعد از سوال هست
-                    # این روش ممکنه نیاز به تنظیم بیشتری داشته باشه
-                    next_elements = parent_of_question.locator('xpath=following::*[self::p or self::div]') # یا سلکتورهای دیگه
-                    if next_elements.count() > 0:
-                         answer_text = next_elements.first.text_content()
-                         if answer_text:
-                              browser.close()
-                              logger.info("Browser closed (FAQ SIMPLE).")
-                              return f"سؤال: {question}\nپاسخ (Fallback): {answer_text.strip()[:200]}..." # فقط 200 کاراکتر اول
-                except Exception as e_fallback:
-                     logger.error(f"Fallback method for answer extraction also failed: {e_fallback}")
-
-                browser.close()
-                logger.info("Browser closed (FAQ SIMPLE).")
-                return f"سؤال: {question}\nپاسخ: (نتونستم متن پاسخ رو استخراج کنم، ولی سوال پیدا شد.)"
-            else:
-                browser.close()
-                logger.info("Browser closed (FAQ SIMPLE).")
-                return f"برای سوال '{question}' در دسته '{category}' سوال مرتبطی پیدا نکردم."
-
+        async with browser_pool.page() as page:
+            return await _search_faq_on_page(page, waits, question, category)
     except Exception as e:
         logger.error(f"Error during SIMPLE FAQ search: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی سوالات متداول رخ داد: {str(e)}"
+    finally:
+        waits.log()
 
-# Wrapper برای استفاده تو محیط async
-def search_alibaba_faqs_interactive(question: str, category: str = "پرواز داخلی") -> str:
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_faq_simple(question: str, category: str = "پرواز داخلی") -> str:
     """
-    Wrapper برای جستجوی تعاملی FAQ.
-    Wrapper for interactive FAQ search.
+    نسخه ساده (sync) از جستجوی تعاملی FAQ برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async interactive FAQ search, for scripts and tests.
     """
-    # برای تست ساده‌تر، می‌تونیم مستقیم تابع sync رو صدا کنیم:
-    return search_faq_simple(question, category)
-    # اگه می‌خوای تو محیط async اصلی اجرا بشه:
-    # loop = asyncio.get_event_loop()
-    # from functools import partial
-    # return loop.run_in_executor(None, partial(search_faq_simple, question=question, category=category))
+    return run_sync(search_faq_async(question, category))
+
+async def search_alibaba_faqs_interactive(question: str, category: str = "پرواز داخلی") -> str:
+    """
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
+    """
+    return await search_faq_async(question, category)
 
 # --- Flight Search ---
 
 
-def search_flight_schedules_simple(origin: str, destination: str, date: str) -> str:
-    """نسخه ساده (sync) از جستجوی پرواز داخلی برای تست.
-    Simple (sync) version of domestic flight search for testing."""
+async def _submit_flight_search_form(page, waits: StepWaits, origin: str, destination: str, day: str):
+    """
+    پر کردن و ارسال فرم جستجوی پرواز (وقتی آدرس مستقیم نتایج جواب نده).
+    Fill and submit the flight search form (fallback when the direct results URL fails).
+    """
+    url = "https://www.alibaba.ir/flight-ticket"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === پر کردن فرم ===
+    # 1. اطمینان از انتخاب "یک طرفه" (اگر لازم باشه)
+    # کد codegen نشون میده که اول یک طرفه کلیک میشه. اینجا چک می‌کنیم.
+    logger.info("Ensuring 'یک طرفه' is selected...")
+    oneway_button = page.get_by_role('button', name='یک طرفه')
+    # اگر کلیک خاصی لازم بود میشه اضافه کرد، ولی اول چک می‌کنیم وجود داره یا نه.
+    if await oneway_button.count() > 0:
+         # oneway_button.click(modifiers=['ControlOrMeta']) # این خط از کد codegen بود
+         # بهتره یه کلیک ساده بزنیم و ببینیم چی میشه
+         await oneway_button.click()
+         # صبر تا فرم یک طرفه آماده بشه
+         await waits.visible("oneway_applied", page.get_by_role("textbox", name="مبدا (شهر)"))
+    else:
+         logger.info("'یک طرفه' button not found or already selected.")
+
+    # 2. پر کردن مبدا
+    logger.info("Filling origin field...")
+    origin_field = page.get_by_role("textbox", name="مبدا (شهر)")
+    await origin_field.click()
+    # انتخاب شهر مبدا از suggestion - استفاده از regex برای مطابقت دقیق
+    logger.info(f"Selecting origin: {origin}")
+    # page.locator('a').filter({ hasText: /^تهران$/ }).click(); // از کد codegen
+    origin_option = page.locator('a').filter(has_text=regex.compile(f"^{origin}$")).first
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("origin_suggestions", origin_option)
+    await origin_option.click()
+
+    # 3. پر کردن مقصد
+    logger.info("Filling destination field...")
+    destination_field = page.get_by_role("textbox", name="مقصد (شهر)")
+    await destination_field.click()
+    # انتخاب شهر مقصد از suggestion - استفاده از regex برای مطابقت دقیق
+    logger.info(f"Selecting destination: {destination}")
+    # page.locator('a').filter({ hasText: 'اهواز' }).click(); // از کد codegen
+    destination_option = page.locator('a').filter(has_text=regex.compile(f"^{destination}$")).first
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("destination_suggestions", destination_option)
+    await destination_option.click()
+
+    # 4. انتخاب تاریخ
+    logger.info("Selecting date...")
+    # کلیک روی input تاریخ برای باز کردن datepicker
+    # اسم فیلد تاریخ در کد codegen: 'تاریخ رفت'
+    date_field = page.get_by_role("textbox", name="تاریخ رفت")
+    await date_field.click()
+    
+    # !!! مهم: سایت ممکنه تقویم خودش رو باز کنه یا یه تقویم جدا. 
+    # کد codegen نشون میده که یه جا به '4200' کلیک کرده که احتمالاً یه روز هست.
+    # ولی بهتره از تاریخ واقعی استفاده کنیم.
+    # فرض کنیم سال و ماه درست هستن و ما باید روز رو پیدا کنیم.
+    # یه راه راحت‌تر اینه که المنت روز رو پیدا کنیم.
+    # ولی سایت ممکنه تقویم پیچیده‌ای داشته باشه. 
+    # برای سادگی، فعلاً فرض می‌کنیم روز رو می‌شه مستقیم پیدا کرد.
+    # این روش ممکنه نیاز به تطبیق بیشتری داشته باشه بسته به ساختار تقویم.
+    logger.info(f"Clicking on day: {day}")
+    # page.getByText('4200').first().click(); // این یه عدد رندوم بود. باید عوض بشه.
+    # سعی می‌کنیم المنتی که فقط عدد روز رو داره پیدا کنیم.
+    # این ممکنه نیاز به تنظیم بیشتری داشته باشه.
+    day_cell = page.get_by_text(day, exact=True).first
+    # صبر تا تقویم رندر بشه
+    await waits.visible("date_grid", day_cell)
+    await day_cell.click()
+
+    # 5. کلیک روی دکمه جستجو
+    logger.info("Clicking search button...")
+    # page.getByRole('button', { name: 'جستجو' }).click(); // از کد codegen
+    await page.get_by_role("button", name="جستجو").click()
+
+    # === صبر کردن برای نتایج ===
+    logger.info("Waiting for results...")
+    # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
+    # این یه رشته منحصر به فرد از نتایج هست.
+    # page.wait_for_selector("div:has-text('تومان نرخ رسمی ایرلاین')", timeout=30000)
+    # از کد codegen: await page.goto('https://www.alibaba.ir/flights/THR-AWZ?adult=1&child=0&infant=0&departing=1404-05-14');
+    # یعنی بعد از جستجو، یه URL جدید بار میشه. می‌تونیم از اون استفاده کنیم.
+    # ولی بهتره صبر کنیم تا یه المنت خاص از صفحه نتایج ظاهر بشه.
+    # فرض کنیم یه المنت با متن خاص (مثلاً اسم یه هواپیمایی یا "قیمت") ظاهر میشه.
+    # برای تست اولیه، صبر می‌کنیم تا URL تغییر کنه یا یه المنت خاص بیاد.
+    # page.wait_for_url("**/flights/**", timeout=30000) # صبر کن تا URL شامل /flights/ بشه
+    # یا صبر کن تا یه المنت از نتایج بیاد
+    await waits.url("results_route", page, "**/flights/**", required=False)
+    await waits.visible("results", page.locator("button:has-text('انتخاب')"), timeout_ms=RESULTS_TIMEOUT_MS) # فرض: دکمه انتخاب وجود داره
+
+
+async def _search_flight_schedules_on_page(page, waits: StepWaits, origin: str, destination: str, date: str, day: str) -> list:
+    """
+    بدنه‌ی جستجوی پرواز داخلی روی صفحه‌ای که استخر مرورگر می‌ده.
+    Domestic flight search body, run on a page handed out by the browser pool. Returns ScheduleRecords.
+    """
+    # شنود API جستجوی سایت از قبل از navigation (app/api_capture.py)
+    capture = ApiCapture(page, "flight", origin, destination, date)
+
+    # === رفتن مستقیم به صفحه نتایج ===
+    # اگه آدرس مستقیم ساخته نشد یا نتایج نیومد، فرم جستجو پر می‌شه
+    results_marker = page.locator("button:has-text('انتخاب')")
+    if not await _goto_results_directly(page, waits, flight_results_url(origin, destination, date), results_marker):
+        await _submit_flight_search_form(page, waits, origin, destination, day)
+
+    # === استخراج اطلاعات ===
+    # اول JSON پاسخ API جستجو؛ اگه چیزی شنود نشد، همه‌ی کارت‌ها با یک page.evaluate (app/extraction.py)
+    # و بعد تبدیل به ScheduleRecord (app/schedules.py)
+    records = await capture.records()
+    if records:
+        return records
+    logger.info("Extracting results...")
+    extracted = await extract_cards(page, "flight", FLIGHT_CARDS, limit=SCHEDULE_MAX_RECORDS)
+    return [parse_schedule(record["text"], record["fields"]) for record in extracted["records"]]
+
+
+@on_engine_loop
+@cached_tool("flight_schedules", route_key, ("date",))
+async def flight_schedule_records_async(origin: str, destination: str, date: str):
+    """
+    نسخه async از جستجوی پرواز داخلی (روی event loop موتور Playwright).
+    Async domestic flight search, driven on the Playwright engine loop. Returns ScheduleRecords or a ❌ message.
+    """
     logger.info(f"Starting search with parameters: origin={origin}, destination={destination}, date={date}")
     
-    # تبدیل تاریخ به فرمت مورد نیاز سایت 
-    # مثلاً اگه date = "1403/07/15" باشه، باید "15" رو استخراج کنیم
+    # تبدیل تاریخ به فرمت سایت ('فردا'، '1403/07/15' یا '2024-10-06' -> '1403-07-15')
+    jalali = normalize_jalali_date(date)
+    if jalali is None:
+        logger.error(f"Could not parse date: {date}")
+        return _invalid_date(date)
+    date, day = jalali, _picker_day(jalali)
+    logger.info(f"Normalised date: {date}, day for date picker: {day}")
+
+    # در حالت direct بدون مرورگر، با template یاد گرفته شده از API سایت
+    records = await fetch_direct("flight", origin, destination, date)
+    if records:
+        return records
+
+    waits = StepWaits("flight")
     try:
-        year, month, day = date.split('/')
-        logger.info(f"Extracted date parts: year={year}, month={month}, day={day}")
-    except Exception as e:
-        logger.error(f"Could not extract date parts from date: {date}. Error: {e}")
-        # اگه نتونه، خود تاریخ رو می‌فرسته یا یه مقدار پیش‌فرض
-        year, month, day = "1403", "05", "15" 
-
-    try:
-        with sync_playwright() as p:
-            # برای دیباگ می‌تونی headless=False بذاری
-            browser = p.chromium.launch(headless=True) 
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/flight-ticket"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === پر کردن فرم ===
-            # 1. اطمینان از انتخاب "یک طرفه" (اگر لازم باشه)
-            # کد codegen نشون میده که اول یک طرفه کلیک میشه. اینجا چک می‌کنیم.
-            logger.info("Ensuring 'یک طرفه' is selected...")
-            oneway_button = page.get_by_role('button', name='یک طرفه')
-            # اگر کلیک خاصی لازم بود میشه اضافه کرد، ولی اول چک می‌کنیم وجود داره یا نه.
-            if oneway_button.count() > 0:
-                 # oneway_button.click(modifiers=['ControlOrMeta']) # این خط از کد codegen بود
-                 # بهتره یه کلیک ساده بزنیم و ببینیم چی میشه
-                 oneway_button.click()
-                 page.wait_for_timeout(500) # کمی صبر کن تا تغییرات اعمال بشه (اگه لازم باشه)
-            else:
-                 logger.info("'یک طرفه' button not found or already selected.")
-
-            # 2. پر کردن مبدا
-            logger.info("Filling origin field...")
-            origin_field = page.get_by_role("textbox", name="مبدا (شهر)")
-            origin_field.click()
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000) 
-            # انتخاب شهر مبدا از suggestion - استفاده از regex برای مطابقت دقیق
-            logger.info(f"Selecting origin: {origin}")
-            # page.locator('a').filter({ hasText: /^تهران$/ }).click(); // از کد codegen
-            page.locator('a').filter(has_text=regex.compile(f"^{origin}$")).first.click()
-
-            # 3. پر کردن مقصد
-            logger.info("Filling destination field...")
-            destination_field = page.get_by_role("textbox", name="مقصد (شهر)")
-            destination_field.click()
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000)
-            # انتخاب شهر مقصد از suggestion - استفاده از regex برای مطابقت دقیق
-            logger.info(f"Selecting destination: {destination}")
-            # page.locator('a').filter({ hasText: 'اهواز' }).click(); // از کد codegen
-            page.locator('a').filter(has_text=regex.compile(f"^{destination}$")).first.click()
-
-            # 4. انتخاب تاریخ
-            logger.info("Selecting date...")
-            # کلیک روی input تاریخ برای باز کردن datepicker
-            # اسم فیلد تاریخ در کد codegen: 'تاریخ رفت'
-            date_field = page.get_by_role("textbox", name="تاریخ رفت")
-            date_field.click()
-            # صبر کمی برای باز شدن تقویم
-            page.wait_for_timeout(1000)
-            
-            # !!! مهم: سایت ممکنه تقویم خودش رو باز کنه یا یه تقویم جدا. 
-            # کد codegen نشون میده که یه جا به '4200' کلیک کرده که احتمالاً یه روز هست.
-            # ولی بهتره از تاریخ واقعی استفاده کنیم.
-            # فرض کنیم سال و ماه درست هستن و ما باید روز رو پیدا کنیم.
-            # یه راه راحت‌تر اینه که المنت روز رو پیدا کنیم.
-            # ولی سایت ممکنه تقویم پیچیده‌ای داشته باشه. 
-            # برای سادگی، فعلاً فرض می‌کنیم روز رو می‌شه مستقیم پیدا کرد.
-            # این روش ممکنه نیاز به تطبیق بیشتری داشته باشه بسته به ساختار تقویم.
-            logger.info(f"Clicking on day: {day}")
-            # page.getByText('4200').first().click(); // این یه عدد رندوم بود. باید عوض بشه.
-            # سعی می‌کنیم المنتی که فقط عدد روز رو داره پیدا کنیم.
-            # این ممکنه نیاز به تنظیم بیشتری داشته باشه.
-            page.get_by_text(day, exact=True).first.click()
-
-            # 5. کلیک روی دکمه جستجو
-            logger.info("Clicking search button...")
-            # page.getByRole('button', { name: 'جستجو' }).click(); // از کد codegen
-            page.get_by_role("button", name="جستجو").click()
-
-            # === صبر کردن برای نتایج ===
-            logger.info("Waiting for results...")
-            # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
-            # این یه رشته منحصر به فرد از نتایج هست.
-            # page.wait_for_selector("div:has-text('تومان نرخ رسمی ایرلاین')", timeout=30000)
-            # از کد codegen: await page.goto('https://www.alibaba.ir/flights/THR-AWZ?adult=1&child=0&infant=0&departing=1404-05-14');
-            # یعنی بعد از جستجو، یه URL جدید بار میشه. می‌تونیم از اون استفاده کنیم.
-            # ولی بهتره صبر کنیم تا یه المنت خاص از صفحه نتایج ظاهر بشه.
-            # فرض کنیم یه المنت با متن خاص (مثلاً اسم یه هواپیمایی یا "قیمت") ظاهر میشه.
-            # برای تست اولیه، صبر می‌کنیم تا URL تغییر کنه یا یه المنت خاص بیاد.
-            # page.wait_for_url("**/flights/**", timeout=30000) # صبر کن تا URL شامل /flights/ بشه
-            # یا صبر کن تا یه المنت از نتایج بیاد
-            page.wait_for_selector("button:has-text('انتخاب')", timeout=30000) # فرض: دکمه انتخاب وجود داره
-
-
-            # === استخراج اطلاعات ===
-            logger.info("Extracting results...")
-            results = []
-
-            # روش 1: پیدا کردن همه المنت‌هایی که اطلاعات بلیط توشه
-            # استفاده از یه selector کلی‌تر برای شروع
-            # ticket_containers = page.locator("div:has-text('تومان نرخ رسمی ایرلاین')")
-            # فرض کنیم هر کارت پرواز یه دکمه "انتخاب" داره
-            ticket_containers = page.locator("button:has-text('انتخاب')").locator("..") # والد دکمه انتخاب
-            # یا میشه از div های خاصی که کارت هستن استفاده کرد. باید inspect کرد.
-            # فرض کنیم کارت‌ها یه کلاس خاص دارن یا یه ساختار مشخص.
-            # برای تست، از والد دکمه انتخاب استفاده می‌کنیم.
-            count = ticket_containers.count()
-            logger.info(f"Found {count} ticket containers.")
-
-            if count == 0:
-                results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
-            else:
-                # پردازش تا 3 تا از اولین نتایج
-                for i in range(min(count, 3)):
-                    try:
-                        container = ticket_containers.nth(i)
-                        # استخراج اطلاعات از هر container
-                        # این قسمت کمی tricky هست چون باید داخل container جستجو کنیم.
-                        # فرض کنیم قیمت و شماره صندلی و ... تو یه ساختار مشابه هستن.
-                        # یه راه ساده‌تر: گرفتن تمام متن container و پردازش متنی
-                        full_text = container.text_content()
-                        if full_text:
-                             # می‌تونیم یه پردازش ساده روی متن انجام بدیم تا اطلاعات مهم رو استخراج کنیم
-                             # مثلاً فقط چند خط اول یا خطوطی که حاوی کلمات خاصی هستن
-                             lines = full_text.strip().split('\n')
-                             # فیلتر کردن خطوط خالی
-                             lines = [line.strip() for line in lines if line.strip()]
-                             # مثلاً 5 خط اول رو می‌گیریم
-                             snippet = "\n".join(lines[:8]) 
-                             results.append(f"نتیجه {i+1}:\n{snippet}\n---")
-                        else:
-                             results.append(f"نتیجه {i+1}: (متن خالی)")
-                    except Exception as e:
-                        logger.error(f"Error extracting data from ticket container {i}: {e}", exc_info=True)
-                        results.append(f"❌ خطایی در استخراج اطلاعات بلیط {i+1}.")
-
-            browser.close()
-            logger.info("Browser closed (SIMPLE).")
-            if not results:
-                return "هیچ نتیجه‌ای از جستجوی پرواز بدست نیومد."
-            return "\n".join(results)
-
+        async with browser_pool.page() as page:
+            return await _search_flight_schedules_on_page(page, waits, origin, destination, date, day)
     except Exception as e:
         logger.error(f"Error during SIMPLE flight schedule scraping: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی ساده زمانبندی پرواز رخ داد: {str(e)}"
+    finally:
+        waits.log()
 
-# به‌روزرسانی wrapper برای استفاده از نسخه sync جدید
-def search_alibaba_flight_schedules(origin: str, destination: str, date: str) -> str:
+async def search_flight_schedules_async(origin: str, destination: str, date: str, **filters) -> str:
     """
-    Wrapper نهایی که تابع sync رو تو یه thread جدا اجرا می‌کنه.
-    Final wrapper that runs the sync function in a separate thread.
+    نتایج پرواز داخلی بعد از فیلتر و مرتب‌سازی سمت سرور، به شکل فشرده.
+    Compact domestic flight results after server-side filtering and sorting (see app/schedules.py).
     """
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, search_flight_schedules_simple, origin, destination, date)
+    records = await flight_schedule_records_async(origin, destination, date)
+    if isinstance(records, str):
+        return records
+    return render_schedules(f"✈️ پرواز از {origin} به {destination} در {date}", records, **filters)
+
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_flight_schedules_simple(origin: str, destination: str, date: str, **filters) -> str:
+    """
+    نسخه ساده (sync) از جستجوی پرواز داخلی برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async domestic flight search, for scripts and tests.
+    """
+    return run_sync(search_flight_schedules_async(origin, destination, date, **filters))
+
+async def search_alibaba_flight_schedules(origin: str, destination: str, date: str, **filters) -> str:
+    """
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
+    """
+    return await search_flight_schedules_async(origin, destination, date, **filters)
 
 # --- Hotel Search ---
 # جستجوی هتل
 
-def search_hotel_info_simple(city: str, checkin_date: str, checkout_date: str) -> str:
+async def _submit_hotel_search_form(page, waits: StepWaits, city: str, checkin_day: str, checkout_day: str):
     """
-    نسخه ساده (sync) از جستجوی هتل برای تست.
-    Simple (sync) version of hotel search for testing.
+    پر کردن و ارسال فرم جستجوی هتل (وقتی آدرس مستقیم نتایج جواب نده).
+    Fill and submit the hotel search form (fallback when the direct results URL fails).
     """
-    logger.info(f"Starting search with parameters: city={city}, checkin={checkin_date}, checkout={checkout_date}")
+    url = "https://www.alibaba.ir/hotel"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === پر کردن فرم ===
+    # 1. پر کردن مقصد
+    logger.info("Filling destination field...")
+    await page.get_by_role("textbox", name="مقصد یا هتل (داخلی و خارجی)").click()
     
-    # *** تبدیل تاریخ ***
+    # انتخاب شهر/هتل از suggestion
+    # فرض: suggestion شامل نام شهر هست (مثلاً "کیشهرمزگان")
+    suggestion_text = city # یا متن دقیق‌تری که تو suggestion هست
+    logger.info(f"Looking for suggestion containing: {suggestion_text}")
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("destination_suggestions", page.locator('a').filter(has_text=city), required=False)
     try:
-        checkin_day = checkin_date.split('/')[-1].split('-')[-1]
-        checkout_day = checkout_date.split('/')[-1].split('-')[-1]
-        logger.info(f"Extracted days: checkin={checkin_day}, checkout={checkout_day}")
-    except Exception as e:
-        logger.error(f"Error extracting days from dates: {e}")
-        checkin_day = checkin_date 
-        checkout_day = checkout_date
-
+        await page.locator('a').filter(has_text=suggestion_text).click()
+    except:
+        logger.warning(f"Exact suggestion '{suggestion_text}' not found. Trying partial match...")
+        await page.locator('a').filter(has_text=city).first.click()
+    
+    # 2. انتخاب تاریخ ورود
+    logger.info("Selecting check-in date...")
+    # فرض: روی تقویم کلیک می‌کنه و بعد روز رو انتخاب می‌کنه
+    # ممکنه نیاز به کلیک روی input تاریخ ورود باشه:
+    # page.get_by_role("textbox", name="تاریخ ورود").click()
+    logger.info(f"Clicking on check-in day: {checkin_day}")
+    # استفاده از locator مشابه recorder
+    checkin_cell = page.locator('span').filter(has_text=checkin_day).first
+    # صبر تا تقویم رندر بشه
+    await waits.visible("checkin_grid", checkin_cell)
+    await checkin_cell.click()
+
+    # 3. انتخاب تاریخ خروج
+    logger.info("Selecting check-out date...")
+    logger.info(f"Clicking on check-out day: {checkout_day}")
+    # nth(1) برای انتخاب دومین روز (اگه چند تا باشن)
+    checkout_cell = page.get_by_text(checkout_day).nth(1)
+    await waits.visible("checkout_grid", checkout_cell)
+    await checkout_cell.click() 
+
+    # 4. کلیک روی دکمه جستجو
+    logger.info("Clicking search button...")
+    await page.get_by_role("button", name="جستجو").click()
+
+    # === صبر کردن برای نتایج ===
+    logger.info("Waiting for results...")
+    # استفاده از المنتی که نشانه ظاهر شدن نتایج هست.
+    # این ممکنه نیاز به تغییر داشته باشه. "هتل" یه انتخاب عمومی هست.
+    # اگه المنت خاص‌تری تو recorder بود، اون رو استفاده کن.
+    await waits.visible("results", page.locator(HOTEL_RESULTS_MARKER), timeout_ms=RESULTS_TIMEOUT_MS) 
+    # یا اگه المنت خاص‌تری هست (مثلاً یه div با کلاس خاص)، اون رو استفاده کن.
+    # page.wait_for_selector(".hotel-search-results-container", timeout=30000)
+
+
+async def _search_hotel_info_on_page(page, waits: StepWaits, city: str, checkin_date: str, checkout_date: str, checkin_day: str, checkout_day: str) -> str:
+    """
+    بدنه‌ی جستجوی هتل روی صفحه‌ای که استخر مرورگر می‌ده.
+    Hotel search body, run on a page handed out by the browser pool.
+    """
+    # === رفتن مستقیم به صفحه نتایج ===
+    # اگه آدرس مستقیم ساخته نشد یا نتایج نیومد، فرم جستجو پر می‌شه
+    # "هتل" رو هر صفحه‌ای هست (حتی صفحه‌ی خطا یا بدون نتیجه)؛ فقط کارت نتیجه یعنی آدرس مستقیم جواب داده
+    results_marker = page.locator(HOTEL_RESULTS_MARKER)
+    if not await _goto_results_directly(page, waits, hotel_results_url(city, checkin_date, checkout_date), results_marker):
+        await _submit_hotel_search_form(page, waits, city, checkin_day, checkout_day)
+
+    # === استخراج اطلاعات ===
+    # همه‌ی کارت‌ها با یک page.evaluate (app/extraction.py)
+    logger.info("Extracting results...")
+    results = []
+    extracted = await extract_cards(page, "hotel", HOTEL_CARDS)
+    if not extracted["records"]:
+        results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
+    for record in extracted["records"]:
+        fields = record["fields"]
+        name = fields["name"] or "هتل نامشخص"
+        rating = fields["rating"] or "امتیاز ندارد"
+        price = fields["price"] or "قیمت نامشخص"
+        location = fields["location"]
+        results.append(f"🏨 {name} ({rating}) - {price} ({location})")
+
+    if results:
+        return f"🏨 نتایج جستجوی هتل در {city} از {checkin_date} تا {checkout_date}:\n" + "\n".join(results)
+    else:
+        return f"اطلاعاتی درباره هتل در {city} از {checkin_date} تا {checkout_date} پیدا نکردم."
+
+
+@on_engine_loop
+@cached_tool("hotel_info", stay_key, ("checkin_date", "checkout_date"))
+async def search_hotel_info_async(city: str, checkin_date: str, checkout_date: str) -> str:
+    """
+    نسخه async از جستجوی هتل (روی event loop موتور Playwright).
+    Async hotel search, driven on the Playwright engine loop.
+    """
+    logger.info(f"Starting search with parameters: city={city}, checkin={checkin_date}, checkout={checkout_date}")
+    
+    # تبدیل تاریخ‌ها به فرمت سایت ('فردا'، '1403/07/15' یا '2024-10-06' -> '1403-07-15')
+    checkin, checkout = normalize_jalali_date(checkin_date), normalize_jalali_date(checkout_date)
+    if checkin is None or checkout is None:
+        logger.error(f"Could not parse dates: checkin={checkin_date}, checkout={checkout_date}")
+        return _invalid_date(checkout_date if checkin else checkin_date)
+    checkin_date, checkout_date = checkin, checkout
+    checkin_day, checkout_day = _picker_day(checkin), _picker_day(checkout)
+    logger.info(f"Extracted days: checkin={checkin_day}, checkout={checkout_day}")
+
+    waits = StepWaits("hotel")
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/hotel"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === پر کردن فرم ===
-            # 1. پر کردن مقصد
-            logger.info("Filling destination field...")
-            page.get_by_role("textbox", name="مقصد یا هتل (داخلی و خارجی)").click()
-            page.wait_for_timeout(1000)
-            
-            # انتخاب شهر/هتل از suggestion
-            # فرض: suggestion شامل نام شهر هست (مثلاً "کیشهرمزگان")
-            suggestion_text = city # یا متن دقیق‌تری که تو suggestion هست
-            logger.info(f"Looking for suggestion containing: {suggestion_text}")
-            try:
-                page.locator('a').filter(has_text=suggestion_text).click()
-            except:
-                logger.warning(f"Exact suggestion '{suggestion_text}' not found. Trying partial match...")
-                page.locator('a').filter(has_text=city).first.click()
-            
-            # 2. انتخاب تاریخ ورود
-            logger.info("Selecting check-in date...")
-            # فرض: روی تقویم کلیک می‌کنه و بعد روز رو انتخاب می‌کنه
-            # ممکنه نیاز به کلیک روی input تاریخ ورود باشه:
-            # page.get_by_role("textbox", name="تاریخ ورود").click()
-            page.wait_for_timeout(1000)
-            logger.info(f"Clicking on check-in day: {checkin_day}")
-            # استفاده از locator مشابه recorder
-            page.locator('span').filter(has_text=checkin_day).first.click()
-
-            # 3. انتخاب تاریخ خروج
-            logger.info("Selecting check-out date...")
-            page.wait_for_timeout(1000)
-            logger.info(f"Clicking on check-out day: {checkout_day}")
-            # nth(1) برای انتخاب دومین روز (اگه چند تا باشن)
-            page.get_by_text(checkout_day).nth(1).click() 
-
-            # 4. کلیک روی دکمه جستجو
-            logger.info("Clicking search button...")
-            page.get_by_role("button", name="جستجو").click()
-
-            # === صبر کردن برای نتایج ===
-            logger.info("Waiting for results...")
-            # استفاده از المنتی که نشانه ظاهر شدن نتایج هست.
-            # این ممکنه نیاز به تغییر داشته باشه. "هتل" یه انتخاب عمومی هست.
-            # اگه المنت خاص‌تری تو recorder بود، اون رو استفاده کن.
-            page.wait_for_selector("text=هتل", timeout=30000) 
-            # یا اگه المنت خاص‌تری هست (مثلاً یه div با کلاس خاص)، اون رو استفاده کن.
-            # page.wait_for_selector(".hotel-search-results-container", timeout=30000)
-
-            # === استخراج اطلاعات ===
-            logger.info("Extracting results...")
-            results = []
-            
-            # روش 1: پیدا کردن المنت‌هایی که اطلاعات هتل توشه.
-            # این یه فرض اولیه هست. باید با inspect صفحه نتایج واقعی بررسی بشه.
-            # مثلاً فرض کنیم هتل‌ها تو div هایی با کلاس 'HotelCard' یا 'hotel-item' هستن.
-            # اما چون recorder چیز خاصی نشون نداد، از یه selector عمومی‌تر استفاده می‌کنیم.
-            
-            # یه راه دیگه: پیدا کردن المنت‌هایی که قیمت دارن، چون احتمالاً هتل‌ها قیمت دارن.
-            # یا پیدا کردن المنت‌هایی که اسم "هتل" یا "اتاق" توشه.
-            
-            # فرض کنیم نتایج تو یه ساختار مشخص هستن. مثلاً هر هتل تو یه div.hotel-card هست.
-            # hotel_cards = page.locator("div.hotel-card") # این selector باید تغییر کنه
-            
-            # برای شروع، از یه روش کلی‌تر استفاده می‌کنیم:
-            # پیدا کردن همه المنت‌هایی که "تومان" یا "ریال" یا "شب" تو متنشون هست
-            # چون اینا معمولاً تو قیمت هتل‌ها می‌یاد.
-            potential_hotel_elements = page.locator("div:has-text('تومان'), div:has-text('ریال'), div:has-text('شب')")
-            count = potential_hotel_elements.count()
-            logger.info(f"Found {count} potential hotel elements.")
-            
-            if count == 0:
-                 # اگه روش بالا جواب نداد، روش قبلی (جستجو برای "هتل") رو امتحان کن
-                 logger.info("Trying alternative selector for hotel results...")
-                 # فرض کنیم نتایج تو یه div با کلاس خاص هستن
-                 # این selector ها باید با inspect کردن صفحه نتایج واقعی پیدا بشن.
-                 hotel_cards = page.locator(".hotel-item, .HotelCard, [class*='hotel'], [class*='Hotel']")
-                 count = hotel_cards.count()
-                 logger.info(f"Found {count} hotel cards with alternative selector.")
-                 if count == 0:
-                      results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
-                 else:
-                      # پردازش hotel_cards
-                      for i in range(min(count, 3)):
-                          try:
-                              card = hotel_cards.nth(i)
-                              # استخراج اطلاعات از card
-                              # این selector ها باید با inspect کردن صفحه واقعی پیدا بشن.
-                              name_elem = card.locator(".hotel-name, .HotelCard__name, h3, [class*='name']")
-                              rating_elem = card.locator(".hotel-rating, .HotelCard__rating, [class*='rating']")
-                              price_elem = card.locator(".price, .HotelCard__price, [class*='price']")
-                              location_elem = card.locator(".location, .HotelCard__location, [class*='location']")
-                              
-                              def safe_text_content(locator_obj):
-                                  try:
-                                      if locator_obj.count() > 0:
-                                          return locator_obj.first.text_content(timeout=2000).strip()
-                                      else:
-                                          return ""
-                                  except:
-                                      return ""
-                              
-                              name = safe_text_content(name_elem) or "هتل نامشخص"
-                              rating = safe_text_content(rating_elem) or "امتیاز ندارد"
-                              price = safe_text_content(price_elem) or "قیمت نامشخص"
-                              location = safe_text_content(location_elem) or ""
-                              
-                              results.append(f"🏨 {name} ({rating}) - {price} ({location})")
-                          except Exception as e:
-                              logger.warning(f"Error extracting data from hotel card {i+1}: {e}")
-                              results.append(f"خطا در استخراج اطلاعات هتل {i+1}.")
-            else:
-                # پردازش potential_hotel_elements
-                 # این روش ممکنه نتایج اضافی هم بگیره، پس باید فیلتر بشه.
-                 # برای سادگی، فعلاً همون روش قبلی رو ادامه می‌دیم.
-                 # ولی می‌تونی این قسمت رو بهبود بدی.
-                 
-                 # برگرد به روش قبلی برای استخراج نتایج، چون روش جدید ممکنه پیچیده باشه.
-                 # استفاده از selector هایی که قبلاً تعریف کردیم (با اینکه ممکنه درست نباشن)
-                 hotel_items = page.locator(".hotel-item, .HotelCard").all() # all() برای sync
-                 if not hotel_items:
-                      results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده (روش جایگزین).")
-                 else:
-                      logger.info(f"Found {len(hotel_items)} hotel items with previous selector.")
-                      for i, item in enumerate(hotel_items[:3]):
-                          try:
-                              # استخراج اطلاعات از هر item
-                              # selector ها باید با inspect کردن صفحه واقعی پیدا بشن.
-                              # اینا selector های حدس زده شده هستن.
-                              name_elem = item.locator(".hotel-name, .HotelCard__name, h3")
-                              rating_elem = item.locator(".hotel-rating, .HotelCard__rating")
-                              price_elem = item.locator(".price, .HotelCard__price").first
-                              location_elem = item.locator(".location, .HotelCard__location")
-                              
-                              def safe_text_content_sync(locator_obj):
-                                  try:
-                                      # برای sync API، count() و text_content() نیازی به await ندارن
-                                      if locator_obj.count() > 0:
-                                          return locator_obj.text_content(timeout=2000).strip()
-                                      else:
-                                          return ""
-                                  except:
-                                      return ""
-                              
-                              name = safe_text_content_sync(name_elem) or "هتل نامشخص"
-                              try:
-                                  rating = safe_text_content_sync(rating_elem) or "امتیاز ندارد"
-                              except:
-                                  rating = "امتیاز ندارد"
-                              try:
-                                  price = safe_text_content_sync(price_elem) or "قیمت نامشخص"
-                              except:
-                                  price = "قیمت نامشخص"
-                              try:
-                                  location = safe_text_content_sync(location_elem) or ""
-                              except:
-                                  location = ""
-                              
-                              results.append(
-                                  f"🏨 {name} "
-                                  f"({rating}) - "
-                                  f"{price} "
-                                  f"({location})"
-                              )
-                          except Exception as e:
-                              logger.warning(f"Error extracting data from a hotel item (method 2): {e}")
-                              results.append(f"خطا در استخراج اطلاعات هتل {i+1} (روش جایگزین).")
-
-
-            browser.close()
-            logger.info("Browser closed (SIMPLE).")
-
-            if results:
-                return f"🏨 نتایج جستجوی هتل در {city} از {checkin_date} تا {checkout_date}:\n" + "\n".join(results)
-            else:
-                return f"اطلاعاتی درباره هتل در {city} از {checkin_date} تا {checkout_date} پیدا نکردم."
-
+        async with browser_pool.page() as page:
+            return await _search_hotel_info_on_page(page, waits, city, checkin_date, checkout_date, checkin_day, checkout_day)
     except Exception as e:
         logger.error(f"Error during SIMPLE hotel scraping: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی ساده هتل رخ داد: {str(e)}"
+    finally:
+        waits.log()
+
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_hotel_info_simple(city: str, checkin_date: str, checkout_date: str) -> str:
+    """
+    نسخه ساده (sync) از جستجوی هتل برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async hotel search, for scripts and tests.
+    """
+    return run_sync(search_hotel_info_async(city, checkin_date, checkout_date))
 
-# به‌روزرسانی wrapper برای استفاده از نسخه sync جدید
-def search_alibaba_hotel_info(city: str, checkin_date: str, checkout_date: str) -> str:
+async def search_alibaba_hotel_info(city: str, checkin_date: str, checkout_date: str) -> str:
     """
-    Wrapper نهایی که تابع sync رو تو یه thread جدا اجرا می‌کنه.
-    Final wrapper that runs the sync function in a separate thread.
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
     """
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, search_hotel_info_simple, city, checkin_date, checkout_date)
+    return await search_hotel_info_async(city, checkin_date, checkout_date)
 
 
 # --- Villa/Accommodation Search ---
 # جستجوی ویلا/اقامتگاه
 
-def search_villa_info_simple(city: str, checkin_date: str, checkout_date: str) -> str:
+async def _submit_villa_search_form(page, waits: StepWaits, city: str, checkin_day: str, checkout_day: str):
     """
-    نسخه ساده (sync) از جستجوی اقامتگاه برای تست.
-    Simple (sync) version of accommodation search for testing.
+    پر کردن و ارسال فرم جستجوی اقامتگاه (وقتی آدرس مستقیم نتایج جواب نده).
+    Fill and submit the accommodation search form (fallback when the direct results URL fails).
+    """
+    url = "https://www.alibaba.ir/accommodation"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === پر کردن فرم ===
+    # 1. پر کردن مقصد
+    logger.info("Filling destination field...")
+    await page.get_by_role("textbox", name="مقصد یا نوع اقامتگاه").click()
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("destination_suggestions", page.locator('a').filter(has_text=city), required=False)
+    # انتخاب شهر/اقامتگاه از suggestion
+    # *** مهم: متن دقیق suggestion ممکنه متفاوت باشه. ***
+    # مثلاً اگه city='رامسر' باشه، suggestion ممکنه 'اقامتگاه های شهر رامسر' باشه.
+    # برای سادگی، فعلاً سعی می‌کنیم متنی پیدا کنیم که شامل city هست.
+    # این ممکنه نیاز به تنظیم بیشتری داشته باشه.
+    suggestion_text = f"اقامتگاه های شهر {city}"
+    logger.info(f"Looking for suggestion containing: {suggestion_text}")
+    try:
+        await page.locator('a').filter(has_text=suggestion_text).click()
+    except:
+        logger.warning(f"Exact suggestion '{suggestion_text}' not found. Trying partial match...")
+        # اگه متن دقیق پیدا نشد، سعی می‌کنیم المنتی پیدا کنیم که city توشه.
+        await page.locator('a').filter(has_text=city).first.click()
+    
+    # 2. انتخاب تاریخ ورود
+    logger.info("Selecting check-in date...")
+    await page.get_by_role("textbox", name="تاریخ ورود").click()
+    logger.info(f"Clicking on check-in day: {checkin_day}")
+    checkin_cell = page.get_by_text(checkin_day).first
+    # صبر تا تقویم رندر بشه
+    await waits.visible("checkin_grid", checkin_cell)
+    await checkin_cell.click()
+
+    # 3. انتخاب تاریخ خروج
+    logger.info("Selecting check-out date...")
+    # فرض می‌کنیم تقویم هنوز باز هست یا دوباره باز می‌شه.
+    # اگه نیاز به کلیک روی فیلد تاریخ خروج هست، اون خط رو هم اضافه کن.
+    # page.get_by_role("textbox", name="تاریخ خروج").click() 
+    logger.info(f"Clicking on check-out day: {checkout_day}")
+    # nth(1) یعنی دومین المنتی که متن checkout_day رو داره (اگه چند تا باشن)
+    checkout_cell = page.get_by_text(checkout_day).nth(1)
+    await waits.visible("checkout_grid", checkout_cell)
+    await checkout_cell.click() 
+
+    # 4. کلیک روی دکمه "افزودن" (اگه هست)
+    logger.info("Clicking 'افزودن' button...")
+    add_button = page.get_by_role("button", name="افزودن")
+    # دکمه اختیاری هست؛ فقط کوتاه صبر کن که ظاهر بشه
+    if await waits.visible("add_button", add_button, required=False):
+        await add_button.click()
+    else:
+        logger.info("'افزودن' button not found or not needed.")
+
+    # 5. کلیک روی دکمه جستجو
+    logger.info("Clicking search button...")
+    await page.get_by_role("button", name="جستجو").click()
+
+    # === صبر کردن برای نتایج ===
+    logger.info("Waiting for results...")
+    # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
+    # این یه رشته منحصر به فرد از نتایج هست. ممکنه نیاز به تغییر داشته باشه.
+    await waits.visible("results", page.locator("section:has-text('رزرو آنی')"), timeout_ms=RESULTS_TIMEOUT_MS)
+
+
+async def _search_villa_info_on_page(page, waits: StepWaits, city: str, checkin_date: str, checkout_date: str, checkin_day: str, checkout_day: str) -> str:
+    """
+    بدنه‌ی جستجوی اقامتگاه روی صفحه‌ای که استخر مرورگر می‌ده.
+    Accommodation search body, run on a page handed out by the browser pool.
+    """
+    # === رفتن مستقیم به صفحه نتایج ===
+    # اگه آدرس مستقیم ساخته نشد یا نتایج نیومد، فرم جستجو پر می‌شه
+    results_marker = page.locator("section:has-text('رزرو آنی')")
+    if not await _goto_results_directly(page, waits, villa_results_url(city, checkin_date, checkout_date), results_marker):
+        await _submit_villa_search_form(page, waits, city, checkin_day, checkout_day)
+
+    # === استخراج اطلاعات ===
+    # همه‌ی کارت‌ها با یک page.evaluate (app/extraction.py)
+    logger.info("Extracting results...")
+    results = []
+    extracted = await extract_cards(page, "villa", VILLA_CARDS)
+    if not extracted["records"]:
+        results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
+    for i, record in enumerate(extracted["records"]):
+        lines = text_lines(record["text"])
+        if not lines:
+            results.append(f"خطا در استخراج اطلاعات اقامتگاه {i+1}.")
+            continue
+        # *** فرض‌ها ممکنه درست نباشن. باید با inspect نتایج واقعی سایت بررسی شه. ***
+        name = lines[0]
+        # فرض کنیم خطی با امتیاز هست (5/4.9)
+        rating_line = next((line for line in lines if '/' in line and '.' in line), "")
+        # فرض کنیم خطی با قیمت هست (عدد + تومان)
+        price_line = next((line for line in lines if "تومان" in line), "قیمت نامشخص")
+        # فرض کنیم خطی با ظرفیت یا امکانات هست
+        details_line = next((line for line in lines if ("تخت" in line or "ظرفیت" in line)), "")
+        results.append(f"🏡 {name} {rating_line} - {price_line} - {details_line}")
+
+    if results:
+        return f"🏡 نتایج جستجوی اقامتگاه در {city} از {checkin_date} تا {checkout_date}:\n" + "\n".join(results)
+    else:
+        return f"اطلاعاتی درباره اقامتگاه در {city} از {checkin_date} تا {checkout_date} پیدا نکردم."
+
+
+@on_engine_loop
+@cached_tool("villa_info", stay_key, ("checkin_date", "checkout_date"))
+async def search_villa_info_async(city: str, checkin_date: str, checkout_date: str) -> str:
+    """
+    نسخه async از جستجوی اقامتگاه (روی event loop موتور Playwright).
+    Async accommodation search, driven on the Playwright engine loop.
     """
     logger.info(f"Starting search with parameters: city={city}, checkin={checkin_date}, checkout={checkout_date}")
     
     # *** تبدیل تاریخ ***
-    # این بخش خیلی مهم هست. recorder تاریخ '24' و '27' رو گرفت.
-    # ما باید روزهای checkin و checkout رو از رشته‌های تاریخ استخراج کنیم.
-    # فرض می‌کنیم تاریخ به فرمت 'YYYY/MM/DD' یا 'YYYY-MM-DD' داده می‌شه.
+    # recorder روزهای '24' و '27' رو تو تقویم کلیک کرد؛ روز از تاریخ نرمال‌شده گرفته می‌شه.
+    checkin, checkout = normalize_jalali_date(checkin_date), normalize_jalali_date(checkout_date)
+    if checkin is None or checkout is None:
+        logger.error(f"Could not parse dates: checkin={checkin_date}, checkout={checkout_date}")
+        return _invalid_date(checkout_date if checkin else checkin_date)
+    checkin_date, checkout_date = checkin, checkout
+    checkin_day, checkout_day = _picker_day(checkin), _picker_day(checkout)
+    logger.info(f"Extracted days: checkin={checkin_day}, checkout={checkout_day}")
+
+    waits = StepWaits("villa")
     try:
-        checkin_day = checkin_date.split('/')[-1].split('-')[-1] # گرفتن آخرین بخش (روز)
-        checkout_day = checkout_date.split('/')[-1].split('-')[-1]
-        logger.info(f"Extracted days: checkin={checkin_day}, checkout={checkout_day}")
-    except Exception as e:
-        logger.error(f"Error extracting days from dates: {e}")
-        # اگه نتونه، خود روز رو می‌فرسته یا یه مقدار پیش‌فرض
-        checkin_day = checkin_date 
-        checkout_day = checkout_date
-
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/accommodation"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === پر کردن فرم ===
-            # 1. پر کردن مقصد
-            logger.info("Filling destination field...")
-            page.get_by_role("textbox", name="مقصد یا نوع اقامتگاه").click()
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000)
-            # انتخاب شهر/اقامتگاه از suggestion
-            # *** مهم: متن دقیق suggestion ممکنه متفاوت باشه. ***
-            # مثلاً اگه city='رامسر' باشه، suggestion ممکنه 'اقامتگاه های شهر رامسر' باشه.
-            # برای سادگی، فعلاً سعی می‌کنیم متنی پیدا کنیم که شامل city هست.
-            # این ممکنه نیاز به تنظیم بیشتری داشته باشه.
-            suggestion_text = f"اقامتگاه های شهر {city}"
-            logger.info(f"Looking for suggestion containing: {suggestion_text}")
-            try:
-                page.locator('a').filter(has_text=suggestion_text).click()
-            except:
-                logger.warning(f"Exact suggestion '{suggestion_text}' not found. Trying partial match...")
-                # اگه متن دقیق پیدا نشد، سعی می‌کنیم المنتی پیدا کنیم که city توشه.
-                page.locator('a').filter(has_text=city).first.click()
-            
-            # 2. انتخاب تاریخ ورود
-            logger.info("Selecting check-in date...")
-            page.get_by_role("textbox", name="تاریخ ورود").click()
-            page.wait_for_timeout(1000)
-            logger.info(f"Clicking on check-in day: {checkin_day}")
-            page.get_by_text(checkin_day).first.click()
-
-            # 3. انتخاب تاریخ خروج
-            logger.info("Selecting check-out date...")
-            # فرض می‌کنیم تقویم هنوز باز هست یا دوباره باز می‌شه.
-            # اگه نیاز به کلیک روی فیلد تاریخ خروج هست، اون خط رو هم اضافه کن.
-            # page.get_by_role("textbox", name="تاریخ خروج").click() 
-            page.wait_for_timeout(1000)
-            logger.info(f"Clicking on check-out day: {checkout_day}")
-            # nth(1) یعنی دومین المنتی که متن checkout_day رو داره (اگه چند تا باشن)
-            page.get_by_text(checkout_day).nth(1).click() 
-
-            # 4. کلیک روی دکمه "افزودن" (اگه هست)
-            logger.info("Clicking 'افزودن' button...")
-            try:
-                page.get_by_role("button", name="افزودن").click()
-                page.wait_for_timeout(500) # کمی صبر کن
-            except:
-                logger.info("'افزودن' button not found or not needed.")
-
-            # 5. کلیک روی دکمه جستجو
-            logger.info("Clicking search button...")
-            page.get_by_role("button", name="جستجو").click()
-
-            # === صبر کردن برای نتایج ===
-            logger.info("Waiting for results...")
-            # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
-            # این یه رشته منحصر به فرد از نتایج هست. ممکنه نیاز به تغییر داشته باشه.
-            page.wait_for_selector("section:has-text('رزرو آنی')", timeout=30000)
-
-            # === استخراج اطلاعات ===
-            logger.info("Extracting results...")
-            results = []
-            # روش 1: پیدا کردن همه المنت‌هایی که اطلاعات اقامتگاه توشه
-            # دوباره از المنتی که قبلاً استفاده کردیم به عنوان پایه استفاده می‌کنیم
-            accommodation_containers = page.locator("section:has-text('رزرو آنی')")
-            count = accommodation_containers.count()
-            logger.info(f"Found {count} accommodation containers.")
-            
-            if count == 0:
-                results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
-            else:
-                # پردازش تا 3 تا از اولین نتایج
-                for i in range(min(count, 3)):
-                    try:
-                        container = accommodation_containers.nth(i)
-                        # استخراج اطلاعات از هر container
-                        # این قسمت کمی tricky هست. باید با inspect کردن صفحه نتایج دقیق‌تر شه.
-                        # یه راه ساده‌تر: گرفتن تمام متن container و پردازش متنی
-                        full_text = container.text_content()
-                        if full_text:
-                            lines = full_text.strip().split('\n')
-                            lines = [line.strip() for line in lines if line.strip()]
-                            
-                            # *** اینجا نیاز به بررسی دقیق‌تر داریم ***
-                            # فرض‌ها ممکنه درست نباشن. باید با inspect نتایج واقعی سایت بررسی شه.
-                            name = lines[0] if lines else "اقامتگاه نامشخص"
-                            # فرض کنیم خطی با امتیاز هست (5/4.9)
-                            rating_line = next((line for line in lines if '/' in line and '.' in line), "")
-                            # فرض کنیم خطی با قیمت هست (عدد + تومان)
-                            price_line = next((line for line in lines if "تومان" in line), "قیمت نامشخص")
-                            # فرض کنیم خطی با ظرفیت یا امکانات هست
-                            details_line = next((line for line in lines if ("تخت" in line or "ظرفیت" in line)), "")
-                            
-                            results.append(f"🏡 {name} {rating_line} - {price_line} - {details_line}")
-                        else:
-                            results.append(f"خطا در استخراج اطلاعات اقامتگاه {i+1}.")
-                    except Exception as e:
-                        logger.warning(f"Error extracting data from accommodation container {i+1}: {e}")
-                        results.append(f"خطا در استخراج اطلاعات اقامتگاه {i+1}.")
-
-            browser.close()
-            logger.info("Browser closed (SIMPLE).")
-
-            if results:
-                return f"🏡 نتایج جستجوی اقامتگاه در {city} از {checkin_date} تا {checkout_date}:\n" + "\n".join(results)
-            else:
-                return f"اطلاعاتی درباره اقامتگاه در {city} از {checkin_date} تا {checkout_date} پیدا نکردم."
-
+        async with browser_pool.page() as page:
+            return await _search_villa_info_on_page(page, waits, city, checkin_date, checkout_date, checkin_day, checkout_day)
     except Exception as e:
         logger.error(f"Error during SIMPLE villa/accommodation scraping: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی ساده اقامتگاه رخ داد: {str(e)}"
+    finally:
+        waits.log()
+
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_villa_info_simple(city: str, checkin_date: str, checkout_date: str) -> str:
+    """
+    نسخه ساده (sync) از جستجوی اقامتگاه برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async accommodation search, for scripts and tests.
+    """
+    return run_sync(search_villa_info_async(city, checkin_date, checkout_date))
 
-# به‌روزرسانی wrapper برای استفاده از نسخه sync جدید
-def search_alibaba_villa_info(city: str, checkin_date: str, checkout_date: str) -> str:
+async def search_alibaba_villa_info(city: str, checkin_date: str, checkout_date: str) -> str:
     """
-    Wrapper نهایی که تابع sync رو تو یه thread جدا اجرا می‌کنه.
-    Final wrapper that runs the sync function in a separate thread.
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
     """
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, search_villa_info_simple, city, checkin_date, checkout_date)
+    return await search_villa_info_async(city, checkin_date, checkout_date)
 
 # --- Train Search ---
 
-def search_train_schedules_simple(origin: str, destination: str, date: str) -> str:
+async def _submit_train_search_form(page, waits: StepWaits, origin: str, destination: str, day: str):
     """
-    نسخه ساده (sync) از جستجوی قطار برای تست.
-    Simple (sync) version of train search for testing.
+    پر کردن و ارسال فرم جستجوی قطار (وقتی آدرس مستقیم نتایج جواب نده).
+    Fill and submit the train search form (fallback when the direct results URL fails).
     """
-    logger.info(f"Starting search with parameters: origin={origin}, destination={destination}, date={date}")
-    # تبدیل تاریخ به فرمت مورد نیاز سایت (اگر لازم باشه)
-    # مثلاً اگه date = "1403/07/15" باشه، باید "15" رو استخراج کنیم
-    # این یه ساده‌سازی هست. در عمل ممکنه به تبدیل دقیق‌تری نیاز باشه.
+    url = "https://www.alibaba.ir/train-ticket"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === پر کردن فرم ===
+    # 1. پر کردن مبدا
+    logger.info("Filling origin field...")
+    await page.get_by_role("textbox", name="مبدا (شهر)").click()
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("origin_suggestions", page.locator('a').filter(has_text=origin), required=False)
+    # انتخاب شهر مبدا از suggestion
+    logger.info(f"Selecting origin: {origin}")
+    # تغییر: جستجو برای المنت‌هایی که حاوی origin هستن
     try:
-        day = date.split('/')[-1] # گرفتن آخرین بخش تاریخ که روز هست
-        logger.info(f"Extracted day for date picker: {day}")
+        await page.locator('a').filter(has_text=lambda text: origin in text).first.click()
     except:
-        logger.error(f"Could not extract day from date: {date}")
-        day = date # اگه نتونه، خود تاریخ رو می‌فرسته
-
+        logger.warning(f"Could not find suggestion for origin '{origin}' with partial match. Trying exact match...")
+        # اگه روش بالا جواب نداد، سعی می‌کنه المنتی با متن دقیق origin پیدا کنه
+        await page.locator('a').filter(has_text=origin).first.click()
+
+    # 2. پر کردن مقصد
+    logger.info("Filling destination field...")
+    # فرض می‌کنیم فیلد مقصد هم به همین شکل هست (باید چک بشه)
+    # اگه فیلد مقصد یه textbox دیگه هست، باید selector ش رو پیدا کنیم.
+    # برای حالات مختلف، می‌تونیم از filter یا nth استفاده کنیم.
+    # فرض کنیم دومین textbox فیلد مقصد هست:
+    await page.get_by_role("textbox", name="مقصد (شهر)").click() # یا nth=1
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("destination_suggestions", page.locator('a').filter(has_text=destination), required=False)
+    # انتخاب شهر مقصد از suggestion
+    logger.info(f"Selecting destination: {destination}")
+     # تغییر: جستجو برای المنت‌هایی که حاوی destination هستن
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/train-ticket"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === پر کردن فرم ===
-            # 1. پر کردن مبدا
-            logger.info("Filling origin field...")
-            page.get_by_role("textbox", name="مبدا (شهر)").click()
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000)
-            # انتخاب شهر مبدا از suggestion
-            logger.info(f"Selecting origin: {origin}")
-            # تغییر: جستجو برای المنت‌هایی که حاوی origin هستن
-            try:
-                page.locator('a').filter(has_text=lambda text: origin in text).first.click()
-            except:
-                logger.warning(f"Could not find suggestion for origin '{origin}' with partial match. Trying exact match...")
-                # اگه روش بالا جواب نداد، سعی می‌کنه المنتی با متن دقیق origin پیدا کنه
-                page.locator('a').filter(has_text=origin).first.click()
-
-            # 2. پر کردن مقصد
-            logger.info("Filling destination field...")
-            # فرض می‌کنیم فیلد مقصد هم به همین شکل هست (باید چک بشه)
-            # اگه فیلد مقصد یه textbox دیگه هست، باید selector ش رو پیدا کنیم.
-            # برای حالات مختلف، می‌تونیم از filter یا nth استفاده کنیم.
-            # فرض کنیم دومین textbox فیلد مقصد هست:
-            page.get_by_role("textbox", name="مقصد (شهر)").click() # یا nth=1
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000)
-            # انتخاب شهر مقصد از suggestion
-            logger.info(f"Selecting destination: {destination}")
-             # تغییر: جستجو برای المنت‌هایی که حاوی destination هستن
-            try:
-                page.locator('a').filter(has_text=lambda text: destination in text).first.click()
-            except:
-                logger.warning(f"Could not find suggestion for destination '{destination}' with partial match. Trying exact match...")
-                # اگه روش بالا جواب نداد، سعی می‌کنه المنتی با متن دقیق destination پیدا کنه
-                page.locator('a').filter(has_text=destination).first.click()
-
-            # 3. انتخاب تاریخ
-            logger.info("Selecting date...")
-            # کلیک روی input تاریخ برای باز کردن datepicker
-            # فرض کنیم سومین textbox فیلد تاریخ هست:
-            page.get_by_role("textbox", name="تاریخ رفت").click() # یا nth=2 یا placeholder خاص
-            # صبر کمی برای باز شدن تقویم
-            page.wait_for_timeout(1000)
-            # کلیک روی روز مورد نظر
-            logger.info(f"Clicking on day: {day}")
-            page.get_by_text(day).first.click()
-
-            # 4. کلیک روی دکمه جستجو
-            logger.info("Clicking search button...")
-            page.get_by_role("button", name="جستجو").click()
-
-            # === صبر کردن برای نتایج ===
-            logger.info("Waiting for results...")
-            # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
-            # این یه رشته منحصر به فرد از نتایج هست.
-            page.wait_for_selector("div:has-text('تومانانتخاب بلیط')", timeout=30000)
-
-            # === استخراج اطلاعات ===
-            logger.info("Extracting results...")
-            results = []
-            # روش 1: پیدا کردن همه المنت‌هایی که اطلاعات بلیط توشه
-            # دوباره از المنتی که قبلاً استفاده کردیم به عنوان پایه استفاده می‌کنیم
-            ticket_containers = page.locator("div:has-text('تومانانتخاب بلیط')")
-            count = ticket_containers.count()
-            logger.info(f"Found {count} ticket containers.")
-            
-            if count == 0:
-                results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
-            else:
-                # پردازش تا 3 تا از اولین نتایج
-                for i in range(min(count, 3)):
-                    try:
-                        container = ticket_containers.nth(i)
-                        # استخراج اطلاعات از هر container
-                        # این قسمت کمی tricky هست چون باید داخل container جستجو کنیم.
-                        # فرض کنیم قیمت و شماره صندلی و ... تو یه ساختار مشابه هستن.
-                        
-                        # یه راه ساده‌تر: گرفتن تمام متن container و پردازش متنی
-                        full_text = container.text_content()
-                        if full_text:
-                            # یه پردازش ساده متن برای استخراج اطلاعات کلیدی
-                            # این فقط یه مثال هست و باید با دقت بیشتری انجام بشه
-                            lines = full_text.strip().split('\n')
-                            # فیلتر کردن خطوط خالی
-                            lines = [line.strip() for line in lines if line.strip()]
-                            
-                            # فرض کنیم خط اول اسم قطار یا شماره بلیط هست
-                            name = lines[0] if lines else "قطار نامشخص"
-                            # فرض کنیم خطی که "تومان" توشه، قیمت هست
-                            price_line = next((line for line in lines if "تومان" in line), "قیمت نامشخص")
-                            # فرض کنیم خطی که "صندلی" توشه، اطلاعات صندلی هست
-                            seat_line = next((line for line in lines if "صندلی" in line), "")
-                            
-                            results.append(f"قطار: {name}, {price_line} {seat_line}")
-                        else:
-                            results.append(f"خطا در استخراج اطلاعات بلیط {i+1}.")
-                    except Exception as e:
-                        logger.warning(f"Error extracting data from ticket container {i+1}: {e}")
-                        results.append(f"خطا در استخراج اطلاعات بلیط {i+1}.")
-
-            browser.close()
-            logger.info("Browser closed (SIMPLE).")
-
-            if results:
-                return f"🚆 نتایج جستجوی قطار از {origin} به {destination} در تاریخ {date}:\n" + "\n".join(results)
-            else:
-                return f"اطلاعاتی درباره قطار از {origin} به {destination} در تاریخ {date} پیدا نکردم."
-
+        await page.locator('a').filter(has_text=lambda text: destination in text).first.click()
+    except:
+        logger.warning(f"Could not find suggestion for destination '{destination}' with partial match. Trying exact match...")
+        # اگه روش بالا جواب نداد، سعی می‌کنه المنتی با متن دقیق destination پیدا کنه
+        await page.locator('a').filter(has_text=destination).first.click()
+
+    # 3. انتخاب تاریخ
+    logger.info("Selecting date...")
+    # کلیک روی input تاریخ برای باز کردن datepicker
+    # فرض کنیم سومین textbox فیلد تاریخ هست:
+    await page.get_by_role("textbox", name="تاریخ رفت").click() # یا nth=2 یا placeholder خاص
+    # کلیک روی روز مورد نظر
+    logger.info(f"Clicking on day: {day}")
+    day_cell = page.get_by_text(day).first
+    # صبر تا تقویم رندر بشه
+    await waits.visible("date_grid", day_cell)
+    await day_cell.click()
+
+    # 4. کلیک روی دکمه جستجو
+    logger.info("Clicking search button...")
+    await page.get_by_role("button", name="جستجو").click()
+
+    # === صبر کردن برای نتایج ===
+    logger.info("Waiting for results...")
+    # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
+    # این یه رشته منحصر به فرد از نتایج هست.
+    await waits.url("results_route", page, "**/train/**", required=False)
+    await waits.visible("results", page.locator("div:has-text('تومانانتخاب بلیط')"), timeout_ms=RESULTS_TIMEOUT_MS)
+
+
+async def _search_train_schedules_on_page(page, waits: StepWaits, origin: str, destination: str, date: str, day: str) -> list:
+    """
+    بدنه‌ی جستجوی قطار روی صفحه‌ای که استخر مرورگر می‌ده.
+    Train search body, run on a page handed out by the browser pool. Returns ScheduleRecords.
+    """
+    # شنود API جستجوی سایت از قبل از navigation (app/api_capture.py)
+    capture = ApiCapture(page, "train", origin, destination, date)
+
+    # === رفتن مستقیم به صفحه نتایج ===
+    # اگه آدرس مستقیم ساخته نشد یا نتایج نیومد، فرم جستجو پر می‌شه
+    results_marker = page.locator("div:has-text('تومانانتخاب بلیط')")
+    if not await _goto_results_directly(page, waits, train_results_url(origin, destination, date), results_marker):
+        await _submit_train_search_form(page, waits, origin, destination, day)
+
+    # === استخراج اطلاعات ===
+    # اول JSON پاسخ API جستجو؛ اگه چیزی شنود نشد، همه‌ی کارت‌ها با یک page.evaluate (app/extraction.py)
+    # و بعد تبدیل به ScheduleRecord (app/schedules.py)
+    records = await capture.records()
+    if records:
+        return records
+    logger.info("Extracting results...")
+    extracted = await extract_cards(page, "train", TRAIN_CARDS, limit=SCHEDULE_MAX_RECORDS)
+    return [parse_schedule(record["text"], record["fields"]) for record in extracted["records"]]
+
+
+@on_engine_loop
+@cached_tool("train_schedules", route_key, ("date",))
+async def train_schedule_records_async(origin: str, destination: str, date: str):
+    """
+    نسخه async از جستجوی قطار (روی event loop موتور Playwright).
+    Async train search, driven on the Playwright engine loop. Returns ScheduleRecords or a ❌ message.
+    """
+    logger.info(f"Starting search with parameters: origin={origin}, destination={destination}, date={date}")
+    # تبدیل تاریخ به فرمت سایت ('فردا'، '1403/07/15' یا '2024-10-06' -> '1403-07-15')
+    jalali = normalize_jalali_date(date)
+    if jalali is None:
+        logger.error(f"Could not parse date: {date}")
+        return _invalid_date(date)
+    date, day = jalali, _picker_day(jalali)
+    logger.info(f"Normalised date: {date}, day for date picker: {day}")
+
+    # در حالت direct بدون مرورگر، با template یاد گرفته شده از API سایت
+    records = await fetch_direct("train", origin, destination, date)
+    if records:
+        return records
+
+    waits = StepWaits("train")
+    try:
+        async with browser_pool.page() as page:
+            return await _search_train_schedules_on_page(page, waits, origin, destination, date, day)
     except Exception as e:
         logger.error(f"Error during SIMPLE train schedule scraping: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی ساده زمانبندی قطار رخ داد: {str(e)}"
+    finally:
+        waits.log()
+
+async def search_train_schedules_async(origin: str, destination: str, date: str, **filters) -> str:
+    """
+    نتایج قطار بعد از فیلتر و مرتب‌سازی سمت سرور، به شکل فشرده.
+    Compact train results after server-side filtering and sorting (see app/schedules.py).
+    """
+    records = await train_schedule_records_async(origin, destination, date)
+    if isinstance(records, str):
+        return records
+    return render_schedules(f"🚆 قطار از {origin} به {destination} در {date}", records, **filters)
+
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_train_schedules_simple(origin: str, destination: str, date: str, **filters) -> str:
+    """
+    نسخه ساده (sync) از جستجوی قطار برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async train search, for scripts and tests.
+    """
+    return run_sync(search_train_schedules_async(origin, destination, date, **filters))
 
-# wrapper نهایی (همون قبلی)
-def search_alibaba_train_schedules(origin: str, destination: str, date: str) -> str:
+async def search_alibaba_train_schedules(origin: str, destination: str, date: str, **filters) -> str:
     """
-    Wrapper نهایی که تابع sync رو تو یه thread جدا اجرا می‌کنه.
-    Final wrapper that runs the sync function in a separate thread.
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
     """
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, search_train_schedules_simple, origin, destination, date)
+    return await search_train_schedules_async(origin, destination, date, **filters)
 
 
 # --BusSreach-- 
 
-def search_bus_schedules_simple(origin: str, destination: str, date: str) -> str:
+async def _submit_bus_search_form(page, waits: StepWaits, origin: str, destination: str, day: str):
     """
-    نسخه ساده (sync) از جستجوی اتوبوس برای تست.
-    Simple (sync) version of bus search for testing.
+    پر کردن و ارسال فرم جستجوی اتوبوس (وقتی آدرس مستقیم نتایج جواب نده).
+    Fill and submit the bus search form (fallback when the direct results URL fails).
     """
-    logger.info(f"Starting search with parameters: origin={origin}, destination={destination}, date={date}")
-    # تبدیل تاریخ به فرمت مورد نیاز سایت (اگر لازم باشه)
+    url = "https://www.alibaba.ir/bus-ticket"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === پر کردن فرم ===
+    # 1. پر کردن مبدا
+    logger.info("Filling origin field...")
+    # استفاده از selector از recorder
+    await page.locator('div').filter(has_text=r'^مقصد \(شهر، پایانه\)$').locator('div').click()
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("origin_suggestions", page.locator('a').filter(has_text=origin), required=False)
+    # انتخاب شهر مبدا از suggestion
+    # فرض: suggestion شامل نام شهر و استان هست (مثلاً "اصفهان همه پایانه هااصفهان")
+    # برای سادگی، اول سعی می‌کنیم متنی پیدا کنیم که فقط نام شهر توشه.
+    logger.info(f"Selecting origin: {origin}")
     try:
-        day = date.split('/')[-1] # گرفتن آخرین بخش تاریخ که روز هست
-        logger.info(f"Extracted day for date picker: {day}")
+        await page.locator('a').filter(has_text=origin).first.click()
     except:
-        logger.error(f"Could not extract day from date: {date}")
-        day = date # اگه نتونه، خود تاریخ رو می‌فرسته
-
+        logger.warning(f"Could not find suggestion for origin '{origin}' with simple filter. Trying partial match...")
+        # اگه نشد، سعی می‌کنیم هر المنتی که شامل origin هست رو پیدا کنیم
+        await page.locator('a').filter(has_text=lambda text: origin in text).first.click()
+
+    # 2. پر کردن مقصد
+    logger.info("Filling destination field...")
+    # فرض: فیلد مقصد یه textbox ساده هست. این باید با inspect کردن صفحه واقعی بررسی بشه.
+    # برای حالات مختلف، می‌تونیم از filter یا nth استفاده کنیم.
+    # فرض کنیم دومین div.filter مربوط به مقصد هست:
+    await page.locator('div').filter(has_text=r'^مقصد \(شهر، پایانه\)$').locator('div').click()
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("destination_suggestions", page.locator('a').filter(has_text=destination), required=False)
+    # انتخاب شهر مقصد از suggestion
+    logger.info(f"Selecting destination: {destination}")
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/bus-ticket"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === پر کردن فرم ===
-            # 1. پر کردن مبدا
-            logger.info("Filling origin field...")
-            # استفاده از selector از recorder
-            page.locator('div').filter(has_text=r'^مقصد \(شهر، پایانه\)$').locator('div').click()
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000)
-            # انتخاب شهر مبدا از suggestion
-            # فرض: suggestion شامل نام شهر و استان هست (مثلاً "اصفهان همه پایانه هااصفهان")
-            # برای سادگی، اول سعی می‌کنیم متنی پیدا کنیم که فقط نام شهر توشه.
-            logger.info(f"Selecting origin: {origin}")
-            try:
-                page.locator('a').filter(has_text=origin).first.click()
-            except:
-                logger.warning(f"Could not find suggestion for origin '{origin}' with simple filter. Trying partial match...")
-                # اگه نشد، سعی می‌کنیم هر المنتی که شامل origin هست رو پیدا کنیم
-                page.locator('a').filter(has_text=lambda text: origin in text).first.click()
-
-            # 2. پر کردن مقصد
-            logger.info("Filling destination field...")
-            # فرض: فیلد مقصد یه textbox ساده هست. این باید با inspect کردن صفحه واقعی بررسی بشه.
-            # برای حالات مختلف، می‌تونیم از filter یا nth استفاده کنیم.
-            # فرض کنیم دومین div.filter مربوط به مقصد هست:
-            page.locator('div').filter(has_text=r'^مقصد \(شهر، پایانه\)$').locator('div').click()
-            # صبر کمی برای ظاهر شدن suggestion
-            page.wait_for_timeout(1000)
-            # انتخاب شهر مقصد از suggestion
-            logger.info(f"Selecting destination: {destination}")
-            try:
-                page.locator('a').filter(has_text=destination).first.click()
-            except:
-                logger.warning(f"Could not find suggestion for destination '{destination}' with simple filter. Trying partial match...")
-                page.locator('a').filter(has_text=lambda text: destination in text).first.click()
-
-            # 3. انتخاب تاریخ
-            logger.info("Selecting date...")
-            # کلیک روی input تاریخ برای باز کردن datepicker
-            # فرض: input تاریخ یه textbox با name خاص هست
-            page.get_by_role("textbox", name="تاریخ حرکت").click() # یا placeholder خاص
-            # صبر کمی برای باز شدن تقویم
-            page.wait_for_timeout(1000)
-            # کلیک روی روز مورد نظر
-            logger.info(f"Clicking on day: {day}")
-            page.get_by_text(day).first.click()
-
-            # 4. کلیک روی دکمه جستجو
-            logger.info("Clicking search button...")
-            page.get_by_role("button", name="جستجو").click()
-
-            # === صبر کردن برای نتایج ===
-            logger.info("Waiting for results...")
-            # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
-            # این یه رشته منحصر به فرد از نتایج هست.
-            page.wait_for_selector("text=بین‌راهی", timeout=30000) # یا "text=تکمیل ظرفیت"
-
-            # === استخراج اطلاعات ===
-            logger.info("Extracting results...")
-            results = []
-            # روش 1: پیدا کردن همه المنت‌هایی که اطلاعات بلیط توشه
-            # دوباره از المنتی که قبلاً استفاده کردیم به عنوان پایه استفاده می‌کنیم
-            # این یه فرض اولیه هست. باید با inspect کردن صفحه نتایج واقعی بررسی بشه.
-            # فرض کنیم هر نتیجه تو یه div با کلاس خاص هست.
-            bus_items = page.locator(".bus-item, .BusCard, [class*='bus'], [class*='Bus']") # این selector باید تغییر کنه
-            count = bus_items.count()
-            logger.info(f"Found {count} potential bus items.")
-            
-            if count == 0:
-                 # اگه روش بالا جواب نداد، روش قبلی (جستجو برای "اتوبوس") رو امتحان کن
-                 logger.info("Trying alternative selector for bus results...")
-                 # فرض کنیم نتایج تو یه div با کلاس خاص هستن
-                 bus_cards = page.locator(".bus-search-result-item, .available-bus, [data-test*='bus']")
-                 count = bus_cards.count()
-                 logger.info(f"Found {count} bus cards with alternative selector.")
-                 if count == 0:
-                      results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
-                 else:
-                      # پردازش bus_cards
-                      for i in range(min(count, 3)):
-                          try:
-                              card = bus_cards.nth(i)
-                              # استخراج اطلاعات از card
-                              # این selector ها باید با inspect کردن صفحه واقعی پیدا بشن.
-                              # مثلاً:
-                              company_elem = card.locator(".company-name, .bus-company, [class*='company']")
-                              departure_elem = card.locator(".departure-time, .bus-departure, [class*='departure']")
-                              arrival_elem = card.locator(".arrival-time, .bus-arrival, [class*='arrival']")
-                              price_elem = card.locator(".price, .bus-price, [class*='price']")
-                              seats_elem = card.locator(".seats-left, .bus-seats, [class*='seats']")
-                              
-                              def safe_text_content(locator_obj):
-                                  try:
-                                      if locator_obj.count() > 0:
-                                          return locator_obj.first.text_content(timeout=2000).strip()
-                                      else:
-                                          return ""
-                                  except:
-                                      return ""
-                              
-                              company = safe_text_content(company_elem) or "شرکت نامشخص"
-                              departure = safe_text_content(departure_elem) or "زمان حرکت نامشخص"
-                              arrival = safe_text_content(arrival_elem) or "زمان رسیدن نامشخص"
-                              price = safe_text_content(price_elem) or "قیمت نامشخص"
-                              seats = safe_text_content(seats_elem) or ""
-                              
-                              results.append(f"🚌 {company} - {departure} -> {arrival} - {price} ({seats})")
-                          except Exception as e:
-                              logger.warning(f"Error extracting data from bus card {i+1}: {e}")
-                              results.append(f"خطا در استخراج اطلاعات اتوبوس {i+1}.")
-            else:
-                # پردازش bus_items
-                 for i in range(min(count, 3)):
-                     try:
-                         item = bus_items.nth(i)
-                         # استخراج اطلاعات از item
-                         # selector ها باید با inspect کردن صفحه واقعی پیدا بشن.
-                         company_elem = item.locator(".company-name, .bus-company")
-                         departure_elem = item.locator(".departure-time, .bus-departure")
-                         arrival_elem = item.locator(".arrival-time, .bus-arrival")
-                         price_elem = item.locator(".price, .bus-price").first
-                         seats_elem = item.locator(".seats-left, .bus-seats")
-                         
-                         def safe_text_content_sync(locator_obj):
-                             try:
-                                 if locator_obj.count() > 0:
-                                     return locator_obj.text_content(timeout=2000).strip() # برای sync
-                                 else:
-                                     return ""
-                             except:
-                                 return ""
-                         
-                         company = safe_text_content_sync(company_elem) or "شرکت نامشخص"
-                         departure = safe_text_content_sync(departure_elem) or "زمان حرکت نامشخص"
-                         arrival = safe_text_content_sync(arrival_elem) or "زمان رسیدن نامشخص"
-                         price = safe_text_content_sync(price_elem) or "قیمت نامشخص"
-                         seats = safe_text_content_sync(seats_elem) or ""
-                         
-                         results.append(f"🚌 {company} - {departure} -> {arrival} - {price} ({seats})")
-                     except Exception as e:
-                         logger.warning(f"Error extracting data from bus item {i+1}: {e}")
-                         results.append(f"خطا در استخراج اطلاعات اتوبوس {i+1}.")
-
-            browser.close()
-            logger.info("Browser closed (BUS SIMPLE).")
-
-            if results:
-                return f"🚌 نتایج جستجوی اتوبوس از {origin} به {destination} در تاریخ {date}:\n" + "\n".join(results)
-            else:
-                return f"اطلاعاتی درباره اتوبوس از {origin} به {destination} در تاریخ {date} پیدا نکردم."
-
+        await page.locator('a').filter(has_text=destination).first.click()
+    except:
+        logger.warning(f"Could not find suggestion for destination '{destination}' with simple filter. Trying partial match...")
+        await page.locator('a').filter(has_text=lambda text: destination in text).first.click()
+
+    # 3. انتخاب تاریخ
+    logger.info("Selecting date...")
+    # کلیک روی input تاریخ برای باز کردن datepicker
+    # فرض: input تاریخ یه textbox با name خاص هست
+    await page.get_by_role("textbox", name="تاریخ حرکت").click() # یا placeholder خاص
+    # کلیک روی روز مورد نظر
+    logger.info(f"Clicking on day: {day}")
+    day_cell = page.get_by_text(day).first
+    # صبر تا تقویم رندر بشه
+    await waits.visible("date_grid", day_cell)
+    await day_cell.click()
+
+    # 4. کلیک روی دکمه جستجو
+    logger.info("Clicking search button...")
+    await page.get_by_role("button", name="جستجو").click()
+
+    # === صبر کردن برای نتایج ===
+    logger.info("Waiting for results...")
+    # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
+    # این یه رشته منحصر به فرد از نتایج هست.
+    await waits.visible("results", page.locator("text=بین‌راهی"), timeout_ms=RESULTS_TIMEOUT_MS) # یا "text=تکمیل ظرفیت"
+
+
+async def _search_bus_schedules_on_page(page, waits: StepWaits, origin: str, destination: str, date: str, day: str) -> list:
+    """
+    بدنه‌ی جستجوی اتوبوس روی صفحه‌ای که استخر مرورگر می‌ده.
+    Bus search body, run on a page handed out by the browser pool. Returns ScheduleRecords.
+    """
+    # شنود API جستجوی سایت از قبل از navigation (app/api_capture.py)
+    capture = ApiCapture(page, "bus", origin, destination, date)
+
+    # === رفتن مستقیم به صفحه نتایج ===
+    # اگه آدرس مستقیم ساخته نشد یا نتایج نیومد، فرم جستجو پر می‌شه
+    results_marker = page.locator("text=بین‌راهی")
+    if not await _goto_results_directly(page, waits, bus_results_url(origin, destination, date), results_marker):
+        await _submit_bus_search_form(page, waits, origin, destination, day)
+
+    # === استخراج اطلاعات ===
+    # اول JSON پاسخ API جستجو؛ اگه چیزی شنود نشد، همه‌ی کارت‌ها با یک page.evaluate (app/extraction.py)
+    # و بعد تبدیل به ScheduleRecord (app/schedules.py)
+    records = await capture.records()
+    if records:
+        return records
+    logger.info("Extracting results...")
+    extracted = await extract_cards(page, "bus", BUS_CARDS, limit=SCHEDULE_MAX_RECORDS)
+    return [parse_schedule(record["text"], record["fields"]) for record in extracted["records"]]
+
+
+@on_engine_loop
+@cached_tool("bus_schedules", route_key, ("date",))
+async def bus_schedule_records_async(origin: str, destination: str, date: str):
+    """
+    نسخه async از جستجوی اتوبوس (روی event loop موتور Playwright).
+    Async bus search, driven on the Playwright engine loop. Returns ScheduleRecords or a ❌ message.
+    """
+    logger.info(f"Starting search with parameters: origin={origin}, destination={destination}, date={date}")
+    # تبدیل تاریخ به فرمت سایت ('فردا'، '1403/07/15' یا '2024-10-06' -> '1403-07-15')
+    jalali = normalize_jalali_date(date)
+    if jalali is None:
+        logger.error(f"Could not parse date: {date}")
+        return _invalid_date(date)
+    date, day = jalali, _picker_day(jalali)
+    logger.info(f"Normalised date: {date}, day for date picker: {day}")
+
+    # در حالت direct بدون مرورگر، با template یاد گرفته شده از API سایت
+    records = await fetch_direct("bus", origin, destination, date)
+    if records:
+        return records
+
+    waits = StepWaits("bus")
+    try:
+        async with browser_pool.page() as page:
+            return await _search_bus_schedules_on_page(page, waits, origin, destination, date, day)
     except Exception as e:
         logger.error(f"Error during SIMPLE bus schedule scraping: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی ساده زمانبندی اتوبوس رخ داد: {str(e)}"
+    finally:
+        waits.log()
+
+async def search_bus_schedules_async(origin: str, destination: str, date: str, **filters) -> str:
+    """
+    نتایج اتوبوس بعد از فیلتر و مرتب‌سازی سمت سرور، به شکل فشرده.
+    Compact bus results after server-side filtering and sorting (see app/schedules.py).
+    """
+    records = await bus_schedule_records_async(origin, destination, date)
+    if isinstance(records, str):
+        return records
+    return render_schedules(f"🚌 اتوبوس از {origin} به {destination} در {date}", records, **filters)
+
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_bus_schedules_simple(origin: str, destination: str, date: str, **filters) -> str:
+    """
+    نسخه ساده (sync) از جستجوی اتوبوس برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async bus search, for scripts and tests.
+    """
+    return run_sync(search_bus_schedules_async(origin, destination, date, **filters))
 
-# به‌روزرسانی wrapper برای استفاده از نسخه sync جدید
-def search_alibaba_bus_schedules(origin: str, destination: str, date: str) -> str:
+async def search_alibaba_bus_schedules(origin: str, destination: str, date: str, **filters) -> str:
     """
-    Wrapper نهایی که تابع sync رو تو یه thread جدا اجرا می‌کنه.
-    Final wrapper that runs the sync function in a separate thread.
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
     """
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, search_bus_schedules_simple, origin, destination, date)
+    return await search_bus_schedules_async(origin, destination, date, **filters)
 
 # --TourSearch--
 
-def search_tour_info_simple(origin: str, destination: str, start_date: str, end_date: str) -> str:
+async def _submit_tour_search_form(page, waits: StepWaits, origin: str, destination: str, start_day: str, end_day: str):
+    """
+    پر کردن و ارسال فرم جستجوی تور (وقتی آدرس مستقیم نتایج جواب نده).
+    Fill and submit the tour search form (fallback when the direct results URL fails).
+    """
+    url = "https://www.alibaba.ir/tour"
+    logger.info(f"Navigating to {url}")
+    await page.goto(url, wait_until='networkidle')
+
+    # === پر کردن فرم ===
+    # 1. پر کردن مبدا
+    logger.info("Filling origin field...")
+    await page.get_by_role("textbox", name="مبدا (شهر)").click()
+    logger.info(f"Selecting origin: {origin}")
+    origin_option = page.locator('a').filter(has_text=f"^{origin}$") # فرض: متن دقیق شهر
+    # صبر تا suggestion ظاهر بشه
+    await waits.visible("origin_suggestions", origin_option)
+    await origin_option.click()
+
+    # 2. پر کردن مقصد
+    logger.info("Filling destination field...")
+    # فرض: فیلد مقصد هم یه textbox با name خاص هست
+    await page.get_by_role("textbox", name="مقصد (شهر)").click() # یا placeholder خاص
+    logger.info(f"Selecting destination: {destination}")
+    destination_option = page.locator('a').filter(has_text=f"^{destination}$") # فرض: متن دقیق شهر
+    await waits.visible("destination_suggestions", destination_option)
+    await destination_option.click()
+
+    # 3. (اختیاری) انتخاب نوع تور - فعلاً این مرحله رو رد می‌کنیم
+    # logger.info("Selecting tour type...")
+    # page.locator('label').filter({ hasText: 'تور گردشگری ...' }).locator('div span').click()
+
+    # 4. انتخاب تاریخ رفت
+    logger.info("Selecting start date...")
+    await page.get_by_role("textbox", name="تاریخ رفت").click()
+    logger.info(f"Clicking on start day: {start_day}")
+    start_cell = page.get_by_text(start_day, exact=True).first
+    # صبر تا تقویم رندر بشه
+    await waits.visible("start_date_grid", start_cell)
+    await start_cell.click()
+
+    # 5. انتخاب تاریخ برگشت
+    logger.info("Selecting end date...")
+    # فرض: تقویم هنوز باز هست یا دوباره باز می‌شه.
+    # page.get_by_role("textbox", name="تاریخ برگشت").click() # اگه نیاز به کلیک داره
+    logger.info(f"Clicking on end day: {end_day}")
+    end_cell = page.get_by_text(end_day).nth(1) # nth(1) برای دومین تاریخ
+    await waits.visible("end_date_grid", end_cell)
+    await end_cell.click()
+
+    # 6. (اختیاری) انتخاب تعداد مسافران - فعلاً این مرحله رو رد می‌کنیم
+    # logger.info("Selecting passengers...")
+    # page.get_by_role("textbox", name="مسافران").click()
+
+    # 7. کلیک روی دکمه جستجو
+    logger.info("Clicking search button...")
+    await page.get_by_role("button", name="جستجو").click()
+
+    # === صبر کردن برای نتایج ===
+    logger.info("Waiting for results...")
+    # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
+    await waits.visible("results", page.locator(TOUR_RESULTS_MARKER), timeout_ms=RESULTS_TIMEOUT_MS)
+
+
+async def _search_tour_info_on_page(page, waits: StepWaits, origin: str, destination: str, start_date: str, end_date: str, start_day: str, end_day: str) -> str:
     """
-    نسخه ساده (sync) از جستجوی تور برای تست.
-    Simple (sync) version of tour search for testing.
+    بدنه‌ی جستجوی تور روی صفحه‌ای که استخر مرورگر می‌ده.
+    Tour search body, run on a page handed out by the browser pool.
+    """
+    # === رفتن مستقیم به صفحه نتایج ===
+    # اگه آدرس مستقیم ساخته نشد یا نتایج نیومد، فرم جستجو پر می‌شه
+    # "ستاره" رو هر صفحه‌ی تور هست؛ فقط کارت نتیجه یعنی آدرس مستقیم جواب داده
+    results_marker = page.locator(TOUR_RESULTS_MARKER)
+    if not await _goto_results_directly(page, waits, tour_results_url(origin, destination, start_date, end_date), results_marker):
+        await _submit_tour_search_form(page, waits, origin, destination, start_day, end_day)
+
+    # === استخراج اطلاعات ===
+    # همه‌ی کارت‌ها با یک page.evaluate (app/extraction.py)
+    logger.info("Extracting results...")
+    results = []
+    extracted = await extract_cards(page, "tour", TOUR_CARDS)
+    if not extracted["records"]:
+        results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
+    for record in extracted["records"]:
+        fields = record["fields"]
+        name = fields["name"] or "تور نامشخص"
+        price = fields["price"] or "قیمت نامشخص"
+        rating = fields["rating"]
+        duration = fields["duration"]
+        results.append(f"🌍 {name} - {price} ({rating}) - {duration}")
+
+    if results:
+        return f"🌍 نتایج جستجوی تور از {origin} به {destination} از {start_date} تا {end_date}:\n" + "\n".join(results)
+    else:
+        return f"اطلاعاتی درباره تور از {origin} به {destination} از {start_date} تا {end_date} پیدا نکردم."
+
+
+@on_engine_loop
+@cached_tool("tour_info", tour_key, ("start_date", "end_date"))
+async def search_tour_info_async(origin: str, destination: str, start_date: str, end_date: str) -> str:
+    """
+    نسخه async از جستجوی تور (روی event loop موتور Playwright).
+    Async tour search, driven on the Playwright engine loop.
     """
     logger.info(f"Starting tour search with parameters: origin={origin}, destination={destination}, start_date={start_date}, end_date={end_date}")
-    # تبدیل تاریخ به فرمت مورد نیاز سایت (اگر لازم باشه)
+    # تبدیل تاریخ‌ها به فرمت سایت ('فردا'، '1403/07/15' یا '2024-10-06' -> '1403-07-15')
+    start, end = normalize_jalali_date(start_date), normalize_jalali_date(end_date)
+    if start is None or end is None:
+        logger.error(f"Could not parse dates: start={start_date}, end={end_date}")
+        return _invalid_date(end_date if start else start_date)
+    start_date, end_date = start, end
+    start_day, end_day = _picker_day(start), _picker_day(end)
+    logger.info(f"Extracted days for date pickers: start={start_day}, end={end_day}")
+
+    waits = StepWaits("tour")
     try:
-        start_day = start_date.split('/')[-1]
-        end_day = end_date.split('/')[-1]
-        logger.info(f"Extracted days for date pickers: start={start_day}, end={end_day}")
-    except:
-        logger.error(f"Could not extract days from dates: start={start_date}, end={end_date}")
-        start_day = start_date
-        end_day = end_date
-
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_viewport_size({"width": 1280, "height": 1024})
-
-            url = "https://www.alibaba.ir/tour"
-            logger.info(f"Navigating to {url}")
-            page.goto(url, wait_until='networkidle')
-
-            # === پر کردن فرم ===
-            # 1. پر کردن مبدا
-            logger.info("Filling origin field...")
-            page.get_by_role("textbox", name="مبدا (شهر)").click()
-            page.wait_for_timeout(1000)
-            logger.info(f"Selecting origin: {origin}")
-            page.locator('a').filter(has_text=f"^{origin}$").click() # فرض: متن دقیق شهر
-
-            # 2. پر کردن مقصد
-            logger.info("Filling destination field...")
-            # فرض: فیلد مقصد هم یه textbox با name خاص هست
-            page.get_by_role("textbox", name="مقصد (شهر)").click() # یا placeholder خاص
-            page.wait_for_timeout(1000)
-            logger.info(f"Selecting destination: {destination}")
-            page.locator('a').filter(has_text=f"^{destination}$").click() # فرض: متن دقیق شهر
-
-            # 3. (اختیاری) انتخاب نوع تور - فعلاً این مرحله رو رد می‌کنیم
-            # logger.info("Selecting tour type...")
-            # page.locator('label').filter({ hasText: 'تور گردشگری ...' }).locator('div span').click()
-
-            # 4. انتخاب تاریخ رفت
-            logger.info("Selecting start date...")
-            page.get_by_role("textbox", name="تاریخ رفت").click()
-            page.wait_for_timeout(1000)
-            logger.info(f"Clicking on start day: {start_day}")
-            page.get_by_text(start_day, exact=True).first.click()
-
-            # 5. انتخاب تاریخ برگشت
-            logger.info("Selecting end date...")
-            # فرض: تقویم هنوز باز هست یا دوباره باز می‌شه.
-            # page.get_by_role("textbox", name="تاریخ برگشت").click() # اگه نیاز به کلیک داره
-            page.wait_for_timeout(1000)
-            logger.info(f"Clicking on end day: {end_day}")
-            page.get_by_text(end_day).nth(1).click() # nth(1) برای دومین تاریخ
-
-            # 6. (اختیاری) انتخاب تعداد مسافران - فعلاً این مرحله رو رد می‌کنیم
-            # logger.info("Selecting passengers...")
-            # page.get_by_role("textbox", name="مسافران").click()
-
-            # 7. کلیک روی دکمه جستجو
-            logger.info("Clicking search button...")
-            page.get_by_role("button", name="جستجو").click()
-
-            # === صبر کردن برای نتایج ===
-            logger.info("Waiting for results...")
-            # استفاده از المنتی که تو کد recorder ظاهر می‌شد به عنوان نشانه
-            page.wait_for_selector("text=ستاره", timeout=30000) # یا "text=تومان"
-
-            # === استخراج اطلاعات ===
-            logger.info("Extracting results...")
-            results = []
-            # روش 1: پیدا کردن همه المنت‌هایی که اطلاعات تور توشه
-            # فرض کنیم هر نتیجه تو یه div با کلاس خاص هست.
-            tour_items = page.locator(".tour-item, .TourCard, [class*='tour'], [class*='Tour']") # این selector باید تغییر کنه
-            count = tour_items.count()
-            logger.info(f"Found {count} potential tour items.")
-            
-            if count == 0:
-                 # اگه روش بالا جواب نداد، روش قبلی (جستجو برای "تور") رو امتحان کن
-                 logger.info("Trying alternative selector for tour results...")
-                 tour_cards = page.locator(".tour-search-result-item, .available-tour, [data-test*='tour']")
-                 count = tour_cards.count()
-                 logger.info(f"Found {count} tour cards with alternative selector.")
-                 if count == 0:
-                      results.append("نتیجه‌ای یافت نشد یا ساختار صفحه تغییر کرده.")
-                 else:
-                      for i in range(min(count, 3)):
-                          try:
-                              card = tour_cards.nth(i)
-                              # استخراج اطلاعات از card
-                              name_elem = card.locator(".tour-name, .TourCard__name, h3, [class*='name']")
-                              price_elem = card.locator(".price, .TourCard__price, [class*='price']")
-                              rating_elem = card.locator(".rating, .TourCard__rating, [class*='rating']")
-                              duration_elem = card.locator(".duration, .TourCard__duration, [class*='duration']")
-                              
-                              def safe_text_content(locator_obj):
-                                  try:
-                                      if locator_obj.count() > 0:
-                                          return locator_obj.first.text_content(timeout=2000).strip()
-                                      else:
-                                          return ""
-                                  except:
-                                      return ""
-                              
-                              name = safe_text_content(name_elem) or "تور نامشخص"
-                              price = safe_text_content(price_elem) or "قیمت نامشخص"
-                              rating = safe_text_content(rating_elem) or ""
-                              duration = safe_text_content(duration_elem) or ""
-                              
-                              results.append(f"🌍 {name} - {price} ({rating}) - {duration}")
-                          except Exception as e:
-                              logger.warning(f"Error extracting data from tour card {i+1}: {e}")
-                              results.append(f"خطا در استخراج اطلاعات تور {i+1}.")
-            else:
-                # پردازش tour_items
-                 for i in range(min(count, 3)):
-                     try:
-                         item = tour_items.nth(i)
-                         # استخراج اطلاعات از item
-                         name_elem = item.locator(".tour-name, .TourCard__name")
-                         price_elem = item.locator(".price, .TourCard__price").first
-                         rating_elem = item.locator(".rating, .TourCard__rating")
-                         duration_elem = item.locator(".duration, .TourCard__duration")
-                         
-                         def safe_text_content_sync(locator_obj):
-                             try:
-                                 if locator_obj.count() > 0:
-                                     return locator_obj.text_content(timeout=2000).strip() # برای sync
-                                 else:
-                                     return ""
-                             except:
-                                 return ""
-                         
-                         name = safe_text_content_sync(name_elem) or "تور نامشخص"
-                         price = safe_text_content_sync(price_elem) or "قیمت نامشخص"
-                         rating = safe_text_content_sync(rating_elem) or ""
-                         duration = safe_text_content_sync(duration_elem) or ""
-                         
-                         results.append(f"🌍 {name} - {price} ({rating}) - {duration}")
-                     except Exception as e:
-                         logger.warning(f"Error extracting data from tour item {i+1}: {e}")
-                         results.append(f"خطا در استخراج اطلاعات تور {i+1}.")
-
-            browser.close()
-            logger.info("Browser closed (TOUR SIMPLE).")
-
-            if results:
-                return f"🌍 نتایج جستجوی تور از {origin} به {destination} از {start_date} تا {end_date}:\n" + "\n".join(results)
-            else:
-                return f"اطلاعاتی درباره تور از {origin} به {destination} از {start_date} تا {end_date} پیدا نکردم."
-
+        async with browser_pool.page() as page:
+            return await _search_tour_info_on_page(page, waits, origin, destination, start_date, end_date, start_day, end_day)
     except Exception as e:
         logger.error(f"Error during SIMPLE tour info scraping: {e}", exc_info=True)
         return f"❌ خطایی در جستجوی ساده اطلاعات تور رخ داد: {str(e)}"
+    finally:
+        waits.log()
+
+# Adapter sync (برای اسکریپت و تست) و wrapper async (برای ایجنت)
+def search_tour_info_simple(origin: str, destination: str, start_date: str, end_date: str) -> str:
+    """
+    نسخه ساده (sync) از جستجوی تور برای اسکریپت‌ها و تست.
+    Simple (sync) adapter over the async tour search, for scripts and tests.
+    """
+    return run_sync(search_tour_info_async(origin, destination, start_date, end_date))
 
-# اضافه کردن wrapper برای ابزار تور
-def search_alibaba_tour_info(origin: str, destination: str, start_date: str, end_date: str) -> str:
+async def search_alibaba_tour_info(origin: str, destination: str, start_date: str, end_date: str) -> str:
     """
-    Wrapper نهایی که تابع sync رو تو یه thread جدا اجرا می‌کنه.
-    Final wrapper that runs the sync function in a separate thread.
+    Wrapper async نهایی که ایجنت به عنوان coroutine ابزار صداش می‌کنه.
+    Final async wrapper used by the agent as the tool coroutine.
     """
-    loop = asyncio.get_event_loop()
-    # توجه: این تابع 4 آرگومان می‌گیره، در حالی که wrapper قبلی‌ها 3 تا می‌گرفتن
-    # باید یه تابع lambda یا partial بسازیم تا آرگومان‌ها رو درست بفرستیم
-    from functools import partial
-    return loop.run_in_executor(None, partial(search_tour_info_simple, origin=origin, destination=destination, start_date=start_date, end_date=end_date))
+    return await search_tour_info_async(origin, destination, start_date, end_date)
 
 
@@ -0,0 +1,214 @@
+# app/prefetch.py
+"""
+گرم نگه داشتن cache برای مسیرها و سوال‌های پرتکرار: اجرای دوره‌ای ابزارها پشت صحنه.
+Background prefetch: periodically re-run the most requested tool calls so their results stay cached.
+
+Each cycle takes the configured queries (PREFETCH_QUERIES_FILE, or the
+built-in defaults) plus the top PREFETCH_TOP_N calls from the tool-call log
+in app/tool_execution.py, and runs them through the same cached functions the
+tools use, at most PREFETCH_CONCURRENCY at a time and each after a random
+delay of up to PREFETCH_JITTER_SECONDS.
+
+Playwright results (app/result_cache.py) are recomputed only when they would
+expire before the next cycle; users keep getting the old entry meanwhile.
+Tavily results go through app/search_cache.py, which already refreshes stale
+entries in the background, so a fresh entry costs nothing.
+
+PREFETCH_QUERIES_FILE is a JSON list like
+    [{"tool": "search_alibaba_flight_schedules", "args": {"origin": "تهران", "destination": "مشهد"}},
+     {"tool": "search_alibaba_faqs", "args": {"query": "استرداد بلیط", "category": "flight-domestic"}}]
+Schedule entries without a date are expanded to every date in PREFETCH_DATES.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import inspect
+import logging
+from dotenv import load_dotenv
+
+from app.result_cache import refresh_margin
+from app.tool_execution import popular_calls, get_breaker, tool_timeout
+from app.url_builder import normalize_jalali_date
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+# فاصله‌ی بین دو دور (ثانیه)؛ کمتر از TTL پرواز (5 دقیقه) تا cache پرواز هم خالی نشه
+PREFETCH_INTERVAL_SECONDS = float(os.getenv("PREFETCH_INTERVAL_SECONDS", "240"))
+PREFETCH_JITTER_SECONDS = float(os.getenv("PREFETCH_JITTER_SECONDS", "30"))
+# حداکثر تعداد ابزاری که همزمان پشت صحنه اجرا می‌شه (مرورگرهای استخر با کاربرها مشترکن)
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "20"))
+PREFETCH_START_DELAY_SECONDS = float(os.getenv("PREFETCH_START_DELAY_SECONDS", "30"))
+PREFETCH_QUERIES_FILE = os.getenv("PREFETCH_QUERIES_FILE", "")
+PREFETCH_DATES = [day.strip() for day in os.getenv("PREFETCH_DATES", "امروز,فردا").split(",") if day.strip()]
+
+# ابزارهایی که با تاریخ حرکت کار می‌کنن
+SCHEDULE_TOOLS = ("search_alibaba_flight_schedules", "search_alibaba_train_schedules", "search_alibaba_bus_schedules")
+
+DEFAULT_PREFETCH_QUERIES = [
+    {"tool": "search_alibaba_flight_schedules", "args": {"origin": "تهران", "destination": "مشهد"}},
+    {"tool": "search_alibaba_flight_schedules", "args": {"origin": "تهران", "destination": "کیش"}},
+    {"tool": "search_alibaba_flight_schedules", "args": {"origin": "تهران", "destination": "شیراز"}},
+    {"tool": "search_alibaba_train_schedules", "args": {"origin": "تهران", "destination": "مشهد"}},
+    {"tool": "search_alibaba_faqs", "args": {"query": "پرواز داخلی", "category": "flight-domestic"}},
+    {"tool": "search_alibaba_faqs", "args": {"query": "استرداد بلیط", "category": ""}},
+    {"tool": "search_alibaba_faqs", "args": {"query": "بار مجاز", "category": ""}},
+]
+
+prefetch_stats = {"cycles": 0, "calls": 0, "skipped": 0, "errors": 0}
+_task = None
+
+
+def prefetch_targets() -> dict:
+    """
+    اسم ابزار -> تابع cache شده‌ای که prefetch صدا می‌زنه (بدون فیلترهای نمایش).
+    Tool name -> the cached coroutine function prefetch runs for it.
+    """
+    # import تنبل: بدون prefetch نیازی به بارگذاری ابزارها تو این ماژول نیست
+    from app import playwright, tavily
+    return {
+        "search_alibaba_flight_schedules": playwright.flight_schedule_records_async,
+        "search_alibaba_train_schedules": playwright.train_schedule_records_async,
+        "search_alibaba_bus_schedules": playwright.bus_schedule_records_async,
+        "search_alibaba_hotel_info": playwright.search_hotel_info_async,
+        "search_alibaba_villa_info": playwright.search_villa_info_async,
+        "search_alibaba_tour_info": playwright.search_tour_info_async,
+        "search_alibaba_faqs_interactive": playwright.search_faq_async,
+        "search_alibaba_faqs": tavily.search_alibaba_faqs_async,
+        "search_alibaba_general": tavily.search_alibaba_general_async,
+        "search_alibaba_flights_domestic": tavily.search_alibaba_flights_iran_async,
+        "search_alibaba_trains": tavily.search_alibaba_trains_async,
+        "search_alibaba_buses": tavily.search_alibaba_buses_async,
+        "search_alibaba_hotels_general": tavily.search_alibaba_hotels_async,
+        "search_alibaba_tours": tavily.search_alibaba_tours_async,
+    }
+
+
+def configured_queries() -> list:
+    if not PREFETCH_QUERIES_FILE:
+        return DEFAULT_PREFETCH_QUERIES
+    try:
+        with open(PREFETCH_QUERIES_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read PREFETCH_QUERIES_FILE {PREFETCH_QUERIES_FILE}: {e}")
+        return DEFAULT_PREFETCH_QUERIES
+
+
+def _expand(name: str, args: dict) -> list:
+    """
+    تاریخ‌های PREFETCH_DATES برای ابزارهای زمانبندی بدون تاریخ، به شکل نرمال‌شده‌ی 'YYYY-MM-DD'؛
+    تاریخ‌های نامعتبر و گذشته حذف می‌شن.
+    """
+    if name not in SCHEDULE_TOOLS:
+        return [args]
+    today = normalize_jalali_date("امروز")
+    dates = [normalize_jalali_date(day) for day in ([args["date"]] if args.get("date") else PREFETCH_DATES)]
+    return [{**args, "date": date} for date in dict.fromkeys(dates) if date is not None and date >= today]
+
+
+def plan(targets: dict) -> list:
+    """
+    لیست (ابزار، آرگومان‌ها) این دور: صف تنظیم شده + پرتکرارهای لاگ، بدون تکرار.
+    This cycle's (tool, args) list: the configured queries, then the most frequent logged calls.
+    """
+    configured = [(query, False) for query in configured_queries()]
+    logged = [({"tool": name, "args": args}, True) for name, args, _ in popular_calls(PREFETCH_TOP_N * 3)]
+    jobs, seen, from_log = [], set(), 0
+    for query, is_logged in configured + logged:
+        if is_logged and from_log >= PREFETCH_TOP_N:
+            break
+        name, fn = query.get("tool"), targets.get(query.get("tool"))
+        if fn is None:
+            continue
+        # فقط آرگومان‌های خود تابع (فیلترهایی مثل sort_by و top_k روی نتیجه‌ی cache شده اعمال می‌شن)
+        params = inspect.signature(fn).parameters
+        args = {key: value for key, value in (query.get("args") or {}).items() if key in params}
+        added = False
+        for expanded in _expand(name, args):
+            key = (name, json.dumps(expanded, ensure_ascii=False, sort_keys=True))
+            if key not in seen:
+                seen.add(key)
+                jobs.append((name, expanded))
+                added = True
+        from_log += is_logged and added
+    return jobs
+
+
+async def _prefetch_one(semaphore: asyncio.Semaphore, name: str, fn, args: dict):
+    await asyncio.sleep(random.uniform(0, PREFETCH_JITTER_SECONDS))
+    async with semaphore:
+        # ابزاری که مدارش بازه رو پشت صحنه هم صدا نمی‌زنیم
+        if get_breaker(name).state == "open":
+            prefetch_stats["skipped"] += 1
+            return
+        # ورودی‌هایی که تا دور بعد منقضی می‌شن دوباره حساب می‌شن
+        refresh_margin.set(PREFETCH_INTERVAL_SECONDS + 2 * PREFETCH_JITTER_SECONDS)
+        try:
+            result = await asyncio.wait_for(fn(**args), timeout=tool_timeout(name))
+        except asyncio.TimeoutError:
+            prefetch_stats["errors"] += 1
+            logger.warning(f"Prefetch {name} {args} timed out.")
+            return
+        except Exception as e:
+            prefetch_stats["errors"] += 1
+            logger.warning(f"Prefetch {name} {args} failed: {e}")
+            return
+        prefetch_stats["calls"] += 1
+        if isinstance(result, str) and result.startswith("❌"):
+            prefetch_stats["errors"] += 1
+
+
+async def prefetch_once():
+    """
+    یک دور prefetch با سقف همزمانی و jitter.
+    One prefetch cycle under the concurrency budget, with jitter.
+    """
+    targets = prefetch_targets()
+    jobs = plan(targets)
+    semaphore = asyncio.Semaphore(max(1, PREFETCH_CONCURRENCY))
+    started = time.perf_counter()
+    # هر job تو task خودش اجرا می‌شه، پس refresh_margin به بقیه‌ی برنامه نشت نمی‌کنه
+    await asyncio.gather(*(_prefetch_one(semaphore, name, targets[name], args) for name, args in jobs))
+    prefetch_stats["cycles"] += 1
+    logger.info(f"🔥 Prefetched {len(jobs)} tool calls in {time.perf_counter() - started:.1f}s: {prefetch_stats}")
+
+
+async def _run():
+    await asyncio.sleep(PREFETCH_START_DELAY_SECONDS)
+    while True:
+        try:
+            await prefetch_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Prefetch cycle failed: {e}", exc_info=True)
+        await asyncio.sleep(PREFETCH_INTERVAL_SECONDS + random.uniform(-PREFETCH_JITTER_SECONDS, PREFETCH_JITTER_SECONDS))
+
+
+def start_prefetch():
+    """شروع prefetch دوره‌ای روی event loop برنامه (اگه PREFETCH_ENABLED=true باشه)."""
+    global _task
+    if PREFETCH_ENABLED and _task is None:
+        logger.info(f"🔥 Prefetch every {PREFETCH_INTERVAL_SECONDS:.0f}s "
+                    f"(concurrency {PREFETCH_CONCURRENCY}, top {PREFETCH_TOP_N}).")
+        _task = asyncio.get_running_loop().create_task(_run())
+
+
+async def stop_prefetch():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,131 @@
+# app/request_blocking.py
+import os
+import logging
+from urllib.parse import urlsplit
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- Blocking policy ---
+# نوع منابعی که استخراج متن هیچ‌وقت بهشون نیاز نداره
+BLOCKED_RESOURCE_TYPES = {
+    t.strip() for t in os.getenv("SCRAPER_BLOCKED_RESOURCE_TYPES", "image,font,media").split(",") if t.strip()
+}
+
+# دامنه‌های آنالیتیکس، تبلیغات و ردیاب‌ها (زیر دامنه‌ها هم بلاک می‌شن)
+DEFAULT_BLOCKED_HOSTS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "mc.yandex.ru",
+    "yandex.ru",
+    "webengage.com",
+    "najva.com",
+    "pushe.co",
+    "sentry.io",
+]
+BLOCKED_HOSTS = DEFAULT_BLOCKED_HOSTS + [
+    h.strip().lower() for h in os.getenv("SCRAPER_BLOCKED_HOSTS", "").split(",") if h.strip()
+]
+
+# میانگین تقریبی حجم هر نوع منبع (بایت) برای تخمین حجم صرفه‌جویی شده.
+# درخواست بلاک شده هیچ‌وقت پاسخی نمی‌گیره، پس حجم واقعیش معلوم نیست.
+ESTIMATED_BYTES = {
+    "image": 40_000,
+    "font": 35_000,
+    "media": 500_000,
+    "script": 60_000,
+    "stylesheet": 30_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+DEFAULT_ESTIMATED_BYTES = 10_000
+
+# Process-wide totals
+_totals = {"calls": 0, "allowed": 0, "blocked": 0, "blocked_by_type": 0, "blocked_by_host": 0, "bytes_saved": 0}
+
+
+def get_blocking_stats() -> dict:
+    """
+    آمار تجمیعی درخواست‌های بلاک شده از ابتدای اجرای برنامه.
+    Aggregated request-blocking totals since process start.
+    """
+    return dict(_totals)
+
+
+def is_blocked_host(url: str, hosts=None) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    for blocked in (hosts if hosts is not None else BLOCKED_HOSTS):
+        if host == blocked or host.endswith("." + blocked):
+            return True
+    return False
+
+
+class RequestBlocker:
+    """
+    سیاست رهگیری درخواست‌ها برای یک BrowserContext.
+    Request-interception policy for one scraping BrowserContext.
+
+    Aborts requests by resource type and by host denylist so that
+    'networkidle' is reached without waiting for images, fonts, ads and
+    analytics beacons, and counts what it saved for this call.
+    """
+
+    def __init__(self, resource_types=None, hosts=None):
+        self.resource_types = BLOCKED_RESOURCE_TYPES if resource_types is None else set(resource_types)
+        self.hosts = BLOCKED_HOSTS if hosts is None else list(hosts)
+        self.allowed = 0
+        self.blocked_by_type = 0
+        self.blocked_by_host = 0
+        self.bytes_saved = 0
+
+    async def install(self, context):
+        await context.route("**/*", self._handle)
+
+    async def _handle(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        if resource_type in self.resource_types:
+            self.blocked_by_type += 1
+        elif is_blocked_host(request.url, self.hosts):
+            self.blocked_by_host += 1
+        else:
+            self.allowed += 1
+            await route.continue_()
+            return
+        self.bytes_saved += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+        await route.abort()
+
+    @property
+    def blocked(self) -> int:
+        return self.blocked_by_type + self.blocked_by_host
+
+    def report(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "blocked": self.blocked,
+            "blocked_by_type": self.blocked_by_type,
+            "blocked_by_host": self.blocked_by_host,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def log(self):
+        """ثبت آمار این فراخوانی در لاگ و جمع کل."""
+        _totals["calls"] += 1
+        _totals["allowed"] += self.allowed
+        _totals["blocked"] += self.blocked
+        _totals["blocked_by_type"] += self.blocked_by_type
+        _totals["blocked_by_host"] += self.blocked_by_host
+        _totals["bytes_saved"] += self.bytes_saved
+        if self.blocked:
+            logger.info(
+                f"🚫 Blocked {self.blocked} requests ({self.blocked_by_type} by type, {self.blocked_by_host} by host), "
+                f"~{self.bytes_saved / 1024:.0f} KB saved; allowed {self.allowed}."
+            )
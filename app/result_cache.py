@@ -0,0 +1,241 @@
+# app/result_cache.py
+import os
+import time
+import asyncio
+import inspect
+import functools
+import contextvars
+import logging
+from collections import OrderedDict
+
+from app.url_builder import normalize_text, normalize_city, normalize_jalali_date
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- Cache configuration ---
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() != "false"
+# بودجه‌ی حافظه برای کل cache (بایت)
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# TTL کوتاه برای نتیجه‌های ناقص (ساختار صفحه عوض شده، پاسخ استخراج نشد، چیزی پیدا نشد)؛ 0 یعنی اصلاً cache نشن
+RESULT_CACHE_NEGATIVE_TTL = float(os.getenv("RESULT_CACHE_NEGATIVE_TTL", "30"))
+
+# TTL پیش‌فرض هر ابزار (ثانیه): قیمت‌ها زود عوض می‌شن، FAQ ها دیر
+DEFAULT_TOOL_TTLS = {
+    "flight_schedules": 5 * 60,
+    "train_schedules": 10 * 60,
+    "bus_schedules": 10 * 60,
+    "hotel_info": 15 * 60,
+    "villa_info": 15 * 60,
+    "tour_info": 30 * 60,
+    "faq": 6 * 60 * 60,
+}
+
+
+def tool_ttl(tool: str) -> float:
+    """TTL ابزار؛ با RESULT_CACHE_TTL_<TOOL> (مثلاً RESULT_CACHE_TTL_FLIGHT_SCHEDULES=120) قابل تغییره."""
+    return float(os.getenv(f"RESULT_CACHE_TTL_{tool.upper()}", DEFAULT_TOOL_TTLS.get(tool, 10 * 60)))
+
+
+# فقط برای prefetch (app/prefetch.py): اگه کمتر از این مقدار (ثانیه) از TTL ورودی مونده باشه، دوباره حساب می‌شه
+refresh_margin = contextvars.ContextVar("result_cache_refresh_margin", default=None)
+
+
+# متن‌هایی که ابزارهای app/playwright.py وقتی scrape نصفه موند برمی‌گردونن
+DEGRADED_MARKERS = (
+    "ساختار صفحه تغییر کرده",
+    "نتونستم متن پاسخ رو استخراج کنم",
+    "پاسخ (Fallback)",
+    "پیدا نکردم",
+)
+
+
+def is_degraded(result) -> bool:
+    """نتیجه‌ای که ممکنه از یه خطای گذرا باشه و نباید برای کل TTL به همه نشون داده بشه."""
+    return isinstance(result, str) and any(marker in result for marker in DEGRADED_MARKERS)
+
+
+def is_cacheable(result) -> bool:
+    """
+    پیام‌های خطا، نتیجه‌های خالی و نتیجه‌های ناقص برای TTL کامل cache نمی‌شن
+    (ابزارهای زمانبندی لیست ScheduleRecord برمی‌گردونن).
+    """
+    if isinstance(result, list):
+        return bool(result)
+    return isinstance(result, str) and bool(result.strip()) and not result.startswith("❌") and not is_degraded(result)
+
+
+# --- Normalised keys ---
+
+def _norm_date(value: str) -> str:
+    return normalize_jalali_date(value) or normalize_text(value)
+
+
+def route_key(origin: str, destination: str, date: str) -> tuple:
+    """کلید (مبدا، مقصد، تاریخ) برای پرواز، قطار و اتوبوس."""
+    return normalize_city(origin), normalize_city(destination), _norm_date(date)
+
+
+def stay_key(city: str, checkin_date: str, checkout_date: str) -> tuple:
+    """کلید (شهر، ورود، خروج) برای هتل و اقامتگاه."""
+    return normalize_city(city), _norm_date(checkin_date), _norm_date(checkout_date)
+
+
+def tour_key(origin: str, destination: str, start_date: str, end_date: str) -> tuple:
+    return normalize_city(origin), normalize_city(destination), _norm_date(start_date), _norm_date(end_date)
+
+
+def faq_key(question: str, category: str = "پرواز داخلی") -> tuple:
+    return normalize_text(question).lower(), normalize_text(category or "پرواز داخلی")
+
+
+class ResultCache:
+    """
+    cache نتایج ابزارها با TTL، حذف LRU بر اساس بودجه‌ی حافظه و single-flight.
+    TTL result cache with LRU eviction by memory budget and single-flight de-duplication.
+
+    Concurrent misses for the same key share one computation: the first
+    caller runs it, the rest await its result. Not thread-safe; use it from
+    a single event loop (the Playwright tools all run on the engine loop).
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0, "refreshes": 0, "negative": 0}
+
+    @staticmethod
+    def _size(key: tuple, value) -> int:
+        # برای لیست رکوردها، طول repr تقریب کافیه
+        return len(str(value).encode("utf-8")) + sum(len(str(part)) for part in key) + 64
+
+    def get(self, key: tuple, margin: float = 0):
+        """مقدار کلید، اگه حداقل margin ثانیه تا انقضاش مونده باشه."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, size = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats["expired"] += 1
+            return None
+        if expires_at - time.monotonic() <= margin:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: tuple, value: str, ttl: float):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: tuple):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def invalidate(self, key: tuple = None):
+        """حذف یه کلید یا کل cache."""
+        if key is None:
+            self._entries.clear()
+            self.bytes = 0
+        elif key in self._entries:
+            self._remove(key)
+
+    async def get_or_compute(self, key: tuple, ttl: float, compute):
+        """
+        مقدار cache شده یا اجرای compute (فقط یک بار برای فراخوانی‌های همزمان یک کلید).
+        Cached value, or the result of compute shared by all concurrent callers of the key.
+
+        When refresh_margin is set (background prefetch), an entry that expires
+        within the margin is recomputed; other callers keep getting the old
+        entry until the new value replaces it.
+        """
+        margin = refresh_margin.get()
+        cached = self.get(key, margin or 0)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        if margin is not None and key in self._entries:
+            self.stats["refreshes"] += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # اگه فقط leader لغو شده (مثلاً timeout ابزار اون)، این فراخوانی خودش دوباره امتحان می‌کنه
+                if inflight.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.get_or_compute(key, ttl, compute)
+                raise
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        # اگه هیچ‌کس منتظر نباشه، خطا نباید به عنوان "never retrieved" لاگ بشه
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            if is_cacheable(value):
+                self.set(key, value, ttl)
+            elif is_degraded(value) and RESULT_CACHE_NEGATIVE_TTL > 0 and key not in self._entries:
+                # cache منفی کوتاه تا سایت پشت سر هم زده نشه؛ نتیجه‌ی سالم قبلی (مثلاً موقع prefetch) جایگزین نمی‌شه
+                self.set(key, value, min(ttl, RESULT_CACHE_NEGATIVE_TTL))
+                self.stats["negative"] += 1
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def report(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+# Shared cache instance for the scraping tools
+result_cache = ResultCache()
+
+
+def cached_tool(tool: str, key_fn, date_args: tuple = ()):
+    """
+    دکوریتور: نتیجه‌ی coroutine ابزار رو با کلید نرمال‌شده cache می‌کنه.
+    Decorator caching a tool coroutine's result under a normalised key with the tool's TTL.
+
+    Arguments named in date_args are normalised (normalize_jalali_date) before
+    both the key and the call, so the tool scrapes the same date it is cached under.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if date_args:
+                bound = signature.bind(*args, **kwargs)
+                for name in date_args:
+                    if name in bound.arguments:
+                        value = bound.arguments[name]
+                        bound.arguments[name] = normalize_jalali_date(value) or value
+                args, kwargs = bound.args, bound.kwargs
+            if not RESULT_CACHE_ENABLED:
+                return await fn(*args, **kwargs)
+            key = (tool,) + tuple(key_fn(*args, **kwargs))
+            return await result_cache.get_or_compute(key, tool_ttl(tool), lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
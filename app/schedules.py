@@ -0,0 +1,162 @@
+# app/schedules.py
+"""
+تبدیل کارت‌های نتایج پرواز / قطار / اتوبوس به ScheduleRecord، مرتب‌سازی و فیلتر سمت سرور، و نمایش فشرده برای LLM.
+Parse flight / train / bus result cards into ScheduleRecord, sort and filter them server-side, and render them compactly.
+"""
+import os
+import re
+from typing import List, Optional
+
+from app.models import ScheduleRecord
+from app.url_builder import normalize_text
+
+# حداکثر تعداد کارتی که از صفحه‌ی نتایج خونده می‌شه (مرتب‌سازی و فیلتر روی همه‌شون انجام می‌شه)
+SCHEDULE_MAX_RECORDS = int(os.getenv("SCHEDULE_MAX_RECORDS", "30"))
+DEFAULT_TOP_K = 5
+
+_TIME = re.compile(r"(?<!\d)([01]?\d|2[0-3]):([0-5]\d)(?!\d)")
+_PRICE = re.compile(r"(\d{1,3}(?:[,٬]\d{3})+|\d{4,})\s*(تومان|ریال)")
+_SEATS = re.compile(r"(\d+)\s*(?:صندلی|نفر)")
+_DURATION = re.compile(r"(\d+)\s*ساعت(?:\s*و?\s*(\d+)\s*دقیقه)?|(\d+)\s*دقیقه")
+_FULL = ("تکمیل ظرفیت", "ظرفیت تکمیل")
+# خطوطی از کارت که اسم شرکت نیستن
+_LABELS = ("انتخاب", "تومان", "ریال", "صندلی", "نرخ رسمی", "ظرفیت", "بین‌راهی", "بین راهی", "چارتر", "سیستمی")
+
+SORT_KEYS = {
+    "price": lambda r: r.price_toman,
+    "departure": lambda r: _minutes(r.departure),
+    "arrival": lambda r: _minutes(r.arrival),
+    "duration": lambda r: r.duration_minutes,
+    # بیشترین صندلی اول
+    "seats": lambda r: -r.seats_left if r.seats_left is not None else None,
+}
+
+
+def _minutes(value: Optional[str]) -> Optional[int]:
+    """'08:30' -> 510"""
+    match = _TIME.search(normalize_text(value or ""))
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else None
+
+
+def clock_time(value: str) -> Optional[str]:
+    """'8:30' یا '2024-08-01T08:30:00' -> '08:30'"""
+    minutes = _minutes(value)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}" if minutes is not None else None
+
+
+def _price(text: str) -> Optional[int]:
+    match = _PRICE.search(text)
+    if not match:
+        return None
+    amount = int(re.sub(r"[,٬]", "", match.group(1)))
+    return amount // 10 if match.group(2) == "ریال" else amount
+
+
+def _seats(text: str) -> Optional[int]:
+    if any(label in text for label in _FULL):
+        return 0
+    match = _SEATS.search(text)
+    return int(match.group(1)) if match else None
+
+
+def _duration(text: str, departure: Optional[str], arrival: Optional[str]) -> Optional[int]:
+    match = _DURATION.search(text)
+    if match:
+        if match.group(3):
+            return int(match.group(3))
+        return int(match.group(1)) * 60 + int(match.group(2) or 0)
+    if departure and arrival:
+        # حرکت شبانه: رسیدن روز بعد
+        return (_minutes(arrival) - _minutes(departure)) % (24 * 60)
+    return None
+
+
+def _carrier(lines: List[str]) -> str:
+    """اولین خطی که عدد و برچسب نداره (اسم ایرلاین / شرکت)."""
+    for line in lines:
+        if not re.search(r"\d", line) and not any(label in line for label in _LABELS):
+            return line
+    return ""
+
+
+def parse_schedule(text: str, fields: dict = None) -> ScheduleRecord:
+    """
+    ساخت ScheduleRecord از متن کارت؛ فیلدهایی که با selector پیدا شدن اولویت دارن.
+    Build a ScheduleRecord from a card's text, preferring fields found by selector.
+
+    The text heuristics (first two HH:MM are departure / arrival, a number
+    before تومان/ریال is the price, ...) follow the current alibaba.ir cards
+    and may need updating when the markup changes.
+    """
+    fields = {name: normalize_text(value) for name, value in (fields or {}).items() if value}
+    lines = [normalize_text(line) for line in (text or "").split('\n') if line.strip()]
+    flat = " ".join(lines)
+    times = [f"{int(h):02d}:{m}" for h, m in _TIME.findall(flat)]
+
+    departure = clock_time(fields.get("departure", "")) or (times[0] if times else None)
+    arrival = clock_time(fields.get("arrival", "")) or (times[1] if len(times) > 1 else None)
+    return ScheduleRecord(
+        carrier=fields.get("company") or _carrier(lines),
+        departure=departure,
+        arrival=arrival,
+        price_toman=_price(fields.get("price", "")) or _price(flat),
+        seats_left=_seats(fields.get("seats", "")) if fields.get("seats") else _seats(flat),
+        duration_minutes=_duration(flat, departure, arrival),
+    )
+
+
+def select_schedules(records: List[ScheduleRecord], sort_by: str = None, max_price: int = None,
+                     depart_after: str = None, depart_before: str = None, min_seats: int = None,
+                     top_k: int = DEFAULT_TOP_K) -> List[ScheduleRecord]:
+    """
+    فیلتر، مرتب‌سازی و برگردوندن top_k نتیجه (لیست ورودی تغییر نمی‌کنه، ممکنه از cache باشه).
+    Filter, sort and cut to top_k without mutating the (possibly cached) input list.
+
+    Records missing the value a filter checks are dropped; records missing the
+    sort key go last.
+    """
+    after, before = _minutes(depart_after), _minutes(depart_before)
+    selected = [
+        r for r in records
+        if (max_price is None or (r.price_toman is not None and r.price_toman <= max_price))
+        and (after is None or (_minutes(r.departure) is not None and _minutes(r.departure) >= after))
+        and (before is None or (_minutes(r.departure) is not None and _minutes(r.departure) <= before))
+        and (min_seats is None or (r.seats_left is not None and r.seats_left >= min_seats))
+    ]
+    if sort_by in SORT_KEYS:
+        key = SORT_KEYS[sort_by]
+        selected = sorted(selected, key=lambda r: (key(r) is None, key(r) or 0))
+    return selected[:max(1, top_k or DEFAULT_TOP_K)]
+
+
+def _format_duration(minutes: int) -> str:
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def render_schedule(index: int, record: ScheduleRecord) -> str:
+    """یک خط فشرده: '1. ماهان | 08:30-10:05 (1:35) | 1,250,000 تومان | 4 صندلی'"""
+    parts = [record.carrier or "نامشخص"]
+    if record.departure:
+        span = f"{record.departure}-{record.arrival}" if record.arrival else record.departure
+        if record.duration_minutes is not None:
+            span += f" ({_format_duration(record.duration_minutes)})"
+        parts.append(span)
+    parts.append(f"{record.price_toman:,} تومان" if record.price_toman is not None else "قیمت نامشخص")
+    if record.seats_left is not None:
+        parts.append(f"{record.seats_left} صندلی" if record.seats_left else "تکمیل")
+    return f"{index}. " + " | ".join(parts)
+
+
+def render_schedules(title: str, records: List[ScheduleRecord], **options) -> str:
+    """
+    نمایش فشرده‌ی نتایج انتخاب‌شده برای LLM.
+    Compact rendering of the selected records for the LLM.
+    """
+    if not records:
+        return f"اطلاعاتی درباره {title} پیدا نکردم."
+    selected = select_schedules(records, **options)
+    if not selected:
+        return f"از {len(records)} نتیجه‌ی {title}، هیچ‌کدوم با این فیلترها جور نبود."
+    sort_by = options.get("sort_by")
+    header = f"{title}: {len(selected)} از {len(records)} نتیجه" + (f" (مرتب بر اساس {sort_by})" if sort_by else "")
+    return header + "\n" + "\n".join(render_schedule(i + 1, r) for i, r in enumerate(selected))
@@ -0,0 +1,294 @@
+# app/search_cache.py
+import os
+import time
+import asyncio
+import threading
+import logging
+from datetime import datetime, timezone
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+from dotenv import load_dotenv
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- Cache configuration ---
+# memory: فقط LRU داخل پروسه | mongo: LRU + لایه‌ی دوم مشترک روی MongoDB
+TAVILY_CACHE_BACKEND = os.getenv("TAVILY_CACHE_BACKEND", "memory").lower()
+TAVILY_CACHE_MAX_ENTRIES = int(os.getenv("TAVILY_CACHE_MAX_ENTRIES", "2000"))
+# تا این مدت (ثانیه) نتیجه تازه حساب می‌شه
+TAVILY_CACHE_TTL = float(os.getenv("TAVILY_CACHE_TTL", str(6 * 60 * 60)))
+# بعد از TTL تا این مدت نتیجه‌ی قدیمی برگردونده می‌شه و پشت صحنه تازه می‌شه
+TAVILY_CACHE_STALE_TTL = float(os.getenv("TAVILY_CACHE_STALE_TTL", str(24 * 60 * 60)))
+TAVILY_CACHE_COLLECTION = os.getenv("TAVILY_CACHE_COLLECTION", "tavily_cache")
+
+
+def normalize_query(query: str) -> str:
+    """کلید cache: کوئری نهایی site: با فاصله‌های یکسان و حروف کوچک."""
+    return " ".join((query or "").split()).lower()
+
+
+class MemoryTier:
+    """لایه‌ی LRU داخل حافظه."""
+
+    def __init__(self, max_entries: int = TAVILY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value, stored_at: float):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoTier:
+    """
+    لایه‌ی دوم روی MongoDB تا cache بین worker ها و بعد از ری‌استارت هم بمونه.
+    Shared second tier on MongoDB so entries survive restarts and are shared across workers.
+    """
+
+    def __init__(self, collection_name: str = TAVILY_CACHE_COLLECTION, expire_after: float = None):
+        # import تنبل: بدون این لایه نیازی به اتصال MongoDB نیست
+        from app.database import db
+        self.collection = db[collection_name]
+        # اسناد بعد از تموم شدن پنجره‌ی stale خودکار پاک می‌شن
+        self.collection.create_index("stored_at_dt", expireAfterSeconds=int(expire_after or TAVILY_CACHE_TTL + TAVILY_CACHE_STALE_TTL))
+
+    def get(self, key: str):
+        document = self.collection.find_one({"_id": key}, {"value": 1, "stored_at": 1})
+        if document is None:
+            return None
+        return document["value"], document["stored_at"]
+
+    def set(self, key: str, value, stored_at: float):
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "stored_at": stored_at,
+                      "stored_at_dt": datetime.fromtimestamp(stored_at, tz=timezone.utc)}},
+            upsert=True,
+        )
+
+
+class SearchCache:
+    """
+    cache چند لایه برای جستجوهای Tavily با TTL و stale-while-revalidate.
+    Tiered cache for Tavily searches with TTL and stale-while-revalidate.
+
+    Tiers are checked in order and a hit in a later tier is copied into the
+    earlier ones. A fresh entry is returned as is; a stale one is returned
+    immediately while a background refresh replaces it; anything older is a
+    miss and is fetched inline. Like ResultCache.get_or_compute, concurrent
+    misses and refreshes of one query share a single in-flight fetch.
+    """
+
+    def __init__(self, tiers, ttl: float = TAVILY_CACHE_TTL, stale_ttl: float = TAVILY_CACHE_STALE_TTL,
+                 is_cacheable=None):
+        self.tiers = list(tiers)
+        # پاسخ‌های خطا یا ناقص نباید cache بشن
+        self.is_cacheable = is_cacheable or (lambda value: value is not None)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "errors": 0}
+        # key -> concurrent.futures.Future درخواستی که الان در جریانه (مشترک بین مسیر sync و async)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-cache-refresh")
+        self._tasks = set()
+        # لایه‌هایی مثل MongoDB blocking هستن و تو مسیر async باید تو thread اجرا بشن
+        self._has_blocking_tier = any(not isinstance(tier, MemoryTier) for tier in self.tiers)
+
+    def _lookup(self, key: str):
+        for i, tier in enumerate(self.tiers):
+            try:
+                entry = tier.get(key)
+            except Exception as e:
+                logger.warning(f"Search cache tier {type(tier).__name__} get failed: {e}")
+                continue
+            if entry is not None:
+                for earlier in self.tiers[:i]:
+                    earlier.set(key, *entry)
+                return entry
+        return None
+
+    def _store(self, key: str, value):
+        if not self.is_cacheable(value):
+            return
+        stored_at = time.time()
+        for tier in self.tiers:
+            try:
+                tier.set(key, value, stored_at)
+            except Exception as e:
+                logger.warning(f"Search cache tier {type(tier).__name__} set failed: {e}")
+
+    async def _astore(self, key: str, value):
+        if self._has_blocking_tier:
+            await asyncio.to_thread(self._store, key, value)
+        else:
+            self._store(key, value)
+
+    def _classify(self, entry) -> str:
+        """'fresh'، 'stale' یا 'miss' بر اساس سن ورودی."""
+        if entry is None:
+            return "miss"
+        age = time.time() - entry[1]
+        if age < self.ttl:
+            return "fresh"
+        return "stale" if age < self.ttl + self.stale_ttl else "miss"
+
+    def _claim(self, key: str):
+        """
+        (future, leader): اولین فراخوانی برای key درخواست رو می‌فرسته، بقیه منتظر همون future می‌مونن.
+        Claim the in-flight slot of key; only the leader calls Tavily, the rest wait on its future.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _release(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _fetch(self, key: str, fetch, future: Future):
+        try:
+            value = fetch()
+            self._store(key, value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._release(key)
+
+    async def _afetch(self, key: str, afetch, future: Future):
+        try:
+            value = await afetch()
+            await self._astore(key, value)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._release(key)
+
+    def _refresh(self, key: str, fetch, future: Future):
+        try:
+            self._fetch(key, fetch, future)
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Background refresh failed for '{key}': {e}")
+
+    async def _arefresh(self, key: str, afetch, future: Future):
+        try:
+            await self._afetch(key, afetch, future)
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Background refresh failed for '{key}': {e}")
+
+    def get_or_fetch(self, query: str, fetch):
+        """
+        نتیجه‌ی cache شده برای query یا صدا زدن fetch() و ذخیره‌ی نتیجه‌اش.
+        Return the cached value for query, or call fetch() and cache what it returns.
+
+        Concurrent misses and stale refreshes of the same query, sync or async,
+        share one fetch.
+        """
+        key = normalize_query(query)
+        entry = self._lookup(key)
+        state = self._classify(entry)
+        if state == "fresh":
+            self.stats["hits"] += 1
+            return entry[0]
+        future, leader = self._claim(key)
+        if state == "stale":
+            self.stats["stale_hits"] += 1
+            if leader:
+                self._executor.submit(self._refresh, key, fetch, future)
+            return entry[0]
+        if not leader:
+            self.stats["coalesced"] += 1
+            try:
+                return future.result()
+            except CancelledError:
+                # فراخوانی async که درخواست رو فرستاده بود لغو شد؛ دوباره امتحان می‌کنیم
+                return self.get_or_fetch(query, fetch)
+        self.stats["misses"] += 1
+        return self._fetch(key, fetch, future)
+
+    async def aget_or_fetch(self, query: str, afetch):
+        """
+        نسخه async از get_or_fetch؛ afetch یه تابع بدون آرگومان که coroutine برمی‌گردونه.
+        Async get_or_fetch; afetch is a zero-argument callable returning a coroutine.
+        """
+        key = normalize_query(query)
+        if self._has_blocking_tier:
+            entry = await asyncio.to_thread(self._lookup, key)
+        else:
+            entry = self._lookup(key)
+        state = self._classify(entry)
+        if state == "fresh":
+            self.stats["hits"] += 1
+            return entry[0]
+        future, leader = self._claim(key)
+        if state == "stale":
+            self.stats["stale_hits"] += 1
+            if leader:
+                task = asyncio.create_task(self._arefresh(key, afetch, future))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return entry[0]
+        if not leader:
+            self.stats["coalesced"] += 1
+            try:
+                # shield: لغو این فراخوانی نباید درخواست مشترک رو لغو کنه
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.aget_or_fetch(query, afetch)
+                raise
+        self.stats["misses"] += 1
+        return await self._afetch(key, afetch, future)
+
+    def report(self) -> dict:
+        total = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        hit_rate = (self.stats["hits"] + self.stats["stale_hits"]) / total if total else 0.0
+        return {**self.stats, "hit_rate": round(hit_rate, 3), "memory_entries": len(self.tiers[0]) if self.tiers else 0}
+
+
+def build_search_cache(is_cacheable=None) -> SearchCache:
+    """ساخت cache بر اساس TAVILY_CACHE_BACKEND."""
+    tiers = [MemoryTier()]
+    if TAVILY_CACHE_BACKEND == "mongo":
+        try:
+            tiers.append(MongoTier())
+        except Exception as e:
+            logger.error(f"Could not enable MongoDB tier for the search cache, using memory only: {e}")
+    return SearchCache(tiers, is_cacheable=is_cacheable)
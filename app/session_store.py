@@ -0,0 +1,126 @@
+# app/session_store.py
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- Session store configuration ---
+# memory: فقط داخل همین پروسه (یه worker) | mongo: مشترک بین همه‌ی worker ها و replica ها
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+SESSION_STORE_MAX_SESSIONS = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "10000"))
+# session بیکار بعد از این مدت (ثانیه) از حافظه پاک می‌شه
+SESSION_STORE_TTL_SECONDS = float(os.getenv("SESSION_STORE_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Only lightweight metadata is stored per session; the agent itself is shared (app/agent.py)
+SESSION_FIELDS = ("session_id", "model_name", "owner", "created_at", "last_seen_at")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class SessionStore:
+    """
+    رابط ذخیره‌ی متادیتای session ها.
+    Interface for storing session metadata: model_name, owner, created_at, last_seen_at.
+    """
+
+    async def get(self, session_id: str):
+        """متادیتای session یا None اگه وجود نداشته باشه یا منقضی شده باشه."""
+        raise NotImplementedError
+
+    async def create(self, session_id: str, model_name: str, owner: str = None) -> dict:
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """
+    session ها تو حافظه‌ی همین پروسه، با حذف LRU و انقضای TTL.
+    In-process session store with LRU eviction and an idle TTL.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_STORE_MAX_SESSIONS, ttl: float = SESSION_STORE_TTL_SECONDS):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # session_id -> (metadata, last_seen monotonic)
+
+    async def get(self, session_id: str):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        session, last_seen = entry
+        if self.ttl > 0 and time.monotonic() - last_seen > self.ttl:
+            del self._sessions[session_id]
+            return None
+        session["last_seen_at"] = _now()
+        self._sessions[session_id] = (session, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def create(self, session_id: str, model_name: str, owner: str = None) -> dict:
+        now = _now()
+        session = {"session_id": session_id, "model_name": model_name, "owner": owner,
+                   "created_at": now, "last_seen_at": now}
+        self._sessions[session_id] = (session, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class MongoSessionStore(SessionStore):
+    """
+    متادیتای session ها روی همون سند session در MongoDB (مشترک بین worker ها).
+    Session metadata kept on the session document in MongoDB, shared by every worker.
+
+    last_seen_at is refreshed by every message write; idle sessions are deleted
+    together with their messages by purge_idle_sessions in app/indexes.py.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._projection = {"_id": 0, **{field: 1 for field in SESSION_FIELDS}}
+
+    async def get(self, session_id: str):
+        document = await self.collection.find_one({"session_id": session_id, "model_name": {"$exists": True}}, self._projection)
+        return document
+
+    async def create(self, session_id: str, model_name: str, owner: str = None) -> dict:
+        now = _now()
+        await self.collection.update_one(
+            {"session_id": session_id},
+            {"$set": {"model_name": model_name, "owner": owner, "last_seen_at": now},
+             "$setOnInsert": {"session_id": session_id, "created_at": now}},
+            upsert=True
+        )
+        return {"session_id": session_id, "model_name": model_name, "owner": owner, "created_at": now, "last_seen_at": now}
+
+    async def delete(self, session_id: str):
+        await self.collection.update_one({"session_id": session_id}, {"$unset": {"model_name": "", "owner": ""}})
+
+
+def build_session_store() -> SessionStore:
+    """ساخت session store بر اساس SESSION_STORE_BACKEND."""
+    if SESSION_STORE_BACKEND == "mongo":
+        # import تنبل: بک‌اند memory نیازی به اتصال MongoDB نداره
+        from app.database import async_chat_sessions_collection
+        return MongoSessionStore(async_chat_sessions_collection)
+    return MemorySessionStore()
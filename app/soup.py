@@ -1 +1,250 @@
+# app/soup.py
+"""
+پارس آفلاین صفحه‌های نتایج: یک snapshot از page.content() با BeautifulSoup/lxml، بیرون از event loop و مرورگر.
+Offline parsing of captured result pages: one page.content() snapshot parsed with BeautifulSoup/lxml in a process pool.
 
+The card strategies are the same ones app/extraction.py runs in the page, so
+both paths return the same {"strategy", "total", "records"} shape.
+
+Usage:
+    python -m app.soup --check            # parse every fixture and compare with its saved .json
+    python -m app.soup --update           # rewrite the .json next to every fixture
+    python -m app.soup --bench --runs 50  # lxml vs html.parser per fixture
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from bs4 import BeautifulSoup
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# تعداد پروسه‌های پارسر (0 یعنی پارس تو یه thread همین پروسه)
+PARSER_PROCESSES = int(os.getenv("PARSER_PROCESSES", "2"))
+FIXTURES_DIR = os.getenv("PARSER_FIXTURES_DIR", os.path.join(os.path.dirname(__file__), "fixtures", "pages"))
+
+try:
+    import lxml  # noqa: F401
+    PARSER_FEATURES = "lxml"
+except ImportError:
+    PARSER_FEATURES = "html.parser"
+
+
+def _norm(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+
+def _expand(cards: list, body) -> list:
+    """
+    معادل expand در EXTRACT_CARDS_JS: درونی‌ترین المنت‌ها، بعد بالا رفتن تا بزرگ‌ترین والدی که فقط همون یه نتیجه رو داره.
+    """
+    candidates = {id(card) for card in cards}
+    outer = set()
+    for card in cards:
+        for parent in card.parents:
+            if id(parent) in candidates:
+                outer.add(id(parent))
+    inner = [card for card in cards if id(card) not in outer]
+    # تعداد نتیجه‌های داخل هر والد
+    counts = {}
+    for card in inner:
+        for parent in card.parents:
+            counts[id(parent)] = counts.get(id(parent), 0) + 1
+    expanded = []
+    for card in inner:
+        node = card
+        while node.parent is not None and node.parent is not body and counts.get(id(node.parent)) == 1:
+            node = node.parent
+        expanded.append(node)
+    return expanded
+
+
+def parse_cards(html: str, strategies: list, limit: int, features: str = None) -> dict:
+    """
+    معادل آفلاین EXTRACT_CARDS_JS روی HTML ذخیره‌شده.
+    Offline equivalent of EXTRACT_CARDS_JS on a captured HTML snapshot.
+    """
+    soup = BeautifulSoup(html, features or PARSER_FEATURES)
+    for index, strategy in enumerate(strategies):
+        cards = soup.select(strategy["cards"])
+        if strategy.get("has_text"):
+            needle = _norm(strategy["has_text"])
+            cards = [card for card in cards if needle in _norm(card.get_text())]
+        if strategy.get("outermost"):
+            matched = {id(card) for card in cards}
+            cards = [card for card in cards if not any(id(parent) in matched for parent in card.parents)]
+        if strategy.get("expand"):
+            cards = _expand(cards, soup.body)
+        if strategy.get("parent"):
+            # والدها، بدون تکرار و به ترتیب سند
+            seen, parents = set(), []
+            for card in cards:
+                if card.parent is not None and id(card.parent) not in seen:
+                    seen.add(id(card.parent))
+                    parents.append(card.parent)
+            cards = parents
+        if not cards:
+            continue
+        records = []
+        for card in cards[:limit]:
+            fields = {}
+            for name, selector in (strategy.get("fields") or {}).items():
+                element = card.select_one(selector)
+                fields[name] = element.get_text().strip() if element is not None else ""
+            records.append({"text": card.get_text(), "fields": fields})
+        return {"strategy": index, "total": len(cards), "records": records}
+    return {"strategy": -1, "total": 0, "records": []}
+
+
+def parse_faq_answer(html: str, question: str, features: str = None) -> str:
+    """
+    پاسخ سوال FAQ از متن صفحه: 5 خط غیر خالی اول بعد از متن سوال (همون منطق مسیر زنده).
+    FAQ answer from the page text: the first five non-empty lines after the question.
+    """
+    soup = BeautifulSoup(html, features or PARSER_FEATURES)
+    body = soup.body or soup
+    text = body.get_text()
+    index = text.find(question)
+    if index == -1:
+        return ""
+    snippet = text[index + len(question):index + len(question) + 500].strip()
+    lines = [line.strip() for line in snippet.split('\n') if line.strip()]
+    return "\n".join(lines[:5])
+
+
+def parse_page(kind: str, html: str, question: str = None, features: str = None) -> dict:
+    """
+    پارس کامل یه snapshot برای یه نوع صفحه (برای fixture ها و بنچمارک).
+    Parse a snapshot of the given page kind into a JSON-serialisable dict.
+    """
+    if kind == "faq":
+        return {"answer": parse_faq_answer(html, question or "", features)}
+    from app.extraction import CARD_STRATEGIES
+    from app.schedules import parse_schedule, SCHEDULE_MAX_RECORDS
+    if kind in ("flight", "train", "bus"):
+        extracted = parse_cards(html, CARD_STRATEGIES[kind], SCHEDULE_MAX_RECORDS, features)
+        extracted["schedules"] = [parse_schedule(r["text"], r["fields"]).model_dump() for r in extracted["records"]]
+        return extracted
+    from app.extraction import DEFAULT_LIMIT
+    return parse_cards(html, CARD_STRATEGIES[kind], DEFAULT_LIMIT, features)
+
+
+# --- Process pool ---
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None and PARSER_PROCESSES > 0:
+        _pool = ProcessPoolExecutor(max_workers=PARSER_PROCESSES)
+    return _pool
+
+
+async def run_parser(fn, *args):
+    """
+    اجرای پارسر تو process pool (یا یه thread اگه PARSER_PROCESSES=0) تا event loop بلاک نشه.
+    Run a parser function off the event loop, in the process pool when enabled.
+    """
+    pool = _get_pool()
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+def shutdown_parser_pool():
+    """بستن process pool موقع خاموش شدن برنامه."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# --- Fixtures ---
+# هر fixture یه فایل <kind>-<name>.html هست و خروجی مورد انتظارش <kind>-<name>.json
+# (برای faq، سوال تو فیلد "question" همون json ذخیره می‌شه)
+
+def _fixtures(directory: str):
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".html"):
+            kind = filename.split("-", 1)[0]
+            path = os.path.join(directory, filename)
+            yield kind, path, path[:-len(".html")] + ".json"
+
+
+def _load_expected(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check(directory: str, update: bool = False) -> bool:
+    """مقایسه‌ی خروجی پارسر با json ذخیره‌شده‌ی هر fixture (یا بازنویسی‌اش با update)."""
+    ok = True
+    for kind, html_path, json_path in _fixtures(directory):
+        with open(html_path, encoding="utf-8") as f:
+            html = f.read()
+        expected = _load_expected(json_path)
+        question = expected.get("question")
+        result = parse_page(kind, html, question)
+        if update:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"question": question, "result": result} if question else {"result": result},
+                          f, ensure_ascii=False, indent=2)
+            print(f"📝 {os.path.basename(json_path)}")
+        elif result == expected.get("result"):
+            print(f"✅ {os.path.basename(html_path)}")
+        else:
+            ok = False
+            print(f"❌ {os.path.basename(html_path)}: parser output differs from {os.path.basename(json_path)}")
+    return ok
+
+
+def bench(directory: str, runs: int):
+    """زمان پارس هر fixture با lxml و html.parser."""
+    for kind, html_path, json_path in _fixtures(directory):
+        with open(html_path, encoding="utf-8") as f:
+            html = f.read()
+        question = _load_expected(json_path).get("question")
+        line = f"{os.path.basename(html_path):<28} {len(html) // 1024:>5}KB"
+        for features in ("lxml", "html.parser"):
+            try:
+                timings = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    parse_page(kind, html, question, features)
+                    timings.append((time.perf_counter() - started) * 1000)
+                line += f"  {features}: p50={statistics.median(timings):7.2f}ms"
+            except Exception as e:  # lxml نصب نیست
+                line += f"  {features}: n/a ({e.__class__.__name__})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline result-page parsers.")
+    parser.add_argument("--dir", default=FIXTURES_DIR, help="fixture directory")
+    parser.add_argument("--check", action="store_true", help="compare parser output with the saved .json files")
+    parser.add_argument("--update", action="store_true", help="rewrite the saved .json files")
+    parser.add_argument("--bench", action="store_true", help="time each fixture with lxml and html.parser")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    if args.check or args.update:
+        raise SystemExit(0 if check(args.dir, update=args.update) else 1)
+    if args.bench:
+        bench(args.dir, args.runs)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 # app.tavily.py
 from langchain_tavily import TavilySearch
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
 
+from app.search_cache import build_search_cache
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,36 +14,102 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv(".env")
 
+# حداکثر تعداد درخواست همزمان Tavily در هر fan-out
+TAVILY_MAX_CONCURRENCY = int(os.getenv("TAVILY_MAX_CONCURRENCY", "4"))
+
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 if not tavily_api_key:
     logger.error("TAVILY_API_KEY environment variable is not set.")
     # Consider raising an exception or handling the error gracefully
 
 # Initialize the Tavily tool for web searches
+# ساخت تنبل: import این ماژول (مثلاً برای schema ابزارها تو app/tool_router.py --report) کلید API لازم نداره
+_tavily_tool = None
 
-tavily_tool = TavilySearch(max_results=3, tavily_api_key=tavily_api_key, topic="general")
 
-# --- General Search Tools for Alibaba.ir Sections ---
-# These tools use Tavily to search within specific subdomains or sections of alibaba.ir
+def get_tavily_tool() -> TavilySearch:
+    global _tavily_tool
+    if _tavily_tool is None:
+        _tavily_tool = TavilySearch(max_results=3, tavily_api_key=tavily_api_key, topic="general")
+    return _tavily_tool
 
-# Change: We define functions separately (for use in StructuredTool)
-def search_alibaba_general_func(query: str) -> str:
-    """Search for information across the main sections of alibaba.ir."""
-    search_query = f"site:alibaba.ir {query}"
-    # Change: How to call tavily_tool
-    response = tavily_tool.invoke({"query": search_query})
+# Cache for Tavily responses, keyed by the final site: query (app/search_cache.py)
+search_cache = build_search_cache(is_cacheable=lambda response: isinstance(response, dict) and 'results' in response)
 
-    logger.info(f"🔍 [Tavily] search_alibaba_general_func invoked with query='{query}'")
+def _tavily_search(search_query: str):
+    """
+    اجرای کوئری site: روی Tavily از طریق cache.
+    Run a site: query against Tavily through the shared search cache.
+    """
+    return search_cache.get_or_fetch(search_query, lambda: get_tavily_tool().invoke({"query": search_query}))
 
-    # Checking the output structure and extracting results
+async def _atavily_search(search_query: str):
+    """
+    نسخه async از _tavily_search با TavilySearch.ainvoke.
+    Async _tavily_search using TavilySearch.ainvoke.
+    """
+    return await search_cache.aget_or_fetch(search_query, lambda: get_tavily_tool().ainvoke({"query": search_query}))
+
+def _format_results(response) -> str:
+    """Format the first 3 Tavily results as Title/URL/Snippet blocks."""
     if isinstance(response, dict) and 'results' in response:
         results = response['results']
-        # Convert the results to a string
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]]) # For example, the first 3
+        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
     else:
-        # If the structure is different, return a default
         return str(response)
 
+# --- Section sites ---
+# بخش -> پیشوند site: (ابزارهای تکی sync و async و جستجوی چند بخشی همه از همین استفاده می‌کنن)
+SECTION_SITES = {
+    "general": "site:alibaba.ir",
+    "faq": "site:alibaba.ir/help-center/categories/faq",
+    "magazine": "site:alibaba.ir/mag",
+    "profile": "site:alibaba.ir/profile",
+    "flights_domestic": "site:alibaba.ir",
+    "flights_international": "site:alibaba.ir/iranout",
+    "trains": "site:alibaba.ir/train-ticket",
+    "buses": "site:alibaba.ir/bus-ticket",
+    "tours": "site:alibaba.ir/tour",
+    "hotels": "site:alibaba.ir/hotel",
+    "accommodations": "site:alibaba.ir/accommodation",
+    "visa": "site:alibaba.ir/visa",
+    "insurance": "site:alibaba.ir/insurance",
+}
+
+def _faq_query(query: str, category: str = "") -> str:
+    """کوئری site: سوالات متداول؛ با دسته فقط تو همون زیرمجموعه، بدون دسته تو کل بخش FAQ."""
+    if category:
+        return f"{SECTION_SITES['faq']}/{category} {query}"
+    return f"{SECTION_SITES['faq']} {query}"
+
+def _format_faq_results(response, query: str, category: str = "") -> str:
+    """فرمت‌بندی 3 نتیجه‌ی اول FAQ (مشترک بین نسخه‌ی sync و async)."""
+    if isinstance(response, dict) and 'results' in response:
+        results = response['results']
+        if not results:
+            # پیام مناسب‌تری بر اساس دسته
+            category_msg = f" در دسته '{category}'" if category else ""
+            return f"سوالی مشابه '{query}'{category_msg} در بخش سوالات متداول پیدا نکردم."
+        info_lines = [f"❓ نتایج جستجو در سوالات متداول علی‌بابا برای '{query}':"]
+        for res in results[:3]: # فقط 3 تا اولی
+            title = res.get('title', 'بدون عنوان')
+            url = res.get('url', '#')
+            snippet = res.get('content', 'بدون خلاصه')
+            info_lines.append(f"- [{title}]({url})\n  {snippet}\n")
+        return "\n".join(info_lines)
+    return f"خطا در دریافت نتایج جستجو برای سوال '{query}'."
+
+# --- General Search Tools for Alibaba.ir Sections ---
+# These tools use Tavily to search within specific subdomains or sections of alibaba.ir
+
+# Change: We define functions separately (for use in StructuredTool)
+def search_alibaba_general_func(query: str) -> str:
+    """Search for information across the main sections of alibaba.ir."""
+    search_query = f"{SECTION_SITES['general']} {query}"
+    response = _tavily_search(search_query)
+    logger.info(f"🔍 [Tavily] search_alibaba_general_func invoked with query='{query}'")
+    return _format_results(response)
+
 def search_alibaba_faqs(query: str, category: str = "") -> str:
     """
     جستجوی سوالات متداول (FAQs) در علی‌بابا با استفاده از Tavily.
@@ -51,159 +120,169 @@ def search_alibaba_faqs(query: str, category: str = "") -> str:
         category: دسته‌ی مورد نظر (مثلاً "train", "hotel", "flight-domestic"). 
                   اگه خالی باشه، جستجو تو کل FAQ انجام می‌شه.
     """
-    # ساخت search_query بر اساس دسته
-    if category:
-        # اگه دسته مشخص شده، جستجو فقط تو اون زیرمجموعه
-        search_query = f"site:alibaba.ir/help-center/categories/faq/{category} {query}"
-    else:
-        # اگه دسته خالی هست، جستجو تو کل بخش FAQ
-        search_query = f"site:alibaba.ir/help-center/categories/faq {query}"
-    
     try:
-        response = tavily_tool.invoke({"query": search_query})
+        response = _tavily_search(_faq_query(query, category))
         logger.info(f"🔍 [Tavily] search_alibaba_faqs invoked with query='{query}', category='{category}'")
-        
-        # فرمت‌بندی نتایج
-        if isinstance(response, dict) and 'results' in response:
-            results = response['results']
-            if not results:
-                 # پیام مناسب‌تری بر اساس دسته
-                 category_msg = f" در دسته '{category}'" if category else ""
-                 return f"سوالی مشابه '{query}'{category_msg} در بخش سوالات متداول پیدا نکردم."
-            
-            info_lines = [f"❓ نتایج جستجو در سوالات متداول علی‌بابا برای '{query}':"]
-            for res in results[:3]: # فقط 3 تا اولی
-                title = res.get('title', 'بدون عنوان')
-                url = res.get('url', '#')
-                snippet = res.get('content', 'بدون خلاصه')
-                info_lines.append(f"- [{title}]({url})\n  {snippet}\n")
-            return "\n".join(info_lines)
-        else:
-            return f"خطا در دریافت نتایج جستجو برای سوال '{query}'."
+        return _format_faq_results(response, query, category)
     except Exception as e:
         logger.error(f"Error in search_alibaba_faqs: {e}")
         return f"❌ خطایی در جستجوی سوالات متداول رخ داد: {str(e)}"
 
 def search_alibaba_magazine_func(query: str) -> str:
     """Search for articles and information in the Alibaba Magazine."""
-    search_query = f"site:alibaba.ir/mag {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['magazine']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_magazine_func invoked with query='{query}'")
-    
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 # --- Specific Section Search Tools ---
 def search_alibaba_profile_func(query: str) -> str:
     """Search for information about profile(پروفایل)"""
-    search_query = f"site:alibaba.ir/profile {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['profile']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_profile_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_flights_iran_func(query: str) -> str:
     """Search for information about domestic flights (پرواز داخلی) on alibaba.ir."""
-    search_query = f"site:alibaba.ir {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['flights_domestic']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_flights_iran_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_flights_international_func(query: str) -> str:
     """Search for information about international flights (پرواز خارجی) on alibaba.ir/iranout."""
-    search_query = f"site:alibaba.ir/iranout {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['flights_international']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_flights_international_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_trains_func(query: str) -> str:
     """Search for information about train tickets (قطار) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/train-ticket {query}"
+    search_query = f"{SECTION_SITES['trains']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_trains_func invoked with query='{query}'")
-    response = tavily_tool.invoke({"query": search_query})
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_buses_func(query: str) -> str:
     """Search for information about bus tickets (اتوبوس) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/bus-ticket {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['buses']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_buses_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_tours_func(query: str) -> str:
     """Search for information about tours (تور) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/tour {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['tours']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_tours_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_hotels_func(query: str) -> str:
     """Search for information about hotels (هتل) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/hotel {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['hotels']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_hotels_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_accommodations_func(query: str) -> str:
     """Search for information about villas and accommodations (ویلا و اقمتگاه) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/accommodation {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['accommodations']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_accommodations_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_visa_func(query: str) -> str:
     """Search for information about visas (ویزا) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/visa {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['visa']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_visa_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
+    return _format_results(response)
 
 def search_alibaba_insurance_func(query: str) -> str:
     """Search for information about travel insurance (بیمه مسافرتی) on alibaba.ir."""
-    search_query = f"site:alibaba.ir/insurance {query}"
-    response = tavily_tool.invoke({"query": search_query})
+    search_query = f"{SECTION_SITES['insurance']} {query}"
+    response = _tavily_search(search_query)
     logger.info(f"🔍 [Tavily] search_alibaba_insurance_func invoked with query='{query}'")
-    if isinstance(response, dict) and 'results' in response:
-        results = response['results']
-        return "\n".join([f"Title: {res['title']}\nURL: {res['url']}\nSnippet: {res['content']}\n---" for res in results[:3]])
-    else:
-        return str(response)
-    
+    return _format_results(response)
+
+# --- Multi-section fan-out ---
+async def search_alibaba_sections_async(query: str, sections: list, max_concurrency: int = TAVILY_MAX_CONCURRENCY) -> str:
+    """
+    جستجوی همزمان یک کوئری در چند بخش علی‌بابا و ادغام نتایج (حذف URL های تکراری).
+    Run one query against several alibaba.ir sections concurrently and merge results, de-duplicated by URL.
+    """
+    unknown = [section for section in sections if section not in SECTION_SITES]
+    sections = [section for section in dict.fromkeys(sections) if section in SECTION_SITES]
+    if not sections:
+        return f"❌ بخش نامعتبر. بخش‌های مجاز: {', '.join(SECTION_SITES)}"
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def search_section(section: str):
+        async with semaphore:
+            return await _atavily_search(f"{SECTION_SITES[section]} {query}")
+
+    logger.info(f"🔍 [Tavily] search_alibaba_sections invoked with query='{query}', sections={sections}")
+    responses = await asyncio.gather(*(search_section(section) for section in sections), return_exceptions=True)
+
+    seen_urls = set()
+    blocks = []
+    for section, response in zip(sections, responses):
+        if isinstance(response, Exception):
+            logger.error(f"Tavily search failed for section '{section}': {response}")
+            blocks.append(f"### {section}\n❌ خطایی در جستجوی این بخش رخ داد: {response}")
+            continue
+        results = response.get('results', []) if isinstance(response, dict) else []
+        lines = []
+        for res in results[:3]:
+            url = res.get('url', '#')
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            lines.append(f"Title: {res.get('title', '')}\nURL: {url}\nSnippet: {res.get('content', '')}\n---")
+        blocks.append(f"### {section}\n" + ("\n".join(lines) if lines else "نتیجه‌ی جدیدی پیدا نشد."))
+    if unknown:
+        blocks.append(f"(بخش‌های ناشناخته نادیده گرفته شدن: {', '.join(unknown)})")
+    return "\n\n".join(blocks)
+
+def search_alibaba_sections(query: str, sections: list) -> str:
+    """Sync adapter over search_alibaba_sections_async (for agent.invoke and scripts)."""
+    return asyncio.run(search_alibaba_sections_async(query, sections))
+
+# --- Async per-section tools ---
+# نسخه‌ی async ابزارهای تکی: درخواست با ainvoke فرستاده می‌شه و با timeout واقعاً لغو می‌شه
+
+def _section_coroutine(section: str, name: str):
+    async def search(query: str) -> str:
+        response = await _atavily_search(f"{SECTION_SITES[section]} {query}")
+        logger.info(f"🔍 [Tavily] {name} invoked with query='{query}'")
+        return _format_results(response)
+    search.__name__ = name
+    return search
+
+search_alibaba_general_async = _section_coroutine("general", "search_alibaba_general_async")
+search_alibaba_magazine_async = _section_coroutine("magazine", "search_alibaba_magazine_async")
+search_alibaba_profile_async = _section_coroutine("profile", "search_alibaba_profile_async")
+search_alibaba_flights_iran_async = _section_coroutine("flights_domestic", "search_alibaba_flights_iran_async")
+search_alibaba_flights_international_async = _section_coroutine("flights_international", "search_alibaba_flights_international_async")
+search_alibaba_trains_async = _section_coroutine("trains", "search_alibaba_trains_async")
+search_alibaba_buses_async = _section_coroutine("buses", "search_alibaba_buses_async")
+search_alibaba_tours_async = _section_coroutine("tours", "search_alibaba_tours_async")
+search_alibaba_hotels_async = _section_coroutine("hotels", "search_alibaba_hotels_async")
+search_alibaba_accommodations_async = _section_coroutine("accommodations", "search_alibaba_accommodations_async")
+search_alibaba_visa_async = _section_coroutine("visa", "search_alibaba_visa_async")
+search_alibaba_insurance_async = _section_coroutine("insurance", "search_alibaba_insurance_async")
+
+async def search_alibaba_faqs_async(query: str, category: str = "") -> str:
+    """
+    نسخه async از search_alibaba_faqs.
+    Async search_alibaba_faqs.
+    """
+    try:
+        response = await _atavily_search(_faq_query(query, category))
+        logger.info(f"🔍 [Tavily] search_alibaba_faqs_async invoked with query='{query}', category='{category}'")
+        return _format_faq_results(response, query, category)
+    except Exception as e:
+        logger.error(f"Error in search_alibaba_faqs_async: {e}")
+        return f"❌ خطایی در جستجوی سوالات متداول رخ داد: {str(e)}"
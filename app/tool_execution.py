@@ -0,0 +1,222 @@
+# app/tool_execution.py
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from dotenv import load_dotenv
+from langchain_core.tools import StructuredTool
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- Tool execution configuration ---
+# حداکثر زمان هر فراخوانی ابزار (ثانیه)؛ برای هر ابزار با TOOL_TIMEOUT_<NAME> قابل تغییره
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "45"))
+# بعد از این تعداد شکست/timeout پشت سر هم، مدار ابزار باز می‌شه (0 یعنی خاموش)
+TOOL_BREAKER_FAILURES = int(os.getenv("TOOL_BREAKER_FAILURES", "3"))
+# مدتی (ثانیه) که مدار باز می‌مونه؛ بعدش یک فراخوانی آزمایشی اجازه داره
+TOOL_BREAKER_COOLDOWN_SECONDS = float(os.getenv("TOOL_BREAKER_COOLDOWN_SECONDS", "60"))
+
+# ابزار جایگزین وقتی ابزار اصلی جواب نمی‌ده: Playwright <-> Tavily
+ALTERNATIVE_TOOLS = {
+    "search_alibaba_flight_schedules": "search_alibaba_flights_domestic",
+    "search_alibaba_train_schedules": "search_alibaba_trains",
+    "search_alibaba_bus_schedules": "search_alibaba_buses",
+    "search_alibaba_hotel_info": "search_alibaba_hotels_general",
+    "search_alibaba_villa_info": "search_alibaba_accommodations_general",
+    "search_alibaba_tour_info": "search_alibaba_tours",
+    "search_alibaba_faqs_interactive": "search_alibaba_faqs",
+    "search_alibaba_flights_domestic": "search_alibaba_flight_schedules",
+    "search_alibaba_trains": "search_alibaba_train_schedules",
+    "search_alibaba_buses": "search_alibaba_bus_schedules",
+    "search_alibaba_hotels_general": "search_alibaba_hotel_info",
+    "search_alibaba_accommodations_general": "search_alibaba_villa_info",
+    "search_alibaba_tours": "search_alibaba_tour_info",
+    "search_alibaba_faqs": "search_alibaba_faqs_interactive",
+}
+DEFAULT_ALTERNATIVE_TOOL = "search_alibaba_general"
+# حداکثر تعداد فراخوانی‌های متمایز که برای محبوبیت شمرده می‌شن (app/prefetch.py)
+TOOL_CALL_LOG_MAX_ENTRIES = int(os.getenv("TOOL_CALL_LOG_MAX_ENTRIES", "1000"))
+
+
+def tool_timeout(name: str) -> float:
+    """مثلاً TOOL_TIMEOUT_SEARCH_ALIBABA_FAQS=10"""
+    return float(os.getenv(f"TOOL_TIMEOUT_{name.upper()}", TOOL_TIMEOUT_SECONDS))
+
+
+def alternative_tool(name: str, bound_names=None):
+    """
+    ابزاری که وقتی name در دسترس نیست پیشنهاد می‌شه؛ فقط از ابزارهای همین نوبت و غیر از خودش، وگرنه None.
+    The tool suggested in place of name, among bound_names (None means all tools); None if there is none.
+    """
+    for candidate in (ALTERNATIVE_TOOLS.get(name), DEFAULT_ALTERNATIVE_TOOL):
+        if candidate and candidate != name and (bound_names is None or candidate in bound_names):
+            return candidate
+    return None
+
+
+class CircuitBreaker:
+    """
+    قطع‌کننده‌ی مدار برای یک ابزار: بعد از چند شکست پشت سر هم، تا مدتی بدون اجرا رد می‌کنه.
+    Per-tool circuit breaker: closed -> open after N consecutive failures -> half-open after the cooldown.
+
+    While open, calls are rejected without running the tool. After the cooldown
+    one trial call is let through; success closes the circuit, failure opens
+    it for another cooldown.
+    """
+
+    def __init__(self, name: str, failures: int = TOOL_BREAKER_FAILURES,
+                 cooldown: float = TOOL_BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self.max_failures <= 0:
+            return True
+        state = self.state
+        if state == "closed":
+            return True
+        # half-open: فقط یک فراخوانی آزمایشی همزمان
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.stats["calls"] += 1
+        if self.opened_at is not None:
+            logger.info(f"🟢 Circuit for {self.name} closed again.")
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.stats["calls"] += 1
+        self.stats["failures"] += 1
+        self.failures += 1
+        if self.max_failures > 0 and (self._trial or self.failures >= self.max_failures):
+            if self.opened_at is None or self._trial:
+                self.stats["opened"] += 1
+                logger.warning(f"🔴 Circuit for {self.name} opened after {self.failures} failures "
+                               f"(cooldown {self.cooldown:.0f}s).")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def release(self):
+        """فراخوانی آزمایشی بدون نتیجه تموم شد (مثلاً لغو درخواست کاربر)."""
+        self._trial = False
+
+
+breakers = {}  # tool name -> CircuitBreaker
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name)
+    return breakers[name]
+
+
+def report() -> dict:
+    """وضعیت مدار همه‌ی ابزارها."""
+    return {name: {"state": breaker.state, **breaker.stats} for name, breaker in breakers.items()}
+
+
+# --- Tool-call log ---
+# تعداد فراخوانی هر (ابزار، آرگومان‌ها) برای prefetch مسیرها و سوال‌های پرتکرار
+call_log = Counter()
+
+
+def record_call(name: str, kwargs: dict):
+    call_log[(name, json.dumps(kwargs, ensure_ascii=False, sort_keys=True, default=str))] += 1
+    if len(call_log) > TOOL_CALL_LOG_MAX_ENTRIES:
+        # نگه داشتن نیمه‌ی پرتکرارتر
+        kept = call_log.most_common(TOOL_CALL_LOG_MAX_ENTRIES // 2)
+        call_log.clear()
+        call_log.update(dict(kept))
+
+
+def popular_calls(n: int) -> list:
+    """n فراخوانی پرتکرار به شکل (اسم ابزار، آرگومان‌ها، تعداد)."""
+    return [(name, json.loads(args), count) for (name, args), count in call_log.most_common(n)]
+
+
+def _is_failure(result) -> bool:
+    # ابزارها خطا رو raise نمی‌کنن و پیام ❌ برمی‌گردونن
+    return isinstance(result, str) and result.startswith("❌")
+
+
+def guard_tool(tool: StructuredTool, bound_names=None) -> StructuredTool:
+    """
+    نسخه‌ای از ابزار که همیشه async اجرا می‌شه، سقف زمانی کل داره و پشت circuit breaker خودشه.
+    Wrap a tool so it always runs as a coroutine under a total deadline and its own circuit breaker.
+
+    LangGraph's ToolNode runs the tool calls of one step concurrently with
+    asyncio.gather, so the step takes as long as its slowest tool. When the
+    deadline passes the call is cancelled: Playwright tools cancel the task on
+    the engine loop (its page and context are closed) and Tavily tools cancel
+    the HTTP request. Timeouts and ❌ results count as failures; once the
+    circuit is open the tool answers at once, naming the alternative tool if
+    one is bound next to it (bound_names, the routed subset; None means all).
+    Sync-only tools run in a worker thread, which cannot be interrupted.
+    """
+    timeout = tool_timeout(tool.name)
+    alternative = alternative_tool(tool.name, bound_names)
+    # راهنمایی برای LLM وقتی ابزار جواب نمی‌ده
+    hint = f"به جای اون از ابزار {alternative} استفاده کن." if alternative else "بدون این ابزار جواب بده."
+    breaker = get_breaker(tool.name)
+    func, original = tool.func, tool.coroutine
+
+    async def coroutine(**kwargs):
+        record_call(tool.name, kwargs)
+        if not breaker.allow():
+            logger.info(f"⚡ Tool {tool.name} rejected by open circuit.")
+            return f"⚡ ابزار {tool.name} فعلاً در دسترس نیست (چند بار پشت سر هم خطا داده). {hint}"
+        started = time.perf_counter()
+        call = original(**kwargs) if original is not None else asyncio.to_thread(func, **kwargs)
+        try:
+            result = await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            logger.warning(f"⏱️ Tool {tool.name} timed out after {timeout:.0f}s.")
+            return f"⏱️ ابزار {tool.name} در {timeout:.0f} ثانیه جواب نداد. {hint}"
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            logger.info(f"🔧 Tool {tool.name} finished in {time.perf_counter() - started:.2f}s.")
+        if _is_failure(result):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return result
+
+    return StructuredTool.from_function(
+        func=func,
+        coroutine=coroutine,
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema
+    )
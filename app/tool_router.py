@@ -0,0 +1,267 @@
+# app/tool_router.py
+"""
+مسیریاب ابزارها: پیام کاربر با کلمات کلیدی به یک یا چند حوزه (پرواز، قطار، هتل، ویزا، ...)
+دسته‌بندی می‌شه و فقط ابزارهای همون حوزه‌ها به LLM داده می‌شن.
+Keyword intent router: classifies the user message into domains and binds only those tools.
+
+Usage:
+    python -m app.tool_router --report   # tool-schema tokens: all tools vs routed subset
+    python -m app.tool_router --check    # classify the regression cases in CLASSIFY_CASES
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import functools
+import statistics
+import logging
+from dotenv import load_dotenv
+
+from app.url_builder import normalize_text, normalize_city, CITIES, CITY_ALIASES
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+TOOL_ROUTER_ENABLED = os.getenv("TOOL_ROUTER_ENABLED", "true").lower() != "false"
+
+# حوزه -> کلمات کلیدی (بعد از normalize_text، حروف کوچک)
+DOMAIN_KEYWORDS = {
+    "flight": ["پرواز", "هواپیما", "فرودگاه", "ایرلاین", "هواپیمایی", "flight"],
+    "international": ["خارجی", "بین المللی", "بین‌المللی", "استانبول", "دبی", "نجف", "ارمنستان", "گرجستان", "iranout"],
+    "train": ["قطار", "راه آهن", "راه‌آهن", "کوپه", "واگن", "train"],
+    "bus": ["اتوبوس", "ترمینال", "پایانه", "تعاونی", "vip", "bus"],
+    # بلیط بدون اسم وسیله (قیمت بلیط تهران شیراز)؛ مسیر دو شهری هم همین حوزه رو می‌گیره (classify)
+    "ticket": ["بلیط", "بلیت", "ticket"],
+    "hotel": ["هتل", "رزرو اتاق", "ستاره", "hotel"],
+    "villa": ["ویلا", "اقامتگاه", "سوئیت", "کلبه", "بومگردی", "villa"],
+    "tour": ["تور", "tour"],
+    "visa": ["ویزا", "روادید", "visa"],
+    "insurance": ["بیمه", "insurance"],
+    "faq": ["استرداد", "کنسل", "لغو", "جریمه", "قانون", "قوانین", "شرایط", "راهنما", "پشتیبانی", "بار مجاز", "چمدان",
+            "پرداخت", "کیف پول", "برگشت پول", "تغییر نام", "faq"],
+    "profile": ["پروفایل", "حساب کاربری", "رمز عبور", "ورود به حساب", "profile"],
+    "magazine": ["مجله", "مقاله", "جاهای دیدنی", "سوغات", "magazine"],
+}
+
+# حوزه -> ابزارها
+DOMAIN_TOOLS = {
+    "flight": ["search_alibaba_flight_schedules", "search_alibaba_flights_domestic", "search_alibaba_faqs"],
+    "international": ["search_alibaba_flights_international", "search_alibaba_visa", "search_alibaba_insurance"],
+    "train": ["search_alibaba_train_schedules", "search_alibaba_trains"],
+    "bus": ["search_alibaba_bus_schedules", "search_alibaba_buses"],
+    "ticket": ["search_alibaba_flight_schedules", "search_alibaba_train_schedules", "search_alibaba_bus_schedules"],
+    "hotel": ["search_alibaba_hotel_info", "search_alibaba_hotels_general"],
+    "villa": ["search_alibaba_villa_info", "search_alibaba_accommodations_general"],
+    "tour": ["search_alibaba_tour_info", "search_alibaba_tours"],
+    "visa": ["search_alibaba_visa"],
+    "insurance": ["search_alibaba_insurance"],
+    "faq": ["search_alibaba_faqs", "search_alibaba_faqs_interactive"],
+    "profile": ["search_alibaba_profile"],
+    "magazine": ["search_alibaba_magazine"],
+}
+# همیشه در دسترس: جستجوی عمومی برای سوال‌هایی که تو هیچ حوزه‌ای جا نمی‌شن
+ALWAYS_TOOLS = ["search_alibaba_general"]
+# وقتی چند حوزه با هم پرسیده می‌شه، جستجوی همزمان چند بخش هم لازمه
+MULTI_DOMAIN_TOOLS = ["search_alibaba_sections"]
+
+# پسوندهای جمع و نکره‌ای که بدون نیم‌فاصله به کلمه می‌چسبن (هتلها، پروازی)
+_SUFFIXES = "(?:هایی|های|ها|ی)?"
+
+
+def _keyword_pattern(keywords: list):
+    # فقط کلمه‌ی کامل: "تور" نباید تو "دستور"، "تورم" یا "کنتور" پیدا بشه و "bus" نباید تو "business"
+    alternatives = "|".join(re.escape(normalize_text(k).lower()) for k in keywords)
+    return re.compile(rf"(?<!\w)(?:{alternatives}){_SUFFIXES}(?!\w)")
+
+
+_KEYWORD_PATTERNS = {domain: _keyword_pattern(keywords) for domain, keywords in DOMAIN_KEYWORDS.items()}
+_CITY_PATTERN = _keyword_pattern(list(CITIES) + list(CITY_ALIASES))
+# وقتی اسم وسیله (یا سفر خارجی) اومده، حوزه‌ی ticket لازم نیست
+TRANSPORT_DOMAINS = ("flight", "international", "train", "bus")
+
+
+def classify(text: str) -> list:
+    """
+    حوزه‌های پیام کاربر به ترتیب DOMAIN_KEYWORDS (ممکنه خالی باشه).
+    Domains of a user message, in DOMAIN_KEYWORDS order.
+
+    "ticket" (all three schedule tools) is used for a ticket or a two-city
+    route that names no transport mode, e.g. 'تهران شیراز فردا'.
+    """
+    text = normalize_text(text).lower()
+    domains = [domain for domain, pattern in _KEYWORD_PATTERNS.items() if pattern.search(text)]
+    if any(domain in TRANSPORT_DOMAINS for domain in domains):
+        return [domain for domain in domains if domain != "ticket"]
+    if not domains and len({normalize_city(city) for city in _CITY_PATTERN.findall(text)}) >= 2:
+        return ["ticket"]
+    return domains
+
+
+# پیام -> حوزه‌های مورد انتظار (python -m app.tool_router --check)
+CLASSIFY_CASES = [
+    ("دستور پخت", []),
+    ("نرخ تورم", []),
+    ("کنتور برق", []),
+    ("پرواز business class", ["flight"]),
+    ("تور کیش", ["tour"]),
+    ("تورهای ارزان", ["tour"]),
+    ("هتلهای شیراز", ["hotel"]),
+    ("هتل‌ها", ["hotel"]),
+    ("بلیط اتوبوس vip", ["bus"]),
+    ("قطار تهران مشهد", ["train"]),
+    ("قیمت بلیط تهران شیراز", ["ticket"]),
+    ("بلیط برای مشهد", ["ticket"]),
+    ("بلیتهای ارزان", ["ticket"]),
+    ("تهران به مشهد فردا", ["ticket"]),
+    ("بلیط هواپیما کیش", ["flight"]),
+    ("بلیط تهران استانبول", ["international"]),
+    ("هتل شیراز", ["hotel"]),
+    ("تهران", []),
+]
+
+
+def check() -> bool:
+    ok = True
+    for message, expected in CLASSIFY_CASES:
+        domains = classify(message)
+        if domains == expected:
+            print(f"✅ {message}: {domains}")
+        else:
+            ok = False
+            print(f"❌ {message}: {domains}, expected {expected}")
+    return ok
+
+
+def route(content: str, history: list = None) -> tuple:
+    """
+    انتخاب ابزارهای این نوبت.
+    Pick the tools for this turn.
+
+    Returns (domains, tool_names). tool_names is None when the router is off or
+    nothing matched, meaning every tool is bound. Follow-ups without keywords
+    (e.g. 'فردا چی؟') reuse the domains of the previous user message.
+    """
+    if not TOOL_ROUTER_ENABLED:
+        return [], None
+    domains = classify(content)
+    if not domains and history:
+        previous = [m["content"] for m in history if m.get("role") == "user" and m.get("content") != content]
+        if previous:
+            domains = classify(previous[-1])
+    if not domains:
+        return [], None
+    names = list(ALWAYS_TOOLS)
+    for domain in domains:
+        names += DOMAIN_TOOLS[domain]
+    if len(domains) > 1:
+        names += MULTI_DOMAIN_TOOLS
+    return domains, tuple(sorted(set(names)))
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken یا فایل encoding ممکنه در دسترس نباشه (بدون اینترنت)
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """توکن‌های cl100k_base، یا تقریب 4 کاراکتر برای هر توکن اگه tiktoken در دسترس نباشه."""
+    encoding = _encoding()
+    return len(encoding.encode(text)) if encoding is not None else len(text) // 4
+
+
+def estimate_tool_tokens(tools) -> int:
+    """
+    تعداد تقریبی توکن schema ابزارها که با هر فراخوانی LLM فرستاده می‌شه.
+    Approximate tokens of the tool schemas sent with every LLM call.
+    """
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    return count_tokens(json.dumps([convert_to_openai_tool(tool) for tool in tools], ensure_ascii=False))
+
+
+SAMPLE_MESSAGES = [
+    "بلیط قطار تهران به مشهد برای فردا",
+    "قیمت بلیط تهران شیراز",
+    "بلیط برای مشهد",
+    "پرواز تهران کیش ۱۴۰۳/۰۵/۱۰ چی دارید؟",
+    "هتل خوب تو شیراز برای دو شب",
+    "برای سفر استانبول ویزا و بیمه لازمه؟",
+    "چطور بلیطم رو استرداد کنم؟",
+    "سلام",
+]
+
+
+def report(latency_runs: int = 0, model_name: str = None):
+    """
+    مقایسه‌ی توکن‌های ثابت هر فراخوانی LLM (schema ابزارها + پرامپت سیستم): همه‌ی ابزارها در مقابل زیرمجموعه.
+    Compare the fixed per-call prompt tokens (tool schemas + system prompt) for all tools vs the routed subset.
+
+    Only the tool schemas are built; no Tavily, OpenRouter or MongoDB call is
+    made unless latency_runs > 0, which times real model calls (needs OPENROUTER_API_KEY).
+    """
+    from app.agent import tools, _system_prompt
+    by_name = {tool.name: tool for tool in tools}
+    full = estimate_tool_tokens(tools) + count_tokens(_system_prompt())
+    counter = "tiktoken cl100k_base" if _encoding() is not None else "estimated at 4 characters per token"
+    print(f"All tools: {len(tools)} tools, ~{full} prompt tokens per LLM call (tool schemas + system prompt; {counter})\n")
+    subsets = {}
+    for message in SAMPLE_MESSAGES:
+        domains, names = route(message)
+        subset = tools if names is None else [by_name[name] for name in names]
+        subsets[message] = (names, subset)
+        routed = estimate_tool_tokens(subset) + count_tokens(_system_prompt(names))
+        print(f"{message[:40]:<42} {','.join(domains) or '-':<28} {len(subset):>2} tools ~{routed:>5} tokens "
+              f"({100 * (1 - routed / full):.0f}% less)")
+    if latency_runs > 0:
+        asyncio.run(_latency(subsets, latency_runs, model_name))
+
+
+async def _latency(subsets: dict, runs: int, model_name: str):
+    """زمان پاسخ مدل با همه‌ی ابزارها در مقابل زیرمجموعه (میانه‌ی runs فراخوانی)."""
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from app.agent import tools, get_llm, _system_prompt, openrouter_api_key
+    if not openrouter_api_key:
+        print("\nOPENROUTER_API_KEY is not set; skipping the latency comparison.")
+        return
+    llm = get_llm(model_name)
+    print(f"\nLatency ({model_name}, median of {runs}):")
+    for message, (names, subset) in subsets.items():
+        timings = {}
+        for label, bound, prompt in (("all", tools, _system_prompt()), ("routed", subset, _system_prompt(names))):
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                await llm.bind_tools(bound).ainvoke([SystemMessage(content=prompt), HumanMessage(content=message)])
+                samples.append(time.perf_counter() - started)
+            timings[label] = statistics.median(samples)
+        print(f"{message[:40]:<42} all {timings['all']:.2f}s  routed {timings['routed']:.2f}s "
+              f"({100 * (1 - timings['routed'] / timings['all']):.0f}% less)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword tool router.")
+    parser.add_argument("--report", action="store_true", help="compare tool-schema tokens for sample messages")
+    parser.add_argument("--check", action="store_true", help="classify the regression cases")
+    parser.add_argument("--latency-runs", type=int, default=0, help="also time real model calls (needs OPENROUTER_API_KEY)")
+    parser.add_argument("--model", default="mistralai/mistral-small-3.2-24b-instruct")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if check() else 1)
+    if args.report:
+        report(args.latency_runs, args.model)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# app/url_builder.py
+import re
+import logging
+from datetime import date as gregorian_date, timedelta
+from typing import Optional
+from urllib.parse import urlencode
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ALIBABA_BASE_URL = "https://www.alibaba.ir"
+
+# --- City table ---
+# نام شهر -> (کد IATA / ایستگاه، slug انگلیسی)
+# The three-letter codes are the same ones the site puts in its results URLs,
+# e.g. /flights/THR-AWZ. Train and bus results reuse them for the same city.
+CITIES = {
+    "تهران": ("THR", "tehran"),
+    "مشهد": ("MHD", "mashhad"),
+    "اصفهان": ("IFN", "isfahan"),
+    "شیراز": ("SYZ", "shiraz"),
+    "تبریز": ("TBZ", "tabriz"),
+    "اهواز": ("AWZ", "ahvaz"),
+    "کیش": ("KIH", "kish"),
+    "قشم": ("GSM", "qeshm"),
+    "بندرعباس": ("BND", "bandar-abbas"),
+    "کرمان": ("KER", "kerman"),
+    "کرمانشاه": ("KSH", "kermanshah"),
+    "رشت": ("RAS", "rasht"),
+    "ساری": ("SRY", "sari"),
+    "یزد": ("AZD", "yazd"),
+    "زاهدان": ("ZAH", "zahedan"),
+    "ارومیه": ("OMH", "urmia"),
+    "بوشهر": ("BUZ", "bushehr"),
+    "اردبیل": ("ADU", "ardabil"),
+    "گرگان": ("GBT", "gorgan"),
+    "همدان": ("HDM", "hamedan"),
+    "خرم آباد": ("KHD", "khorramabad"),
+    "سنندج": ("SDG", "sanandaj"),
+    "آبادان": ("ABD", "abadan"),
+    "بیرجند": ("XBJ", "birjand"),
+    "زنجان": ("JWN", "zanjan"),
+    "چابهار": ("ZBR", "chabahar"),
+    "یاسوج": ("YES", "yasuj"),
+    "شهرکرد": ("CQD", "shahrekord"),
+    "ایلام": ("IIL", "ilam"),
+    "بجنورد": ("BJB", "bojnurd"),
+    "دزفول": ("DEF", "dezful"),
+    "عسلویه": ("PGU", "asaluyeh"),
+    "سیرجان": ("SYJ", "sirjan"),
+    "رفسنجان": ("RJN", "rafsanjan"),
+    "نوشهر": ("NSH", "nowshahr"),
+    "رامسر": ("RZR", "ramsar"),
+    "قزوین": ("GZW", "qazvin"),
+    "قم": ("QUM", "qom"),
+    "کاشان": ("KKS", "kashan"),
+    "استانبول": ("IST", "istanbul"),
+    "دبی": ("DXB", "dubai"),
+}
+
+# نام‌های جایگزین رایج -> نام اصلی در جدول
+CITY_ALIASES = {
+    "tehran": "تهران",
+    "mashhad": "مشهد",
+    "isfahan": "اصفهان",
+    "shiraz": "شیراز",
+    "tabriz": "تبریز",
+    "kish": "کیش",
+    "جزیره کیش": "کیش",
+    "جزیره قشم": "قشم",
+    "بندر عباس": "بندرعباس",
+    "خرم‌آباد": "خرم آباد",
+    "خرماباد": "خرم آباد",
+    "دوبی": "دبی",
+}
+
+_PERSIAN_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+_ARABIC_LETTERS = str.maketrans({"ي": "ی", "ك": "ک", "ى": "ی", "ة": "ه", "‌": " "})
+
+
+def normalize_text(text: str) -> str:
+    """
+    یکسان‌سازی متن فارسی: حروف عربی، ارقام فارسی/عربی، نیم‌فاصله و فاصله‌های اضافه.
+    Normalise Persian text: Arabic letters, Persian/Arabic digits, ZWNJ and extra whitespace.
+    """
+    text = (text or "").translate(_PERSIAN_DIGITS).translate(_ARABIC_LETTERS)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_city(city: str) -> str:
+    """برگردوندن نام استاندارد شهر (مثلاً 'شهر تهران' -> 'تهران')."""
+    name = normalize_text(city)
+    name = re.sub(r"^(شهر|فرودگاه|ایستگاه|پایانه)\s+", "", name)
+    return CITY_ALIASES.get(name.lower(), CITY_ALIASES.get(name, name))
+
+
+def city_code(city: str) -> Optional[str]:
+    """کد سه حرفی شهر برای آدرس نتایج، یا None اگه تو جدول نباشه."""
+    entry = CITIES.get(normalize_city(city))
+    return entry[0] if entry else None
+
+
+def city_slug(city: str) -> Optional[str]:
+    """slug انگلیسی شهر برای آدرس نتایج هتل و اقامتگاه، یا None اگه تو جدول نباشه."""
+    entry = CITIES.get(normalize_city(city))
+    return entry[1] if entry else None
+
+
+# --- Jalali dates ---
+
+def gregorian_to_jalali(gy: int, gm: int, gd: int) -> tuple:
+    """تبدیل تاریخ میلادی به شمسی."""
+    g_d_m = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+    gy2 = gy + 1 if gm > 2 else gy
+    days = 355666 + (365 * gy) + ((gy2 + 3) // 4) - ((gy2 + 99) // 100) + ((gy2 + 399) // 400) + gd + g_d_m[gm - 1]
+    jy = -1595 + (33 * (days // 12053))
+    days %= 12053
+    jy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        jy += (days - 1) // 365
+        days = (days - 1) % 365
+    if days < 186:
+        jm = 1 + (days // 31)
+        jd = 1 + (days % 31)
+    else:
+        jm = 7 + ((days - 186) // 30)
+        jd = 1 + ((days - 186) % 30)
+    return jy, jm, jd
+
+
+def jalali_to_gregorian(jy: int, jm: int, jd: int) -> tuple:
+    """تبدیل تاریخ شمسی به میلادی."""
+    jy += 1595
+    days = -355668 + (365 * jy) + ((jy // 33) * 8) + (((jy % 33) + 3) // 4) + jd
+    days += (jm - 1) * 31 if jm < 7 else ((jm - 7) * 30) + 186
+    gy = 400 * (days // 146097)
+    days %= 146097
+    if days > 36524:
+        days -= 1
+        gy += 100 * (days // 36524)
+        days %= 36524
+        if days >= 365:
+            days += 1
+    gy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        gy += (days - 1) // 365
+        days = (days - 1) % 365
+    gd = days + 1
+    leap = (gy % 4 == 0 and gy % 100 != 0) or gy % 400 == 0
+    month_days = [31, 29 if leap else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    gm = 0
+    while gd > month_days[gm]:
+        gd -= month_days[gm]
+        gm += 1
+    return gy, gm + 1, gd
+
+
+_RELATIVE_DAYS = {"امروز": 0, "فردا": 1, "پس فردا": 2, "پسفردا": 2, "today": 0, "tomorrow": 1}
+
+
+def normalize_jalali_date(value: str, today: gregorian_date = None) -> Optional[str]:
+    """
+    تبدیل تاریخ ورودی کاربر به فرمت 'YYYY-MM-DD' شمسی که سایت تو آدرس‌ها استفاده می‌کنه.
+    Normalise a user-supplied date to the Jalali 'YYYY-MM-DD' form used in the site's URLs.
+
+    Accepts Persian/Arabic digits, '/', '-' or '.' separators, two-digit
+    years ('03/5/7'), Gregorian dates ('2024-08-01') and relative words
+    ('امروز', 'فردا'). Returns None if the value cannot be parsed.
+    """
+    text = normalize_text(value).lower()
+    if text in _RELATIVE_DAYS:
+        target = (today or gregorian_date.today()) + timedelta(days=_RELATIVE_DAYS[text])
+        jy, jm, jd = gregorian_to_jalali(target.year, target.month, target.day)
+        return f"{jy:04d}-{jm:02d}-{jd:02d}"
+
+    match = re.fullmatch(r"(\d{2,4})[/\-.](\d{1,2})[/\-.](\d{1,2})", text)
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    if year >= 1900:
+        # تاریخ میلادی
+        try:
+            gregorian_date(year, month, day)
+        except ValueError:
+            return None
+        year, month, day = gregorian_to_jalali(year, month, day)
+    elif year < 100:
+        year += 1400
+    if not (1 <= month <= 12 and 1 <= day <= 31) or (month > 6 and day > 30):
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+# --- Results URL builders ---
+# هر builder اگه نتونه آدرس بسازه (شهر یا تاریخ ناشناخته) None برمی‌گردونه
+# و scraper سراغ پر کردن فرم می‌ره.
+
+def flight_results_url(origin: str, destination: str, date: str, adult: int = 1, child: int = 0, infant: int = 0) -> Optional[str]:
+    """آدرس مستقیم نتایج پرواز داخلی، مثل /flights/THR-AWZ?adult=1&child=0&infant=0&departing=1404-05-14"""
+    src, dst, departing = city_code(origin), city_code(destination), normalize_jalali_date(date)
+    if not (src and dst and departing):
+        return None
+    query = urlencode({"adult": adult, "child": child, "infant": infant, "departing": departing})
+    return f"{ALIBABA_BASE_URL}/flights/{src}-{dst}?{query}"
+
+
+def train_results_url(origin: str, destination: str, date: str, adult: int = 1, child: int = 0, infant: int = 0) -> Optional[str]:
+    """آدرس مستقیم نتایج قطار."""
+    src, dst, departing = city_code(origin), city_code(destination), normalize_jalali_date(date)
+    if not (src and dst and departing):
+        return None
+    query = urlencode({"adult": adult, "child": child, "infant": infant, "departing": departing,
+                       "ticketType": "Family", "isExclusive": "false"})
+    return f"{ALIBABA_BASE_URL}/train/{src}-{dst}?{query}"
+
+
+def bus_results_url(origin: str, destination: str, date: str) -> Optional[str]:
+    """آدرس مستقیم نتایج اتوبوس."""
+    src, dst, departing = city_code(origin), city_code(destination), normalize_jalali_date(date)
+    if not (src and dst and departing):
+        return None
+    return f"{ALIBABA_BASE_URL}/bus/{src}-{dst}?{urlencode({'departing': departing})}"
+
+
+def hotel_results_url(city: str, checkin_date: str, checkout_date: str) -> Optional[str]:
+    """آدرس مستقیم نتایج هتل."""
+    slug, checkin, checkout = city_slug(city), normalize_jalali_date(checkin_date), normalize_jalali_date(checkout_date)
+    if not (slug and checkin and checkout):
+        return None
+    return f"{ALIBABA_BASE_URL}/hotel/iran/{slug}?{urlencode({'checkIn': checkin, 'checkOut': checkout})}"
+
+
+def villa_results_url(city: str, checkin_date: str, checkout_date: str) -> Optional[str]:
+    """آدرس مستقیم نتایج اقامتگاه."""
+    slug, checkin, checkout = city_slug(city), normalize_jalali_date(checkin_date), normalize_jalali_date(checkout_date)
+    if not (slug and checkin and checkout):
+        return None
+    return f"{ALIBABA_BASE_URL}/accommodation/{slug}?{urlencode({'checkIn': checkin, 'checkOut': checkout})}"
+
+
+def tour_results_url(origin: str, destination: str, start_date: str, end_date: str) -> Optional[str]:
+    """آدرس مستقیم نتایج تور."""
+    src, dst = city_code(origin), city_code(destination)
+    departing, returning = normalize_jalali_date(start_date), normalize_jalali_date(end_date)
+    if not (src and dst and departing and returning):
+        return None
+    return f"{ALIBABA_BASE_URL}/tour/{src}-{dst}?{urlencode({'departing': departing, 'returning': returning})}"
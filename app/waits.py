@@ -0,0 +1,101 @@
+# app/waits.py
+import os
+import time
+import logging
+from collections import defaultdict
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- Per-step timeouts (milliseconds) ---
+# مراحل فرم (باز شدن suggestion، تقویم و ...) معمولاً زیر یک ثانیه آماده می‌شن
+STEP_TIMEOUT_MS = int(os.getenv("SCRAPER_STEP_TIMEOUT_MS", "5000"))
+# صفحه‌ی نتایج ممکنه چند ثانیه طول بکشه
+RESULTS_TIMEOUT_MS = int(os.getenv("SCRAPER_RESULTS_TIMEOUT_MS", "30000"))
+# مراحل اختیاری (مثل دکمه‌هایی که شاید وجود نداشته باشن)
+OPTIONAL_STEP_TIMEOUT_MS = int(os.getenv("SCRAPER_OPTIONAL_STEP_TIMEOUT_MS", "1500"))
+
+# Aggregate wait times per (scraper, step): count, total seconds, max seconds, timeouts
+_wait_stats = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0, "timeouts": 0})
+
+
+def get_wait_stats() -> dict:
+    """
+    آمار تجمیعی زمان انتظار هر مرحله (برای تنظیم timeout ها).
+    Aggregated wait times per scraper step, for tuning the timeouts.
+    """
+    return {
+        f"{scraper}.{step}": {**stats, "avg": stats["total"] / stats["count"] if stats["count"] else 0.0}
+        for (scraper, step), stats in _wait_stats.items()
+    }
+
+
+class StepWaits:
+    """
+    انتظار رویدادمحور برای مراحل فرم به جای sleep ثابت.
+    Event-driven waits for scraper form steps instead of fixed sleeps.
+
+    Every wait blocks only until its condition holds (element visible, URL
+    reached, load state) or its per-step timeout expires, and records how
+    long it actually waited.
+    """
+
+    def __init__(self, scraper: str):
+        self.scraper = scraper
+        self.steps = []
+
+    async def _timed(self, step: str, awaitable, required: bool) -> bool:
+        start = time.perf_counter()
+        ok = True
+        try:
+            await awaitable
+        except PlaywrightTimeoutError:
+            ok = False
+            if required:
+                raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.steps.append((step, elapsed, ok))
+            stats = _wait_stats[(self.scraper, step)]
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+            if not ok:
+                stats["timeouts"] += 1
+        return ok
+
+    async def visible(self, step: str, locator, timeout_ms: int = None, required: bool = True) -> bool:
+        """صبر تا اولین المنت locator دیده بشه."""
+        if timeout_ms is None:
+            timeout_ms = STEP_TIMEOUT_MS if required else OPTIONAL_STEP_TIMEOUT_MS
+        return await self._timed(step, locator.first.wait_for(state="visible", timeout=timeout_ms), required)
+
+    async def hidden(self, step: str, locator, timeout_ms: int = None, required: bool = False) -> bool:
+        """صبر تا المنت‌های locator ناپدید بشن (مثلاً بسته شدن dropdown)."""
+        if timeout_ms is None:
+            timeout_ms = STEP_TIMEOUT_MS if required else OPTIONAL_STEP_TIMEOUT_MS
+        return await self._timed(step, locator.first.wait_for(state="hidden", timeout=timeout_ms), required)
+
+    async def url(self, step: str, page, pattern, timeout_ms: int = RESULTS_TIMEOUT_MS, required: bool = True) -> bool:
+        """صبر تا آدرس صفحه با الگو مطابقت کنه (مثلاً رسیدن به صفحه نتایج)."""
+        return await self._timed(step, page.wait_for_url(pattern, timeout=timeout_ms), required)
+
+    async def load_state(self, step: str, page, state: str = "networkidle", timeout_ms: int = None,
+                         required: bool = False) -> bool:
+        """صبر تا صفحه به وضعیت بارگذاری مشخص برسه."""
+        if timeout_ms is None:
+            timeout_ms = STEP_TIMEOUT_MS
+        return await self._timed(step, page.wait_for_load_state(state, timeout=timeout_ms), required)
+
+    def total(self) -> float:
+        return sum(elapsed for _, elapsed, _ in self.steps)
+
+    def report(self) -> str:
+        parts = [f"{step}={elapsed:.2f}s{'' if ok else ' (timeout)'}" for step, elapsed, ok in self.steps]
+        return f"[{self.scraper}] waited {self.total():.2f}s: " + ", ".join(parts)
+
+    def log(self):
+        if self.steps:
+            logger.info(f"⏱️ {self.report()}")
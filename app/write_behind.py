@@ -0,0 +1,177 @@
+# app/write_behind.py
+import os
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from app.message_store import embedded_append_update
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv("./app/.env")
+
+# --- Write-behind configuration ---
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+# وقتی این تعداد پیام تو صف جمع شد، فوراً flush می‌شه
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "100"))
+# حداکثر مدتی که یه پیام تو صف می‌مونه (میلی‌ثانیه)
+WRITE_BEHIND_FLUSH_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "200"))
+
+
+class WriteBehindQueue:
+    """
+    صف write-behind برای ذخیره‌ی پیام‌ها: پیام‌ها تو حافظه جمع و دسته‌ای نوشته می‌شن.
+    Write-behind queue for chat messages: buffered in-process and flushed in batches.
+
+    A flush runs when WRITE_BEHIND_MAX_BATCH messages are queued or after
+    WRITE_BEHIND_FLUSH_INTERVAL_MS, whichever comes first. With the embedded
+    layout a whole batch is one bulk_write with one $push/$each per session.
+    Reads go through read_window / read_all, which add this process's
+    unflushed messages so the owning session always sees its own writes.
+    Reads never take the flush lock: the Mongo read runs on its own and is
+    retried if that session's messages were being flushed meanwhile.
+    Failed batches are kept and retried on the next flush.
+    """
+
+    def __init__(self, store, max_batch: int = WRITE_BEHIND_MAX_BATCH,
+                 flush_interval_ms: int = WRITE_BEHIND_FLUSH_INTERVAL_MS):
+        self.store = store
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending = {}  # session_id -> [{"role", "content"}, ...] (به ترتیب)
+        self._size = 0
+        self._wakeup = None
+        self._lock = None  # فقط flush ها رو سریالی می‌کنه
+        self._inflight = {}  # session_id -> asyncio.Event، برای batch در حال نوشتن اون session
+        self._versions = {}  # session_id -> تعداد دفعاتی که پیام‌هاش وارد flush شدن
+        self._stopping = False
+        self._task = None
+        self.stats = {"enqueued": 0, "flushes": 0, "written": 0, "failures": 0}
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, session_id: str, role: str, content: str):
+        self._ensure_started()
+        self._pending.setdefault(session_id, []).append({"role": role, "content": content})
+        self._size += 1
+        self.stats["enqueued"] += 1
+        if self._size >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush loop error: {e}")
+
+    async def flush(self):
+        """نوشتن همه‌ی پیام‌های صف. Flush every queued message."""
+        if not self._pending or self._lock is None:
+            return
+        async with self._lock:
+            batch, self._pending, self._size = self._pending, {}, 0
+            count = sum(len(messages) for messages in batch.values())
+            for sid in batch:
+                self._inflight[sid] = asyncio.Event()
+                self._versions[sid] = self._versions.get(sid, 0) + 1
+            started = time.perf_counter()
+            try:
+                if self.store.mode == "embedded":
+                    await self.store.sessions.bulk_write(
+                        [UpdateOne({"session_id": sid}, embedded_append_update(sid, messages), upsert=True)
+                         for sid, messages in batch.items()],
+                        ordered=False
+                    )
+                else:
+                    await asyncio.gather(*(self.store.append_many(sid, messages) for sid, messages in batch.items()))
+            except BaseException as e:
+                # پیام‌ها رو به جلوی صف برگردون تا دفعه‌ی بعد دوباره نوشته بشن
+                # (با bulk_write نامرتب بخشی از batch ممکنه نوشته شده باشه؛ تکرارش بهتر از گم شدنه)
+                for sid, messages in batch.items():
+                    self._pending[sid] = messages + self._pending.get(sid, [])
+                self._size += count
+                self.stats["failures"] += 1
+                if isinstance(e, asyncio.CancelledError):
+                    logger.warning(f"Write-behind flush of {count} messages cancelled, requeued.")
+                    raise
+                logger.error(f"Write-behind flush of {count} messages failed, will retry: {e}")
+                return
+            finally:
+                for sid in batch:
+                    self._inflight.pop(sid).set()
+            self.stats["flushes"] += 1
+            self.stats["written"] += count
+            logger.debug(f"💾 Flushed {count} messages for {len(batch)} sessions in {(time.perf_counter() - started) * 1000:.1f}ms.")
+
+    def _unflushed(self, session_id: str) -> list:
+        return list(self._pending.get(session_id, []))
+
+    async def _read_consistent(self, session_id: str, read):
+        """
+        خواندن از Mongo بدون قفل، به همراه پیام‌های صف که قطعاً تو اون خواندن نبودن.
+        Read from Mongo without the flush lock, paired with the queued messages it cannot contain.
+
+        If a batch of this session is being written, the read waits for that
+        batch only (not for other sessions); if one started during the read,
+        the read is repeated. The pending snapshot is taken right after a read
+        with no overlapping flush, so it holds exactly the unwritten messages.
+        """
+        while True:
+            inflight = self._inflight.get(session_id)
+            if inflight is not None:
+                await inflight.wait()
+                continue
+            version = self._versions.get(session_id, 0)
+            result = await read()
+            if self._versions.get(session_id, 0) == version and session_id not in self._inflight:
+                return result, self._unflushed(session_id)
+
+    async def read_window(self, session_id: str, limit: int) -> dict:
+        """پنجره‌ی آخر گفتگو به همراه پیام‌های هنوز نوشته نشده‌ی این session."""
+        if self._lock is None:
+            return await self.store.window(session_id, limit)
+        document, unflushed = await self._read_consistent(session_id, lambda: self.store.window(session_id, limit))
+        if not unflushed:
+            return document
+        document = dict(document)
+        document["messages"] = (document.get("messages", []) + unflushed)[-limit:]
+        document["message_count"] = document.get("message_count", 0) + len(unflushed)
+        document["user_message_count"] = document.get("user_message_count", 0) + sum(1 for m in unflushed if m["role"] == "user")
+        return document
+
+    async def read_all(self, session_id: str) -> list:
+        """کل تاریخچه به همراه پیام‌های هنوز نوشته نشده‌ی این session."""
+        if self._lock is None:
+            return await self.store.all(session_id)
+        messages, unflushed = await self._read_consistent(session_id, lambda: self.store.all(session_id))
+        return messages + unflushed
+
+    async def aclose(self):
+        """
+        flush نهایی موقع خاموش شدن برنامه.
+        Final flush on shutdown: the loop is asked to stop (never cancelled mid-write), then the rest is flushed.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"❗ {self._size} chat messages could not be written on shutdown.")